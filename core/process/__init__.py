@@ -0,0 +1,4 @@
+# __init__.py
+#
+# Shared pipeline modules, imported from the repository root as `core.process.<module>`.
+# Modules with a command line are run from the root too: `python -m core.process.main ...`.
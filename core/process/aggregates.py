@@ -0,0 +1,185 @@
+# aggregates.py
+
+import logging
+import argparse
+
+import psycopg
+from psycopg import sql
+
+from .config import (AGGREGATE_GROUPS, AGGREGATE_VALUES, HISTOGRAM_BINS,
+                    POSTGIS_CONNECTION_STRING, POSTGIS_SCHEMA)
+from .tile_cache import bump_data_version
+
+MAX_IDENTIFIER_LENGTH = 63
+
+
+def aggregate_view_name(table_name, level):
+    """
+    Name of the materialized view aggregating `table_name` per `level` (e.g. "aligned_roofs_by_commune").
+    """
+    suffix = f"_by_{level}"
+    return table_name[:MAX_IDENTIFIER_LENGTH - len(suffix) - len("_key_idx")] + suffix
+
+
+def _value_name(value):
+    return value.lower()
+
+
+def aggregate_query(schema, table_name, group_columns, values, bins=HISTOGRAM_BINS):
+    """
+    Build the single-scan aggregation of a table grouped by `group_columns`.
+
+    Every output row holds, for each level of `group_columns` ({level: column}), the group key as
+    text, the row count, and for each value column its sum, average, minimum, maximum and a
+    histogram of `bins` equal-width buckets. Buckets span the table-wide range of the value, so
+    histograms of different groups are comparable.
+    """
+    table = sql.Identifier(schema, table_name)
+    bounds = []
+    selects = [sql.SQL("{}::text AS {}").format(sql.Identifier("t", column), sql.Identifier(level))
+               for level, column in group_columns.items()]
+    selects.append(sql.SQL("count(*) AS count"))
+    bound_columns = []
+
+    for value in values:
+        name = _value_name(value)
+        column = sql.Identifier("t", value)
+        low, high = sql.Identifier(f"{name}_low"), sql.Identifier(f"{name}_high")
+        bound_columns += [sql.Identifier("b", f"{name}_low"), sql.Identifier("b", f"{name}_high")]
+        # An empty range would make width_bucket fail, so a constant column gets a unit range
+        bounds.append(sql.SQL(
+            "min({v}) AS {low}, CASE WHEN max({v}) > min({v}) THEN max({v}) ELSE min({v}) + 1 END AS {high}"
+        ).format(v=sql.Identifier(value), low=low, high=high))
+        # The maximum falls in bucket bins + 1, counted with the last bucket
+        bucket = sql.SQL("least(width_bucket({v}, b.{low}, b.{high}, {bins}), {bins})").format(
+            v=column, low=low, high=high, bins=sql.Literal(bins))
+        histogram = sql.SQL(", ").join(
+            sql.SQL("count(*) FILTER (WHERE {} = {})").format(bucket, sql.Literal(i)) for i in range(1, bins + 1)
+        )
+        selects += [
+            sql.SQL("sum({v}) AS {n}").format(v=column, n=sql.Identifier(f"{name}_sum")),
+            sql.SQL("avg({v}) AS {n}").format(v=column, n=sql.Identifier(f"{name}_avg")),
+            sql.SQL("min({v}) AS {n}").format(v=column, n=sql.Identifier(f"{name}_min")),
+            sql.SQL("max({v}) AS {n}").format(v=column, n=sql.Identifier(f"{name}_max")),
+            sql.SQL("ARRAY[{}] AS {}").format(histogram, sql.Identifier(f"{name}_histogram")),
+            sql.SQL("b.{} AS {}").format(low, low),
+            sql.SQL("b.{} AS {}").format(high, high),
+        ]
+
+    group_by = [sql.Identifier("t", column) for column in group_columns.values()] + bound_columns
+    return sql.SQL(
+        """
+        WITH b AS (SELECT {bounds} FROM {table})
+        SELECT {selects}
+        FROM {table} t CROSS JOIN b
+        WHERE {not_null}
+        GROUP BY {group_by}
+        """
+    ).format(
+        bounds=sql.SQL(", ").join(bounds) if bounds else sql.SQL("1"),
+        table=table,
+        selects=sql.SQL(", ").join(selects),
+        not_null=sql.SQL(" AND ").join(
+            sql.SQL("{} IS NOT NULL").format(sql.Identifier("t", column)) for column in group_columns.values()),
+        group_by=sql.SQL(", ").join(group_by),
+    )
+
+
+def build_aggregates(cursor, schema, table_name, columns, groups=AGGREGATE_GROUPS, values=AGGREGATE_VALUES,
+                     bins=HISTOGRAM_BINS):
+    """
+    Create the per-level materialized views of a loaded table, with a unique index on their keys.
+
+    Levels are nested in the order of `groups`: the parcel view also carries the commune of each
+    parcel, so it can be filtered by commune. Levels whose column is not in the table are skipped,
+    as are the levels below them.
+
+    Args:
+        cursor: psycopg cursor on the PostGIS database.
+        schema (str): Schema of the table.
+        table_name (str): Table to aggregate (usually the staging table of a load).
+        columns (iterable): Columns of the table.
+        groups (dict): {level: group column}, from the coarsest to the finest level.
+        values (list): Numeric columns to aggregate (missing ones are skipped).
+        bins (int): Number of histogram buckets.
+
+    Returns:
+        list: Levels for which a view was created.
+    """
+    columns = set(columns)
+    values = [value for value in values if value in columns]
+    group_columns = {}
+    levels = []
+    for level, column in groups.items():
+        if column not in columns:
+            logging.info(f"No {column} column in {table_name}: skipping the {level} aggregates.")
+            break
+        group_columns[level] = column
+        view = aggregate_view_name(table_name, level)
+        cursor.execute(sql.SQL("DROP MATERIALIZED VIEW IF EXISTS {}").format(sql.Identifier(schema, view)))
+        cursor.execute(sql.SQL("CREATE MATERIALIZED VIEW {} AS {}").format(
+            sql.Identifier(schema, view), aggregate_query(schema, table_name, group_columns, values, bins=bins)))
+        # Unique keys allow REFRESH MATERIALIZED VIEW CONCURRENTLY
+        cursor.execute(sql.SQL("CREATE UNIQUE INDEX {} ON {} ({})").format(
+            sql.Identifier(view + "_key_idx"), sql.Identifier(schema, view),
+            sql.SQL(", ").join(sql.Identifier(name) for name in group_columns)))
+        levels.append(level)
+    return levels
+
+
+def drop_aggregates(cursor, schema, table_name, groups=AGGREGATE_GROUPS):
+    """
+    Drop the materialized views of a table, which would otherwise block dropping the table.
+    """
+    for level in groups:
+        cursor.execute(sql.SQL("DROP MATERIALIZED VIEW IF EXISTS {}").format(
+            sql.Identifier(schema, aggregate_view_name(table_name, level))))
+
+
+def rename_aggregates(cursor, schema, staging_name, table_name, groups=AGGREGATE_GROUPS):
+    """
+    Give the views (and key indexes) built on a staging table the names of the target table's views.
+    """
+    for level in groups:
+        staging_view, view = aggregate_view_name(staging_name, level), aggregate_view_name(table_name, level)
+        cursor.execute(sql.SQL("ALTER MATERIALIZED VIEW IF EXISTS {} RENAME TO {}").format(
+            sql.Identifier(schema, staging_view), sql.Identifier(view)))
+        cursor.execute(sql.SQL("ALTER INDEX IF EXISTS {} RENAME TO {}").format(
+            sql.Identifier(schema, staging_view + "_key_idx"), sql.Identifier(view + "_key_idx")))
+
+
+def refresh_aggregates(connection_string=POSTGIS_CONNECTION_STRING, table_name="aligned_roofs",
+                       schema=POSTGIS_SCHEMA, groups=AGGREGATE_GROUPS):
+    """
+    Refresh the views of a table updated in place, without blocking readers.
+
+    Loads through `pgload` rebuild the views with the table and do not need this. The table's
+    data version is bumped so cached aggregates are recomputed.
+
+    Returns:
+        list: Levels whose view was refreshed.
+    """
+    refreshed = []
+    with psycopg.connect(connection_string, autocommit=True) as conn:
+        for level in groups:
+            view = aggregate_view_name(table_name, level)
+            if conn.execute("SELECT to_regclass(%s)", (f"{schema}.{view}",)).fetchone()[0] is None:
+                continue
+            conn.execute(sql.SQL("REFRESH MATERIALIZED VIEW CONCURRENTLY {}").format(sql.Identifier(schema, view)))
+            refreshed.append(level)
+            logging.info(f"Refreshed {schema}.{view}.")
+        if refreshed:
+            with conn.cursor() as cursor:
+                bump_data_version(cursor, table_name, schema=schema)
+    return refreshed
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    parser = argparse.ArgumentParser(description="Refresh the aggregate views of a PostGIS table")
+    parser.add_argument("--table", default="aligned_roofs")
+    parser.add_argument("--schema", default=POSTGIS_SCHEMA)
+    args = parser.parse_args()
+
+    refresh_aggregates(table_name=args.table, schema=args.schema)
@@ -6,7 +6,7 @@ import geopandas as gpd
 from shapely.geometry import Polygon, Point
 from shapely.ops import unary_union, nearest_points
 from shapely.affinity import translate
-from config import TARGET_CRS, MIN_AREA_THRESHOLD, MAX_MERGE_DISTANCE, MAX_DISTANCE, MIN_OVERLAP_RATIO, BUFFER_DISTANCE
+from .config import TARGET_CRS, MIN_AREA_THRESHOLD, MAX_MERGE_DISTANCE, MAX_DISTANCE, MIN_OVERLAP_RATIO, BUFFER_DISTANCE
 
 def load_shapefiles(target_path, reference_path, target_crs=TARGET_CRS):
     """
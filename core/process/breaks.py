@@ -0,0 +1,264 @@
+# breaks.py
+
+import math
+import logging
+
+import numpy as np
+from psycopg import sql
+
+from .config import CLASS_BREAK_ATTRIBUTES, CLASS_BREAK_METHODS, NUM_CLASSES, POSTGIS_SCHEMA
+
+BREAKS_TABLE = "class_breaks"
+
+CREATE_BREAKS_TABLE = f"""
+    CREATE TABLE IF NOT EXISTS public.{BREAKS_TABLE} (
+        schema_name TEXT NOT NULL,
+        layer TEXT NOT NULL,
+        attribute TEXT NOT NULL,
+        commune TEXT NOT NULL,
+        method TEXT NOT NULL,
+        num_classes INTEGER NOT NULL,
+        version BIGINT NOT NULL,
+        breaks DOUBLE PRECISION[] NOT NULL,
+        PRIMARY KEY (schema_name, layer, attribute, commune, method)
+    )
+"""
+
+# Scope of the breaks computed over every row, stored in the `commune` column
+GLOBAL_SCOPE = ""
+
+
+class QuantileSketch:
+    """
+    Mergeable streaming quantile sketch with a bounded relative error (DDSketch).
+
+    Values are counted in logarithmic buckets: any quantile is returned within
+    `relative_accuracy` of the exact value, with memory depending on the range of the values
+    rather than their number. Sketches of communes merge into the sketch of their union.
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zero_count = 0
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _add_buckets(self, buckets, values):
+        indexes, counts = np.unique(np.ceil(np.log(values) / self._log_gamma).astype(np.int64), return_counts=True)
+        for index, count in zip(indexes.tolist(), counts.tolist()):
+            buckets[index] = buckets.get(index, 0) + count
+
+    def add(self, values):
+        """
+        Add a batch of values (NaN and infinite values are ignored).
+        """
+        values = np.asarray(values, dtype=float)
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return self
+        self.count += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.zero_count += int((values == 0).sum())
+        if (values > 0).any():
+            self._add_buckets(self.positive, values[values > 0])
+        if (values < 0).any():
+            self._add_buckets(self.negative, -values[values < 0])
+        return self
+
+    def merge(self, other):
+        for buckets, other_buckets in ((self.positive, other.positive), (self.negative, other.negative)):
+            for index, count in other_buckets.items():
+                buckets[index] = buckets.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def points(self):
+        """
+        Return the representative value and count of every bucket, in ascending value order.
+        """
+        scale = 2 / (1 + self.gamma)
+        negative = sorted(self.negative.items(), reverse=True)
+        positive = sorted(self.positive.items())
+        values = ([-scale * self.gamma ** index for index, _ in negative]
+                  + ([0.0] if self.zero_count else [])
+                  + [scale * self.gamma ** index for index, _ in positive])
+        weights = ([count for _, count in negative]
+                   + ([self.zero_count] if self.zero_count else [])
+                   + [count for _, count in positive])
+        return np.clip(np.array(values), self.min, self.max), np.array(weights, dtype=float)
+
+    def quantiles(self, qs):
+        """
+        Return the approximate values at the quantiles `qs` (in [0, 1]).
+        """
+        if self.count == 0:
+            raise ValueError("Cannot compute quantiles of an empty sketch.")
+        values, weights = self.points()
+        ranks = np.asarray(qs, dtype=float) * (self.count - 1)
+        result = values[np.minimum(np.searchsorted(np.cumsum(weights), ranks, side="right"), len(values) - 1)]
+        # The extremes are tracked exactly
+        result = np.where(ranks <= 0, self.min, result)
+        return np.where(ranks >= self.count - 1, self.max, result)
+
+
+def quantile_breaks(sketch, num_classes):
+    """
+    Class edges holding about the same number of values each.
+    """
+    return sketch.quantiles(np.linspace(0, 1, num_classes + 1))
+
+
+def jenks_breaks(sketch, num_classes):
+    """
+    Jenks natural breaks (Fisher's exact optimisation) over the weighted buckets of a sketch.
+
+    Optimising over the buckets instead of the raw values bounds the cost by the number of
+    buckets, a few hundred for values spanning several orders of magnitude.
+    """
+    values, weights = sketch.points()
+    m = len(values)
+    if m <= num_classes:
+        return np.unique(np.concatenate([[sketch.min], values, [sketch.max]]))
+
+    # Weighted sum of squared deviations of every class values[i:j], from prefix sums
+    cw = np.concatenate([[0], np.cumsum(weights)])
+    cwv = np.concatenate([[0], np.cumsum(weights * values)])
+    cwv2 = np.concatenate([[0], np.cumsum(weights * values ** 2)])
+    i, j = np.arange(m + 1)[:, None], np.arange(m + 1)[None, :]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s = cwv[j] - cwv[i]
+        ssd = (cwv2[j] - cwv2[i]) - s * s / (cw[j] - cw[i])
+    ssd = np.where(i < j, np.maximum(ssd, 0), np.inf)
+
+    cost = np.full(m + 1, np.inf)
+    cost[0] = 0
+    starts = np.zeros((num_classes + 1, m + 1), dtype=np.int64)
+    for k in range(1, num_classes + 1):
+        total = cost[:, None] + ssd
+        starts[k] = np.argmin(total, axis=0)
+        cost = total[starts[k], np.arange(m + 1)]
+
+    # Walk back from the last class to the start index of every class
+    edges, end = [], m
+    for k in range(num_classes, 0, -1):
+        end = starts[k, end]
+        edges.append(end)
+    uppers = [values[index - 1] for index in sorted(edges)[1:]]
+    return np.array([sketch.min] + uppers + [sketch.max])
+
+
+def pretty_breaks(sketch, num_classes):
+    """
+    Round class edges (1, 2, 2.5 or 5 times a power of ten) covering the range of the values.
+    """
+    low, high = sketch.min, sketch.max
+    if high <= low:
+        return np.array([low, high])
+    raw = (high - low) / num_classes
+    magnitude = 10 ** math.floor(math.log10(raw))
+    step = next(s * magnitude for s in (1, 2, 2.5, 5, 10) if s * magnitude >= raw)
+    start, stop = math.floor(low / step) * step, math.ceil(high / step) * step
+    return np.round(np.arange(start, stop + step / 2, step), 10)
+
+
+BREAK_METHODS = {
+    "quantile": quantile_breaks,
+    "jenks": jenks_breaks,
+    "pretty": pretty_breaks,
+}
+
+
+def class_breaks(sketch, num_classes=NUM_CLASSES, methods=CLASS_BREAK_METHODS):
+    """
+    Compute the class edges of a sketch with each method.
+
+    Returns:
+        dict: {method: list of num_classes + 1 edges} (pretty breaks may give a few more or fewer).
+    """
+    unknown = set(methods) - set(BREAK_METHODS)
+    if unknown:
+        raise ValueError(f"Unknown class break methods: {sorted(unknown)}")
+    return {method: BREAK_METHODS[method](sketch, num_classes).tolist() for method in methods}
+
+
+def build_sketches(frames, attribute, group_column=None, relative_accuracy=0.01):
+    """
+    Stream DataFrames (e.g. the batches of a file or a query) into per-group and global sketches.
+
+    Returns:
+        tuple: (global sketch, {group: sketch}); the dict is empty without `group_column`.
+    """
+    overall = QuantileSketch(relative_accuracy)
+    groups = {}
+    for frame in frames:
+        if attribute not in frame.columns:
+            raise ValueError(f"Attribute '{attribute}' not found in the dataset.")
+        overall.add(frame[attribute].to_numpy(dtype=float, na_value=np.nan))
+        if group_column is None:
+            continue
+        for group, values in frame.groupby(group_column)[attribute]:
+            sketch = groups.setdefault(str(group), QuantileSketch(relative_accuracy))
+            sketch.add(values.to_numpy(dtype=float, na_value=np.nan))
+    return overall, groups
+
+
+def compute_class_breaks(gdf, attributes=CLASS_BREAK_ATTRIBUTES, group_column=None, num_classes=NUM_CLASSES,
+                         methods=CLASS_BREAK_METHODS):
+    """
+    Compute global and per-group class breaks of the attributes of a dataset.
+
+    Returns:
+        list: (attribute, group or GLOBAL_SCOPE, method, breaks) rows.
+    """
+    if group_column is not None and group_column not in gdf.columns:
+        group_column = None
+    rows = []
+    for attribute in attributes:
+        if attribute not in gdf.columns:
+            logging.info(f"No {attribute} column: skipping its class breaks.")
+            continue
+        overall, groups = build_sketches([gdf], attribute, group_column=group_column)
+        for scope, sketch in [(GLOBAL_SCOPE, overall)] + sorted(groups.items()):
+            if sketch.count == 0:
+                continue
+            for method, breaks in class_breaks(sketch, num_classes, methods).items():
+                rows.append((attribute, scope, method, breaks))
+    return rows
+
+
+def store_class_breaks(cursor, rows, table_name, schema=POSTGIS_SCHEMA, num_classes=NUM_CLASSES):
+    """
+    Replace the stored class breaks of a layer, tagged with its current data version.
+
+    Run in the transaction that bumps the data version, so readers never see breaks of
+    another version of the data.
+
+    Args:
+        cursor: psycopg cursor on the PostGIS database.
+        rows (list): Output of `compute_class_breaks`.
+        table_name (str): Layer the breaks describe.
+        schema (str): Schema of the layer.
+        num_classes (int): Number of classes the breaks were computed for.
+    """
+    cursor.execute(CREATE_BREAKS_TABLE)
+    version = cursor.execute(
+        "SELECT version FROM public.tile_data_version WHERE schema_name = %s AND layer = %s", (schema, table_name)
+    ).fetchone()
+    version = version[0] if version else 0
+    cursor.execute(sql.SQL("DELETE FROM {} WHERE schema_name = %s AND layer = %s").format(
+        sql.Identifier("public", BREAKS_TABLE)), (schema, table_name))
+    with cursor.copy(sql.SQL(
+        "COPY {} (schema_name, layer, attribute, commune, method, num_classes, version, breaks) FROM STDIN"
+    ).format(sql.Identifier("public", BREAKS_TABLE))) as copy:
+        for attribute, scope, method, breaks in rows:
+            copy.write_row((schema, table_name, attribute, scope, method, num_classes, version, breaks))
+    logging.info(f"Stored {len(rows)} class breaks of {schema}.{table_name} (version {version}).")
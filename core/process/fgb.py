@@ -0,0 +1,246 @@
+# fgb.py
+
+import os
+import math
+import struct
+import logging
+import geopandas as gpd
+
+FGB_MAGIC = b"fgb\x03fgb"
+NODE_ITEM = struct.Struct("<4dQ")  # minX, minY, maxX, maxY, offset
+DEFAULT_NODE_SIZE = 16
+
+# Field ids of the FlatGeobuf Header table (see header.fbs)
+HEADER_FEATURES_COUNT = 8
+HEADER_INDEX_NODE_SIZE = 9
+
+
+def hilbert_sort(gdf):
+    """
+    Sort a GeoDataFrame along the Hilbert curve of its geometry bounds.
+
+    Args:
+        gdf (GeoDataFrame): Input GeoDataFrame.
+
+    Returns:
+        GeoDataFrame: The same rows in Hilbert order.
+    """
+    if len(gdf) < 2:
+        return gdf
+    order = gdf.geometry.hilbert_distance(total_bounds=gdf.total_bounds).argsort(kind="stable")
+    return gdf.iloc[order.values]
+
+
+def write_indexed_flatgeobuf(gdf, output_path, columns=None):
+    """
+    Write a GeoDataFrame to FlatGeobuf with a packed Hilbert R-tree and Hilbert-sorted features.
+
+    Args:
+        gdf (GeoDataFrame): Input GeoDataFrame.
+        output_path (str): Path of the .fgb file to write.
+        columns (list): Attributes to keep in the output. All attributes are kept when None.
+
+    Returns:
+        str: Path of the written file.
+    """
+    if columns is not None:
+        missing = [col for col in columns if col not in gdf.columns]
+        if missing:
+            raise ValueError(f"Attributes {missing} not found in the dataset.")
+        gdf = gdf[[col for col in columns if col != gdf.geometry.name] + [gdf.geometry.name]]
+
+    gdf = gdf[gdf.geometry.notnull() & ~gdf.geometry.is_empty]
+    gdf = hilbert_sort(gdf)
+    gdf.to_file(output_path, driver="FlatGeobuf", SPATIAL_INDEX="YES")
+    return output_path
+
+
+def _read_table_field(buf, table_pos, field_id, fmt, default):
+    """
+    Read a scalar field from a flatbuffers table, returning the schema default when absent.
+    """
+    vtable_pos = table_pos - struct.unpack_from("<i", buf, table_pos)[0]
+    vtable_len = struct.unpack_from("<H", buf, vtable_pos)[0]
+    entry = 4 + 2 * field_id
+    if entry >= vtable_len:
+        return default
+    field_offset = struct.unpack_from("<H", buf, vtable_pos + entry)[0]
+    if field_offset == 0:
+        return default
+    return struct.unpack_from(fmt, buf, table_pos + field_offset)[0]
+
+
+def read_flatgeobuf_header(fgb_path):
+    """
+    Read the layout information of a FlatGeobuf file.
+
+    Args:
+        fgb_path (str): Path of the .fgb file.
+
+    Returns:
+        dict: features_count, index_node_size, and the byte offsets of the header, index and features sections.
+    """
+    with open(fgb_path, "rb") as f:
+        magic = f.read(8)
+        if magic[:7] != FGB_MAGIC:
+            raise ValueError(f"{fgb_path} is not a FlatGeobuf file.")
+        header_size = struct.unpack("<I", f.read(4))[0]
+        header = f.read(header_size)
+
+    table_pos = struct.unpack_from("<I", header, 0)[0]
+    features_count = _read_table_field(header, table_pos, HEADER_FEATURES_COUNT, "<Q", 0)
+    index_node_size = _read_table_field(header, table_pos, HEADER_INDEX_NODE_SIZE, "<H", DEFAULT_NODE_SIZE)
+
+    index_offset = 12 + header_size
+    level_bounds = []
+    index_size = 0
+    if index_node_size > 0 and features_count > 0:
+        level_bounds = _level_bounds(features_count, index_node_size)
+        index_size = level_bounds[0][1] * NODE_ITEM.size
+
+    return {
+        "features_count": features_count,
+        "index_node_size": index_node_size,
+        "header_end": index_offset,
+        "index_offset": index_offset,
+        "features_offset": index_offset + index_size,
+        "level_bounds": level_bounds,
+        "file_size": os.path.getsize(fgb_path),
+    }
+
+
+def _level_bounds(num_items, node_size):
+    """
+    Compute the (start, end) node range of every level of a packed R-tree, leaves first.
+    """
+    level_num_nodes = [num_items]
+    num_nodes = num_items
+    n = num_items
+    while True:
+        n = math.ceil(n / node_size)
+        num_nodes += n
+        level_num_nodes.append(n)
+        if n == 1:
+            break
+
+    bounds = []
+    n = num_nodes
+    for size in level_num_nodes:
+        bounds.append((n - size, n))
+        n -= size
+    return bounds
+
+
+def bbox_byte_ranges(fgb_path, bbox):
+    """
+    Walk the packed R-tree of a FlatGeobuf file the way an HTTP client would for a bbox query.
+
+    Args:
+        fgb_path (str): Path of the .fgb file.
+        bbox (tuple): (minx, miny, maxx, maxy) in the layer CRS.
+
+    Returns:
+        tuple: (ranges, feature_offsets, layout) where ranges is the sorted, merged list of
+        (start, end) byte ranges the query reads.
+    """
+    layout = read_flatgeobuf_header(fgb_path)
+    if not layout["level_bounds"]:
+        raise ValueError(f"{fgb_path} has no spatial index.")
+
+    minx, miny, maxx, maxy = bbox
+    node_size = layout["index_node_size"]
+    level_bounds = layout["level_bounds"]
+    num_items = layout["features_count"]
+    num_nodes = level_bounds[0][1]
+    leaf_start = level_bounds[0][0]
+
+    ranges = [(0, layout["header_end"])]
+    feature_offsets = []
+
+    with open(fgb_path, "rb") as f:
+        queue = [(0, len(level_bounds) - 1)]
+        while queue:
+            node_index, level = queue.pop(0)
+            is_leaf = node_index >= num_nodes - num_items
+            end = min(node_index + node_size, level_bounds[level][1])
+
+            start_byte = layout["index_offset"] + node_index * NODE_ITEM.size
+            f.seek(start_byte)
+            data = f.read((end - node_index) * NODE_ITEM.size)
+            ranges.append((start_byte, start_byte + len(data)))
+
+            for i in range(end - node_index):
+                n_minx, n_miny, n_maxx, n_maxy, offset = NODE_ITEM.unpack_from(data, i * NODE_ITEM.size)
+                if n_maxx < minx or n_maxy < miny or n_minx > maxx or n_miny > maxy:
+                    continue
+                if is_leaf:
+                    feature_offsets.append((offset, node_index + i - leaf_start))
+                else:
+                    queue.append((offset, level - 1))
+
+        for offset, _ in feature_offsets:
+            feature_start = layout["features_offset"] + offset
+            f.seek(feature_start)
+            size = struct.unpack("<I", f.read(4))[0]
+            ranges.append((feature_start, feature_start + 4 + size))
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        if start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged, feature_offsets, layout
+
+
+def validate_bbox_byte_ranges(fgb_path, bbox, max_fraction=0.05, min_bytes=64 * 1024):
+    """
+    Check that a bbox query against a FlatGeobuf file only reads the index nodes and features it needs.
+
+    The features reached through the index are compared against GDAL's own bbox read, and the
+    number of bytes read must stay below `max_fraction` of the file size (small files are
+    allowed up to `min_bytes`, where the header and root node dominate).
+
+    Args:
+        fgb_path (str): Path of the .fgb file.
+        bbox (tuple): (minx, miny, maxx, maxy) in the layer CRS.
+        max_fraction (float): Largest acceptable share of the file read by the query.
+        min_bytes (int): Read budget that always passes, regardless of file size.
+
+    Returns:
+        dict: Statistics about the query (bytes read, number of ranges, features matched).
+    """
+    ranges, feature_offsets, layout = bbox_byte_ranges(fgb_path, bbox)
+    bytes_read = sum(end - start for start, end in ranges)
+    fraction = bytes_read / layout["file_size"] if layout["file_size"] else 0.0
+
+    offsets = [offset for offset, _ in feature_offsets]
+    if offsets != sorted(offsets):
+        raise ValueError(f"Features in {fgb_path} are not stored in index order.")
+
+    # GDAL refines the envelope match with an exact intersection test, so it may return fewer
+    # features than the index walk but never more.
+    expected = len(gpd.read_file(fgb_path, bbox=tuple(bbox)))
+    if expected > len(feature_offsets):
+        raise ValueError(
+            f"Index walk of {fgb_path} matched {len(feature_offsets)} features, GDAL returned {expected}."
+        )
+
+    stats = {
+        "bytes_read": bytes_read,
+        "file_size": layout["file_size"],
+        "fraction": fraction,
+        "ranges": len(ranges),
+        "features": len(feature_offsets),
+    }
+    if bytes_read > max(max_fraction * layout["file_size"], min_bytes):
+        raise ValueError(
+            f"Bbox query on {fgb_path} reads {fraction:.1%} of the file (limit {max_fraction:.1%})."
+        )
+
+    logging.info(
+        f"Bbox query on {os.path.basename(fgb_path)} reads {bytes_read} of {layout['file_size']} bytes "
+        f"in {len(ranges)} ranges for {len(feature_offsets)} features."
+    )
+    return stats
@@ -0,0 +1,386 @@
+# footprints.py
+
+import os
+import io
+import csv
+import gzip
+import json
+import time
+import sqlite3
+import logging
+import threading
+import http.client
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+PARSE_BATCH_SIZE = 20000
+
+# Attempts of a tile download, and the first wait between two (doubled after each failure)
+DOWNLOAD_RETRIES = 3
+RETRY_BACKOFF = 1.0
+
+DATASET_LINKS_URL = "https://minedbuildings.z5.web.core.windows.net/global-buildings/dataset-links.csv"
+
+# GeoParquet metadata of the appended files: WKB geometry in OGC:CRS84 (the default CRS)
+GEO_METADATA = {
+    "version": "1.0.0",
+    "primary_column": "geometry",
+    "columns": {"geometry": {"encoding": "WKB", "geometry_types": []}},
+}
+
+
+def _open_lines(url, timeout=60):
+    """
+    Open a line-delimited GeoJSON URL, decompressing gzip on the fly when needed.
+    """
+    response = urllib.request.urlopen(url, timeout=timeout)
+    compressed = url.endswith(".gz") or response.headers.get("Content-Encoding") == "gzip"
+    stream = gzip.GzipFile(fileobj=response) if compressed else response
+    return response, io.TextIOWrapper(stream, encoding="utf-8")
+
+
+def _parse_batch(lines, with_properties):
+    geometries = shapely.from_geojson(np.asarray(lines, dtype=object), on_invalid="ignore")
+    properties = [json.loads(line).get("properties") or {} for line in lines] if with_properties else []
+    return geometries, properties
+
+
+def read_geojson_lines(url, batch_size=PARSE_BATCH_SIZE, with_properties=False, timeout=60):
+    """
+    Stream a (possibly gzipped) line-delimited GeoJSON file into a GeoDataFrame.
+
+    Lines are parsed in batches with `shapely.from_geojson`, so the response is never
+    held in memory as text and no per-feature Python geometry objects are built.
+
+    Args:
+        url (str): http(s) or file URL of the features, one GeoJSON Feature per line.
+        batch_size (int): Lines parsed at a time.
+        with_properties (bool): Also parse the feature properties into columns.
+        timeout (float): Socket timeout in seconds.
+
+    Returns:
+        GeoDataFrame: Features in EPSG:4326 (invalid lines are dropped).
+    """
+    geometries, properties = [], []
+    response, lines = _open_lines(url, timeout=timeout)
+    with response:
+        batch = []
+        for line in lines:
+            line = line.strip()
+            if line:
+                batch.append(line)
+            if len(batch) >= batch_size:
+                parsed, props = _parse_batch(batch, with_properties)
+                geometries.append(parsed)
+                properties += props
+                batch = []
+        if batch:
+            parsed, props = _parse_batch(batch, with_properties)
+            geometries.append(parsed)
+            properties += props
+
+    geometries = np.concatenate(geometries) if geometries else np.empty(0, dtype=object)
+    frame = pd.DataFrame(properties) if with_properties else pd.DataFrame(index=range(len(geometries)))
+    gdf = gpd.GeoDataFrame(frame, geometry=geometries, crs=4326)
+    return gdf[gdf.geometry.notnull()].reset_index(drop=True)
+
+
+class DatasetLinksCatalog:
+    """
+    Local SQLite copy of the global `dataset-links.csv`, indexed by quadkey and location.
+
+    The CSV is downloaded once and revalidated with If-None-Match / If-Modified-Since at most
+    every `max_age` seconds; an unchanged catalogue costs one 304 response, and lookups never
+    parse the CSV again. When the server cannot be reached the cached copy is used.
+    """
+
+    def __init__(self, path="footprint_cache/dataset-links.sqlite", url=DATASET_LINKS_URL, max_age=86400, timeout=60):
+        self.path = path
+        self.url = url
+        self.max_age = max_age
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS links (
+                location TEXT, quadkey TEXT, url TEXT, size TEXT, upload_date TEXT
+            );
+            CREATE INDEX IF NOT EXISTS links_quadkey ON links (quadkey);
+            CREATE INDEX IF NOT EXISTS links_location ON links (location);
+            CREATE TABLE IF NOT EXISTS catalog_state (name TEXT PRIMARY KEY, value TEXT);
+            """
+        )
+
+    def _state(self):
+        return dict(self._conn.execute("SELECT name, value FROM catalog_state").fetchall())
+
+    def _set_state(self, **values):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO catalog_state (name, value) VALUES (?, ?)",
+            [(name, str(value)) for name, value in values.items() if value is not None],
+        )
+
+    def refresh(self, force=False):
+        """
+        Revalidate the catalogue against the server when it is older than `max_age` (or `force`).
+
+        Returns:
+            bool: True when a new catalogue was downloaded.
+        """
+        with self._lock:
+            state = self._state()
+            if not force and "checked_at" in state and time.time() - float(state["checked_at"]) < self.max_age:
+                return False
+
+            request = urllib.request.Request(self.url)
+            if "etag" in state:
+                request.add_header("If-None-Match", state["etag"])
+            if "last_modified" in state:
+                request.add_header("If-Modified-Since", state["last_modified"])
+            try:
+                response = urllib.request.urlopen(request, timeout=self.timeout)
+            except urllib.error.HTTPError as e:
+                if e.code != 304:
+                    raise
+                with self._conn:
+                    self._set_state(checked_at=time.time())
+                logging.info("Dataset links catalogue is up to date.")
+                return False
+            except urllib.error.URLError as e:
+                if "checked_at" not in state:
+                    raise
+                logging.warning(f"Could not revalidate the dataset links catalogue ({e}); using the cached copy.")
+                return False
+
+            with response, self._conn:
+                reader = csv.DictReader(io.TextIOWrapper(response, encoding="utf-8"))
+                self._conn.execute("DELETE FROM links")
+                self._conn.executemany(
+                    "INSERT INTO links (location, quadkey, url, size, upload_date) VALUES (?, ?, ?, ?, ?)",
+                    ((row.get("Location"), row.get("QuadKey"), row.get("Url"), row.get("Size"), row.get("UploadDate"))
+                     for row in reader),
+                )
+                self._set_state(etag=response.headers.get("ETag"), last_modified=response.headers.get("Last-Modified"),
+                                checked_at=time.time())
+            count = self._conn.execute("SELECT COUNT(*) FROM links").fetchone()[0]
+            logging.info(f"Downloaded the dataset links catalogue: {count} entries.")
+            return True
+
+    def links(self, quad_keys):
+        """
+        Resolve quadkeys to URLs (the first entry wins when a quadkey spans several locations).
+
+        Returns:
+            dict: {quadkey: URL} for the quadkeys present in the catalogue.
+        """
+        self.refresh()
+        quad_keys = list(quad_keys)
+        result = {}
+        with self._lock:
+            for start in range(0, len(quad_keys), 500):
+                chunk = quad_keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT quadkey, url FROM links WHERE quadkey IN ({', '.join('?' * len(chunk))}) ORDER BY rowid",
+                    chunk,
+                ).fetchall()
+                for quad_key, url in rows:
+                    result.setdefault(quad_key, url)
+        return result
+
+    def location_links(self, location):
+        """
+        Return the (quadkey, URL) pairs of a location, e.g. "France".
+        """
+        self.refresh()
+        with self._lock:
+            return self._conn.execute(
+                "SELECT quadkey, url FROM links WHERE location = ? ORDER BY rowid", (location,)
+            ).fetchall()
+
+    def close(self):
+        self._conn.close()
+
+
+def _retryable(error):
+    # Client errors (except 429 Too Many Requests) will not succeed on a second attempt
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code >= 500 or error.code == 429
+    return True
+
+
+def download_quadkey(quad_key, url, cache_dir=None, with_properties=False, timeout=60, retries=DOWNLOAD_RETRIES,
+                     backoff=RETRY_BACKOFF):
+    """
+    Return the footprints of one quadkey, from the on-disk cache when present.
+
+    Downloaded tiles are stored as `<cache_dir>/<quad_key>.parquet`; the file is written
+    under a temporary name and renamed, so an interrupted run never leaves a partial tile.
+    Network errors, truncated responses and 5xx/429 statuses are retried up to `retries`
+    attempts in all, waiting `backoff` seconds, then twice as long after each failure.
+
+    Args:
+        quad_key (str): Quadkey of the tile.
+        url (str): URL of the tile's line-delimited GeoJSON.
+        cache_dir (str): Folder of cached tiles (no caching when None).
+        with_properties (bool): Also keep the feature properties.
+        timeout (float): Socket timeout in seconds.
+        retries (int): Attempts before giving up.
+        backoff (float): First wait between two attempts, in seconds.
+
+    Returns:
+        GeoDataFrame: Footprints of the tile.
+    """
+    cache_path = os.path.join(cache_dir, f"{quad_key}.parquet") if cache_dir else None
+    if cache_path and os.path.exists(cache_path):
+        logging.debug(f"Using cached footprints for quadkey {quad_key}.")
+        return gpd.read_parquet(cache_path)
+
+    for attempt in range(1, max(retries, 1) + 1):
+        try:
+            gdf = read_geojson_lines(url, with_properties=with_properties, timeout=timeout)
+            break
+        except (OSError, EOFError, http.client.HTTPException) as e:
+            if attempt == retries or not _retryable(e):
+                raise
+            logging.warning(f"Download of quadkey {quad_key} failed ({e}); retrying ({attempt}/{retries}).")
+            time.sleep(backoff * 2 ** (attempt - 1))
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        gdf.to_parquet(tmp_path)
+        os.replace(tmp_path, cache_path)
+    logging.info(f"Downloaded {len(gdf)} footprints for quadkey {quad_key}.")
+    return gdf
+
+
+class GeoParquetAppender:
+    """
+    Append GeoDataFrames with the same columns to one GeoParquet file, one row group per call.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._writer = None
+
+    def append(self, gdf):
+        table = pa.Table.from_pandas(
+            pd.DataFrame(gdf.drop(columns=gdf.geometry.name)).assign(
+                geometry=shapely.to_wkb(gdf.geometry.values)),
+            preserve_index=False,
+        )
+        if self._writer is None:
+            metadata = dict(table.schema.metadata or {})
+            metadata[b"geo"] = json.dumps(GEO_METADATA).encode("utf-8")
+            self._writer = pq.ParquetWriter(self.path, table.schema.with_metadata(metadata))
+        self._writer.write_table(table.replace_schema_metadata(self._writer.schema.metadata))
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def aoi_clipper(aoi):
+    """
+    Build a `download_footprints` clip function keeping the footprints within an AOI.
+
+    The AOI is prepared once. A tile whose data bounds lie inside the AOI is kept whole and
+    one that misses it is dropped whole; otherwise an STRtree query with the "contains"
+    predicate (AOI contains footprint, i.e. footprint within AOI) selects the rows in bulk.
+
+    Args:
+        aoi (Geometry): Area of interest in EPSG:4326.
+
+    Returns:
+        callable: Function (quadkey, GeoDataFrame) -> GeoDataFrame.
+    """
+    shapely.prepare(aoi)
+
+    def clip(quad_key, gdf):
+        if len(gdf) == 0:
+            return gdf
+        bounds = shapely.box(*gdf.total_bounds)
+        if aoi.contains(bounds):
+            return gdf
+        if not aoi.intersects(bounds):
+            return gdf.iloc[:0]
+        tree = shapely.STRtree(gdf.geometry.values)
+        return gdf.iloc[np.sort(tree.query(aoi, predicate="contains"))]
+
+    return clip
+
+
+def download_footprints(quad_keys, links, output_path=None, cache_dir=None, max_workers=8,
+                        clip=None, with_properties=False, timeout=60, retries=DOWNLOAD_RETRIES,
+                        backoff=RETRY_BACKOFF):
+    """
+    Download the footprints of many quadkeys concurrently.
+
+    Tiles are fetched by a bounded thread pool; each finished tile is optionally clipped and
+    either appended to a GeoParquet file or collected in memory.
+
+    Args:
+        quad_keys (list): Quadkeys to fetch.
+        links (dict): {quadkey: URL}; any URL (e.g. a local HTTP server) can be used.
+        output_path (str): GeoParquet file to append to (the result is returned in memory when None).
+        cache_dir (str): Folder of cached tiles (no caching when None).
+        max_workers (int): Concurrent downloads.
+        clip (callable): Function (quadkey, GeoDataFrame) -> GeoDataFrame applied to every tile.
+        with_properties (bool): Also keep the feature properties.
+        timeout (float): Socket timeout in seconds.
+        retries (int): Attempts of each tile download.
+        backoff (float): First wait between two attempts, in seconds.
+
+    Returns:
+        GeoDataFrame or int: The footprints, or the number written when `output_path` is set.
+    """
+    missing = [quad_key for quad_key in quad_keys if quad_key not in links]
+    if missing:
+        raise ValueError(f"QuadKeys not found in dataset: {missing}")
+
+    parts, written = [], 0
+    appender = GeoParquetAppender(output_path) if output_path else None
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(download_quadkey, quad_key, links[quad_key], cache_dir, with_properties, timeout,
+                                retries, backoff): quad_key
+                for quad_key in quad_keys
+            }
+            for future in as_completed(futures):
+                quad_key = futures[future]
+                gdf = future.result()
+                if clip is not None:
+                    gdf = clip(quad_key, gdf)
+                gdf = gdf.assign(quadkey=quad_key)
+                if appender is not None:
+                    if len(gdf):
+                        appender.append(gdf)
+                    written += len(gdf)
+                else:
+                    parts.append(gdf)
+    finally:
+        if appender is not None:
+            appender.close()
+
+    if appender is not None:
+        logging.info(f"Wrote {written} footprints from {len(quad_keys)} quadkeys to {output_path}.")
+        return written
+    if not parts:
+        return gpd.GeoDataFrame({"quadkey": []}, geometry=[], crs=4326)
+    return gpd.GeoDataFrame(pd.concat(parts, ignore_index=True), crs=4326)
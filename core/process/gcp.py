@@ -0,0 +1,269 @@
+# gcp.py
+
+import logging
+import argparse
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from .align import load_shapefiles
+from .config import MIN_OVERLAP_RATIO, TARGET_CRS
+
+# Hypotheses scored per batch, and points each hypothesis is scored on
+RANSAC_BATCH_SIZE = 64
+RANSAC_SAMPLE_SIZE = 20000
+
+# Default size of the emitted GCP set: the TPS fit solves an (n x n) system
+MAX_GCPS = 300
+
+
+def match_pairs(target_geoms, reference_geoms, min_overlap_ratio=MIN_OVERLAP_RATIO):
+    """
+    Match target polygons to reference polygons that overlap each other strongly.
+
+    Candidates come from one bulk STRtree query; the intersection areas of all candidate pairs
+    are computed in a single vectorized call. A pair is kept when each polygon is the other's
+    best match (highest overlap) and the intersection covers at least `min_overlap_ratio` of both.
+
+    Args:
+        target_geoms (array): Polygons of the data to warp.
+        reference_geoms (array): Polygons of the reference data.
+        min_overlap_ratio (float): Minimum share of both areas covered by the intersection.
+
+    Returns:
+        tuple: (target indexes, reference indexes, overlap ratios) arrays.
+    """
+    target_geoms = np.asarray(target_geoms)
+    reference_geoms = np.asarray(reference_geoms)
+    tree = shapely.STRtree(reference_geoms)
+    t_idx, r_idx = tree.query(target_geoms, predicate="intersects")
+    if len(t_idx) == 0:
+        return np.array([], dtype=int), np.array([], dtype=int), np.array([])
+
+    shared = shapely.area(shapely.intersection(target_geoms[t_idx], reference_geoms[r_idx]))
+    overlap = np.minimum(shared / shapely.area(target_geoms[t_idx]), shared / shapely.area(reference_geoms[r_idx]))
+    pairs = pd.DataFrame({"target": t_idx, "reference": r_idx, "overlap": overlap})
+    pairs = pairs[pairs["overlap"] >= min_overlap_ratio]
+
+    # Mutual best matches only: the best reference of the target and the best target of the reference
+    pairs = pairs.sort_values("overlap", ascending=False)
+    best_reference = pairs.drop_duplicates("target")
+    best_target = pairs.drop_duplicates("reference")
+    pairs = best_reference.loc[best_reference.index.intersection(best_target.index)]
+    return pairs["target"].to_numpy(), pairs["reference"].to_numpy(), pairs["overlap"].to_numpy()
+
+
+def polygon_corners(geoms):
+    """
+    Extreme vertices of each polygon along the two diagonals (min/max of x + y and x - y).
+
+    For roof footprints these are four of their corners, picked the same way on matched
+    polygons, so they correspond without any vertex matching. Holes never hold an extreme vertex,
+    so all the coordinates of (multi)polygons can be used as they are.
+
+    Returns:
+        array: (n, 4, 2) corner coordinates.
+    """
+    coords, index = shapely.get_coordinates(geoms, return_index=True)
+    frame = pd.DataFrame({"index": index, "sum": coords[:, 0] + coords[:, 1], "diff": coords[:, 0] - coords[:, 1]})
+    grouped = frame.groupby("index")
+    rows = np.stack([
+        grouped["sum"].idxmin().to_numpy(),
+        grouped["diff"].idxmax().to_numpy(),
+        grouped["sum"].idxmax().to_numpy(),
+        grouped["diff"].idxmin().to_numpy(),
+    ], axis=1)
+    return coords[rows]
+
+
+def control_point_candidates(target_geoms, reference_geoms, min_overlap_ratio=MIN_OVERLAP_RATIO, corners=True):
+    """
+    Derive GCP candidates from matched polygons: centroid pairs, and corner pairs if requested.
+
+    Returns:
+        DataFrame: source_x, source_y (target data), target_x, target_y (reference), kind, overlap.
+    """
+    target_geoms = np.asarray(target_geoms)
+    reference_geoms = np.asarray(reference_geoms)
+    t_idx, r_idx, overlap = match_pairs(target_geoms, reference_geoms, min_overlap_ratio=min_overlap_ratio)
+    logging.info(f"Matched {len(t_idx)} polygon pairs with an overlap of at least {min_overlap_ratio}.")
+
+    source = [shapely.get_coordinates(shapely.centroid(target_geoms[t_idx]))]
+    target = [shapely.get_coordinates(shapely.centroid(reference_geoms[r_idx]))]
+    kinds = [np.full(len(t_idx), "centroid")]
+    overlaps = [overlap]
+    if corners and len(t_idx):
+        source.append(polygon_corners(target_geoms[t_idx]).reshape(-1, 2))
+        target.append(polygon_corners(reference_geoms[r_idx]).reshape(-1, 2))
+        kinds.append(np.full(4 * len(t_idx), "corner"))
+        overlaps.append(np.repeat(overlap, 4))
+
+    source, target = np.concatenate(source), np.concatenate(target)
+    return pd.DataFrame({
+        "source_x": source[:, 0], "source_y": source[:, 1],
+        "target_x": target[:, 0], "target_y": target[:, 1],
+        "kind": np.concatenate(kinds), "overlap": np.concatenate(overlaps),
+    })
+
+
+def fit_affine(source, target):
+    """
+    Least-squares affine transform: target ~ [x, y, 1] @ coefficients, a (3, 2) matrix.
+    """
+    design = np.hstack([source, np.ones((len(source), 1))])
+    coefficients, *_ = np.linalg.lstsq(design, target, rcond=None)
+    return coefficients
+
+
+def apply_affine(coefficients, points):
+    return points @ coefficients[:2] + coefficients[2]
+
+
+def ransac_affine(source, target, threshold=1.0, iterations=1000, seed=0):
+    """
+    Robust affine fit of point pairs with RANSAC.
+
+    Hypotheses are fitted from random triples, a batch at a time with one batched solve, and
+    scored on a random subset of at most RANSAC_SAMPLE_SIZE pairs, so the cost does not grow
+    with the number of pairs. The best hypothesis is refitted by least squares on all its inliers.
+
+    Args:
+        source (array): (n, 2) coordinates in the data to warp.
+        target (array): (n, 2) matching reference coordinates.
+        threshold (float): Maximum residual of an inlier, in CRS units.
+        iterations (int): Number of hypotheses.
+        seed (int): Random seed.
+
+    Returns:
+        tuple: ((3, 2) affine coefficients, boolean inlier mask).
+    """
+    source = np.asarray(source, dtype=float)
+    target = np.asarray(target, dtype=float)
+    n = len(source)
+    if n < 3:
+        raise ValueError("RANSAC needs at least 3 point pairs.")
+
+    rng = np.random.default_rng(seed)
+    # Centre the coordinates so the batched 3x3 solves stay well conditioned
+    origin = source.mean(axis=0)
+    src, dst = source - origin, target - origin
+    sample = rng.choice(n, size=min(n, RANSAC_SAMPLE_SIZE), replace=False)
+    sample_design = np.hstack([src[sample], np.ones((len(sample), 1))])
+
+    best_score, best = -1, None
+    for start in range(0, iterations, RANSAC_BATCH_SIZE):
+        size = min(RANSAC_BATCH_SIZE, iterations - start)
+        triples = np.stack([rng.choice(n, size=3, replace=False) for _ in range(size)])
+        design = np.concatenate([src[triples], np.ones((size, 3, 1))], axis=2)
+        # Degenerate (collinear) triples have a near-zero determinant
+        valid = np.abs(np.linalg.det(design)) > 1e-9
+        if not valid.any():
+            continue
+        models = np.linalg.solve(design[valid], dst[triples][valid])
+        predicted = np.einsum("sk,mkd->msd", sample_design, models)
+        scores = (np.linalg.norm(predicted - dst[sample], axis=2) <= threshold).sum(axis=1)
+        if scores.max() > best_score:
+            best_score, best = scores.max(), models[np.argmax(scores)]
+
+    if best is None:
+        raise ValueError("All RANSAC samples were degenerate.")
+    inliers = np.linalg.norm(apply_affine(best, src) - dst, axis=1) <= threshold
+    if inliers.sum() >= 3:
+        best = fit_affine(src[inliers], dst[inliers])
+        inliers = np.linalg.norm(apply_affine(best, src) - dst, axis=1) <= threshold
+
+    # Move the model back to absolute coordinates
+    coefficients = best.copy()
+    coefficients[2] = best[2] + origin - origin @ best[:2]
+    return coefficients, inliers
+
+
+def thin_gcps(gcps, cell_size=None, max_gcps=MAX_GCPS):
+    """
+    Keep the GCP with the smallest residual in each grid cell, spreading the set evenly.
+
+    Without `cell_size` the cell is derived from the extent so that about `max_gcps` cells are
+    filled; the cell then grows until at most `max_gcps` GCPs remain.
+
+    Args:
+        gcps (DataFrame): GCPs with source_x, source_y and residual columns.
+        cell_size (float): Starting grid cell size, in CRS units.
+        max_gcps (int): Maximum number of GCPs kept (None only thins by `cell_size`).
+
+    Returns:
+        DataFrame: Thinned GCPs.
+    """
+    points = gcps[["source_x", "source_y"]].to_numpy()
+    if not cell_size:
+        width, height = np.ptp(points, axis=0) if len(points) else (0.0, 0.0)
+        cell_size = max(np.sqrt(width * height / max_gcps) if max_gcps else 0.0, 1.0)
+    ordered = gcps.assign(_x=points[:, 0], _y=points[:, 1]).sort_values("residual")
+    while True:
+        cells = np.floor(ordered[["_x", "_y"]].to_numpy() / cell_size).astype(np.int64)
+        kept = ordered[~pd.DataFrame(cells).duplicated().to_numpy()]
+        if not max_gcps or len(kept) <= max_gcps:
+            return kept.drop(columns=["_x", "_y"]).sort_index()
+        cell_size *= 1.1
+
+
+def extract_gcps(target_gdf, reference_gdf, min_overlap_ratio=MIN_OVERLAP_RATIO, corners=True, threshold=1.0,
+                 iterations=1000, cell_size=None, max_gcps=MAX_GCPS, seed=0):
+    """
+    Derive a GCP set from target/reference polygon correspondences.
+
+    Args:
+        target_gdf (GeoDataFrame): Polygons to warp.
+        reference_gdf (GeoDataFrame): Reference polygons, in the same CRS.
+        min_overlap_ratio (float): Minimum overlap of a matched pair.
+        corners (bool): Add corner pairs to the centroid pairs.
+        threshold (float): RANSAC inlier threshold, in CRS units.
+        iterations (int): RANSAC hypotheses.
+        cell_size (float): Grid cell size used to thin the inliers (None derives it from the extent and `max_gcps`).
+        max_gcps (int): Maximum size of the output set (None, with no `cell_size`, keeps every inlier).
+        seed (int): Random seed.
+
+    Returns:
+        tuple: (GCP DataFrame with residuals to the robust affine fit, (3, 2) affine coefficients).
+    """
+    candidates = control_point_candidates(target_gdf.geometry.values, reference_gdf.geometry.values,
+                                          min_overlap_ratio=min_overlap_ratio, corners=corners)
+    if len(candidates) < 3:
+        raise ValueError(f"Only {len(candidates)} GCP candidates found; check the CRS and overlap ratio.")
+
+    source = candidates[["source_x", "source_y"]].to_numpy()
+    target = candidates[["target_x", "target_y"]].to_numpy()
+    coefficients, inliers = ransac_affine(source, target, threshold=threshold, iterations=iterations, seed=seed)
+    residuals = target - apply_affine(coefficients, source)
+    candidates["residual_x"] = residuals[:, 0]
+    candidates["residual_y"] = residuals[:, 1]
+    candidates["residual"] = np.linalg.norm(residuals, axis=1)
+    logging.info(
+        f"RANSAC kept {inliers.sum()} of {len(candidates)} candidates "
+        f"(RMS residual {np.sqrt((candidates['residual'][inliers] ** 2).mean()):.3f})."
+    )
+
+    gcps = candidates[inliers]
+    if cell_size or max_gcps:
+        gcps = thin_gcps(gcps, cell_size=cell_size, max_gcps=max_gcps)
+    return gcps.reset_index(drop=True), coefficients
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    parser = argparse.ArgumentParser(description="Extract GCPs from target/reference polygon matches")
+    parser.add_argument("target_shapefile", help="Polygons to warp")
+    parser.add_argument("reference_shapefile", help="Reference polygons")
+    parser.add_argument("--output", default="gcps.csv")
+    parser.add_argument("--threshold", type=float, default=1.0, help="RANSAC inlier threshold in metres")
+    parser.add_argument("--cell-size", type=float, help="Keep one GCP per cell of this size (default: from the extent)")
+    parser.add_argument("--max-gcps", type=int, default=MAX_GCPS, help="Maximum number of GCPs written")
+    parser.add_argument("--no-corners", action="store_true", help="Use centroid pairs only")
+    args = parser.parse_args()
+
+    target_gdf, reference_gdf = load_shapefiles(args.target_shapefile, args.reference_shapefile, target_crs=TARGET_CRS)
+    gcps, coefficients = extract_gcps(target_gdf, reference_gdf, corners=not args.no_corners,
+                                      threshold=args.threshold, cell_size=args.cell_size, max_gcps=args.max_gcps)
+    gcps.to_csv(args.output, index=False)
+    logging.info(f"Wrote {len(gcps)} GCPs to {args.output}")
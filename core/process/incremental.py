@@ -0,0 +1,308 @@
+# incremental.py
+
+import os
+import json
+import hashlib
+import sqlite3
+import logging
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+import shapely
+from shapely.geometry import box
+
+from .config import SPLIT_ATTRIBUTE
+from .fgb import write_indexed_flatgeobuf
+from .mvt import (
+    DEFAULT_BUFFER,
+    DEFAULT_EXTENT,
+    build_mbtiles,
+    feature_properties,
+    feature_tile_pairs,
+    read_tile_source,
+    render_tile,
+    tile_bounds,
+    write_tiles,
+)
+
+STATE_FILE = ".build_state.json"
+
+
+def feature_hashes(gdf, columns=None):
+    """
+    Hash every feature (geometry and attributes) to a stable 64-bit value.
+
+    Identical features within a dataset get distinct hashes through their occurrence
+    number, so duplicates are tracked like any other feature.
+
+    Args:
+        gdf (GeoDataFrame): Input GeoDataFrame.
+        columns (list): Attributes included in the hash (all attributes when None).
+
+    Returns:
+        ndarray: uint64 hash per row.
+    """
+    columns = [col for col in (columns or gdf.columns) if col != gdf.geometry.name]
+    frame = pd.DataFrame(gdf[columns]).copy()
+    frame["__wkb"] = shapely.to_wkb(gdf.geometry.values, hex=True)
+    hashes = pd.util.hash_pandas_object(frame, index=False)
+    occurrence = hashes.groupby(hashes).cumcount().astype("uint64")
+    return pd.util.hash_pandas_object(pd.DataFrame({"h": hashes, "n": occurrence}), index=False).values
+
+
+def _init_state(conn):
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS feature_state (
+            commune TEXT, hash INTEGER, minx REAL, miny REAL, maxx REAL, maxy REAL
+        );
+        CREATE INDEX IF NOT EXISTS feature_state_commune ON feature_state (commune);
+        """
+    )
+
+
+def _state_frame(gdf, hashes, attribute):
+    bounds = shapely.bounds(gdf.geometry.values)
+    return pd.DataFrame({
+        "commune": gdf[attribute].astype(str).values,
+        "hash": hashes.astype(np.int64),  # SQLite integers are signed
+        "minx": bounds[:, 0], "miny": bounds[:, 1], "maxx": bounds[:, 2], "maxy": bounds[:, 3],
+    })
+
+
+def save_state(conn, state, communes=None):
+    """
+    Store the per-feature build state in an MBTiles file, replacing the given communes (or everything).
+    """
+    _init_state(conn)
+    if communes is None:
+        conn.execute("DELETE FROM feature_state")
+    else:
+        conn.executemany("DELETE FROM feature_state WHERE commune = ?", [(c,) for c in communes])
+        state = state[state["commune"].isin(communes)]
+    conn.executemany(
+        "INSERT INTO feature_state (commune, hash, minx, miny, maxx, maxy) VALUES (?, ?, ?, ?, ?, ?)",
+        state.itertuples(index=False, name=None),
+    )
+
+
+def load_state(conn):
+    """
+    Read the per-feature build state of an MBTiles file (None when it was not built incrementally).
+    """
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'feature_state'").fetchone()
+    if not exists:
+        return None
+    return pd.read_sql_query("SELECT commune, hash, minx, miny, maxx, maxy FROM feature_state", conn)
+
+
+def diff_state(old_state, new_state):
+    """
+    Compare two build states.
+
+    Returns:
+        tuple: (changed communes, removed rows, added rows).
+    """
+    merged = old_state.merge(new_state, on=["commune", "hash"], how="outer", indicator=True, suffixes=("_old", ""))
+    removed = merged[merged["_merge"] == "left_only"]
+    added = merged[merged["_merge"] == "right_only"]
+    removed = removed[["commune", "hash", "minx_old", "miny_old", "maxx_old", "maxy_old"]]
+    removed.columns = ["commune", "hash", "minx", "miny", "maxx", "maxy"]
+    added = added[["commune", "hash", "minx", "miny", "maxx", "maxy"]]
+    changed = sorted(set(removed["commune"]) | set(added["commune"]))
+    return changed, removed, added
+
+
+def affected_tiles(bounds, min_zoom, max_zoom, buffer_ratio=DEFAULT_BUFFER / DEFAULT_EXTENT):
+    """
+    Compute the XYZ tile keys touched by a set of bounding boxes at every zoom.
+
+    Args:
+        bounds (ndarray): (N, 4) array of EPSG:3857 bounds.
+        min_zoom (int): Minimum zoom level.
+        max_zoom (int): Maximum zoom level.
+        buffer_ratio (float): Tile buffer as a fraction of the tile size.
+
+    Returns:
+        dict: {zoom: sorted list of (x, y)}.
+    """
+    tiles = {}
+    for z in range(min_zoom, max_zoom + 1):
+        if len(bounds) == 0:
+            tiles[z] = []
+            continue
+        _, xs, ys = feature_tile_pairs(bounds, z, buffer_ratio)
+        keys = np.unique(np.column_stack((xs, ys)), axis=0)
+        tiles[z] = [(int(x), int(y)) for x, y in keys]
+    return tiles
+
+
+def _metadata(conn):
+    return dict(conn.execute("SELECT name, value FROM metadata").fetchall())
+
+
+def update_mbtiles(input_path, output_mbtiles, attribute=SPLIT_ATTRIBUTE, min_zoom=0, max_zoom=14,
+                   layer_name=None, columns=None, extent=DEFAULT_EXTENT, buffer=DEFAULT_BUFFER,
+                   simplification=1.0, max_workers=None):
+    """
+    Bring an MBTiles file up to date with its source, regenerating only the tiles of changed communes.
+
+    The first build (or a build without stored state) is a full build that records a hash and
+    the bounds of every feature. Later runs diff the hashes per commune, collect the tiles touched
+    by removed and added features at every zoom, and re-render and upsert only those tiles.
+
+    Args:
+        input_path (str): FlatGeobuf (.fgb) or GeoParquet (.parquet) input.
+        output_mbtiles (str): MBTiles file to create or update.
+        attribute (str): Commune attribute used to group changes.
+        min_zoom, max_zoom (int): Zoom range used for a full build.
+        layer_name (str): MVT layer name (defaults to the input file name).
+        columns (list): Attributes to keep (when None, those of the last build; other columns force a full build).
+        extent (int): Tile extent.
+        buffer (int): Clip buffer in tile units.
+        simplification (float): Simplification tolerance in tile units.
+        max_workers (int): Worker processes for a full build.
+
+    Returns:
+        dict: Changed communes and the number of tiles written and deleted.
+    """
+    old_state, options = None, None
+    if os.path.exists(output_mbtiles):
+        with closing(sqlite3.connect(output_mbtiles)) as conn, conn:
+            old_state = load_state(conn)
+            if old_state is not None:
+                options = json.loads(_metadata(conn).get("incremental_options", "{}"))
+
+    # Hashes and tiles must both use the columns of the stored build
+    if old_state is not None:
+        stored = options.get("columns")
+        if not options:
+            old_state = None
+        elif columns is None:
+            columns = stored
+        elif stored is None or sorted(columns) != sorted(stored):
+            logging.info(f"Columns differ from the last build of {output_mbtiles}; running a full build.")
+            old_state = None
+
+    gdf = read_tile_source(input_path, columns=None if columns is None else sorted(set(columns) | {attribute}))
+    if attribute not in gdf.columns:
+        raise ValueError(f"Attribute '{attribute}' not found in the dataset.")
+    gdf = gdf.reset_index(drop=True)
+    hashes = feature_hashes(gdf, columns)
+    new_state = _state_frame(gdf, hashes, attribute)
+
+    if old_state is None:
+        logging.info(f"No usable build state in {output_mbtiles}; running a full build.")
+        layer_name = layer_name or os.path.splitext(os.path.basename(input_path))[0]
+        stats = build_mbtiles(input_path, output_mbtiles, min_zoom=min_zoom, max_zoom=max_zoom,
+                              layer_name=layer_name, columns=columns, extent=extent, buffer=buffer,
+                              simplification=simplification, max_workers=max_workers, gdf=gdf, feature_ids=hashes)
+        options = {"layer_name": layer_name, "columns": columns, "extent": extent, "buffer": buffer,
+                   "simplification": simplification, "min_zoom": min_zoom, "max_zoom": max_zoom}
+        with closing(sqlite3.connect(output_mbtiles)) as conn, conn:
+            save_state(conn, new_state)
+            conn.execute("INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)",
+                         ("incremental_options", json.dumps(options)))
+        written = sum(zoom_stats["tiles"] for zoom_stats in stats.values())
+        return {"changed": sorted(new_state["commune"].unique()), "written": written, "deleted": 0}
+
+    changed, removed, added = diff_state(old_state, new_state)
+    if not changed:
+        logging.info("No feature changed since the last build.")
+        return {"changed": [], "written": 0, "deleted": 0}
+    logging.info(f"{len(changed)} communes changed: {len(removed)} features removed, {len(added)} added.")
+
+    dirty_bounds = pd.concat([removed, added])[["minx", "miny", "maxx", "maxy"]].to_numpy()
+    dirty = affected_tiles(dirty_bounds, options["min_zoom"], options["max_zoom"],
+                           options["buffer"] / options["extent"])
+
+    geometries = gdf.geometry.values
+    tree = shapely.STRtree(geometries)
+    properties = feature_properties(gdf, options["columns"])
+    pad_ratio = options["buffer"] / options["extent"]
+
+    written, deleted = 0, 0
+    with closing(sqlite3.connect(output_mbtiles)) as conn, conn:
+        for z, keys in dirty.items():
+            n = 1 << z
+            tiles = []
+            for x, y in keys:
+                minx, miny, maxx, maxy = tile_bounds(z, x, y)
+                pad = (maxx - minx) * pad_ratio
+                candidates = np.sort(tree.query(box(minx - pad, miny - pad, maxx + pad, maxy + pad)))
+                data = None
+                if len(candidates):
+                    data = render_tile(geometries[candidates], [properties[i] for i in candidates],
+                                       hashes[candidates], options["layer_name"], z, x, y, options)
+                if data is None:
+                    conn.execute("DELETE FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                                 (z, x, n - 1 - y))
+                    deleted += 1
+                else:
+                    tiles.append((x, y, data))
+            write_tiles(conn, z, tiles)
+            written += len(tiles)
+        save_state(conn, new_state, communes=changed)
+
+    logging.info(f"Updated {written} tiles and removed {deleted} empty tiles in {output_mbtiles}.")
+    return {"changed": changed, "written": written, "deleted": deleted}
+
+
+def commune_digests(gdf, attribute=SPLIT_ATTRIBUTE, columns=None):
+    """
+    Compute one digest per commune from its feature hashes.
+
+    Returns:
+        dict: {commune: hex digest}.
+    """
+    hashes = pd.Series(feature_hashes(gdf, columns), index=gdf.index)
+    digests = {}
+    for value, group in hashes.groupby(gdf[attribute].astype(str)):
+        digests[value] = hashlib.sha1(np.sort(group.values).tobytes()).hexdigest()
+    return digests
+
+
+def write_changed_communes(gdf, output_folder, attribute=SPLIT_ATTRIBUTE, columns=None):
+    """
+    Write per-commune FlatGeobuf files, skipping communes whose features did not change.
+
+    Digests of the last written communes are kept in `output_folder/.build_state.json`;
+    files of communes that disappeared from the data are removed.
+
+    Args:
+        gdf (GeoDataFrame): Input GeoDataFrame.
+        output_folder (str): Folder holding the per-commune files.
+        attribute (str): Commune attribute.
+        columns (list): Attributes to keep in each output (all attributes when None).
+
+    Returns:
+        tuple: (paths of all commune files, list of communes rewritten).
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    state_path = os.path.join(output_folder, STATE_FILE)
+    old_digests = {}
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            old_digests = json.load(f)
+
+    digests = commune_digests(gdf, attribute, columns)
+    fgb_paths, rewritten = [], []
+    for value, subset in gdf.groupby(gdf[attribute].astype(str)):
+        fgb_path = os.path.join(output_folder, f"{value}.fgb")
+        fgb_paths.append(fgb_path)
+        if old_digests.get(value) == digests[value] and os.path.exists(fgb_path):
+            continue
+        write_indexed_flatgeobuf(subset, fgb_path, columns=columns)
+        rewritten.append(value)
+
+    for value in set(old_digests) - set(digests):
+        stale_path = os.path.join(output_folder, f"{value}.fgb")
+        if os.path.exists(stale_path):
+            os.remove(stale_path)
+
+    with open(state_path, "w") as f:
+        json.dump(digests, f, indent=4)
+
+    logging.info(f"Rewrote {len(rewritten)} of {len(digests)} commune files in {output_folder}.")
+    return fgb_paths, rewritten
@@ -4,10 +4,11 @@ import argparse
 import os
 import geopandas as gpd
 import logging
-from align import load_shapefiles, simplify_reference_polygons, align_target_to_reference_inside
-from split import split_and_save, upload_to_postgis
-from utils import configure_logging, check_dependencies
-from config import (
+from .align import load_shapefiles, simplify_reference_polygons, align_target_to_reference_inside
+from .split import split_and_save, upload_to_postgis
+from .utils import configure_logging, check_dependencies
+from .progress import ProgressReporter
+from .config import (
     TARGET_CRS,
     MIN_AREA_THRESHOLD,
     MAX_MERGE_DISTANCE,
@@ -23,22 +24,27 @@ def main(target_path, reference_path):
     """
     configure_logging()
     check_dependencies()
+    progress = ProgressReporter()
 
     # Step 1: Load shapefiles
     logging.info("Loading shapefiles...")
+    progress.stage("load")
     target_gdf, reference_gdf = load_shapefiles(target_path, reference_path, target_crs=TARGET_CRS)
 
     # Step 2: Simplify reference polygons (combines merging and simplification)
     logging.info("Simplifying reference polygons...")
+    progress.stage("simplify")
     reference_gdf = simplify_reference_polygons(reference_gdf, max_merge_distance=MAX_MERGE_DISTANCE)
 
     # Step 3: Align target polygons to reference polygons
     logging.info("Aligning target polygons...")
+    progress.stage("align")
     reference_polygons = list(reference_gdf.geometry)
     aligned_results = align_target_to_reference_inside(target_gdf, reference_polygons)
 
     # Step 4: Save aligned results
     logging.info("Saving aligned results...")
+    progress.stage("split")
     aligned_gdf = gpd.GeoDataFrame(aligned_results, crs=target_gdf.crs)
 
     # Use the attribute defined in config.py for splitting
@@ -46,7 +52,9 @@ def main(target_path, reference_path):
 
     # Step 5: Upload to PostGIS
     logging.info("Uploading data to PostGIS...")
+    progress.stage("upload")
     upload_to_postgis(aligned_gdf, table_name="aligned_roofs", schema=POSTGIS_SCHEMA)
+    progress.done(features=len(aligned_gdf))
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Shapefile Alignment and Splitting Tool")
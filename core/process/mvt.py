@@ -0,0 +1,507 @@
+# mvt.py
+
+import os
+import gzip
+import json
+import math
+import sqlite3
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import shapely
+import geopandas as gpd
+
+WEB_MERCATOR_CRS = "EPSG:3857"
+WORLD_HALF = 20037508.342789244  # Half the width of the EPSG:3857 world square in meters
+DEFAULT_EXTENT = 4096
+DEFAULT_BUFFER = 64
+
+# MVT command ids and geometry types (vector tile spec 2.1)
+CMD_MOVE_TO = 1
+CMD_LINE_TO = 2
+CMD_CLOSE_PATH = 7
+GEOM_POINT = 1
+GEOM_LINESTRING = 2
+GEOM_POLYGON = 3
+
+
+# --- Protobuf encoding -----------------------------------------------------
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def _field(number, wire_type, payload):
+    key = _varint((number << 3) | wire_type)
+    if wire_type == 0:
+        return key + _varint(payload)
+    if wire_type == 1:
+        return key + payload
+    return key + _varint(len(payload)) + payload
+
+
+def _packed(number, values):
+    return _field(number, 2, b"".join(_varint(v) for v in values))
+
+
+def _encode_value(value):
+    """
+    Encode an attribute value as an MVT Value message.
+    """
+    if isinstance(value, (bool, np.bool_)):
+        return _field(7, 0, int(value))
+    if isinstance(value, (int, np.integer)):
+        return _field(6, 0, _zigzag(int(value)))
+    if isinstance(value, (float, np.floating)):
+        return _field(3, 1, np.float64(value).tobytes())
+    return _field(1, 2, str(value).encode("utf-8"))
+
+
+def _command(command_id, count):
+    return (command_id & 0x7) | (count << 3)
+
+
+def _ring_commands(coords, cursor, exterior):
+    """
+    Encode one closed ring, oriented for the y-down tile grid (exterior rings have positive area).
+    """
+    coords = coords[:-1]
+    keep = np.ones(len(coords), dtype=bool)
+    keep[1:] = np.any(coords[1:] != coords[:-1], axis=1)
+    coords = coords[keep]
+    if len(coords) > 1 and np.array_equal(coords[0], coords[-1]):
+        coords = coords[:-1]
+    if len(coords) < 3:
+        return [], cursor
+
+    x, y = coords[:, 0], coords[:, 1]
+    area = np.sum(x * np.roll(y, -1) - np.roll(x, -1) * y)
+    if (area > 0) != exterior:
+        coords = coords[::-1]
+
+    deltas = np.diff(np.vstack([cursor, coords]), axis=0)
+    zigzag = (deltas << 1) ^ (deltas >> 63)
+    commands = [_command(CMD_MOVE_TO, 1), *zigzag[0].tolist(), _command(CMD_LINE_TO, len(coords) - 1)]
+    commands.extend(zigzag[1:].ravel().tolist())
+    commands.append(_command(CMD_CLOSE_PATH, 1))
+    return commands, coords[-1]
+
+
+def _line_commands(coords, cursor):
+    keep = np.ones(len(coords), dtype=bool)
+    keep[1:] = np.any(coords[1:] != coords[:-1], axis=1)
+    coords = coords[keep]
+    if len(coords) < 2:
+        return [], cursor
+    deltas = np.diff(np.vstack([cursor, coords]), axis=0)
+    zigzag = (deltas << 1) ^ (deltas >> 63)
+    commands = [_command(CMD_MOVE_TO, 1), *zigzag[0].tolist(), _command(CMD_LINE_TO, len(coords) - 1)]
+    commands.extend(zigzag[1:].ravel().tolist())
+    return commands, coords[-1]
+
+
+def encode_geometry(geom):
+    """
+    Encode a geometry already expressed in integer tile coordinates as MVT commands.
+
+    Args:
+        geom (shapely.Geometry): Point, line or polygon geometry (single or multi part).
+
+    Returns:
+        tuple: (geometry type, list of command integers). The list is empty when nothing is left to draw.
+    """
+    cursor = np.zeros(2, dtype=np.int64)
+    commands = []
+    parts = shapely.get_parts(geom)
+    geom_type = shapely.get_type_id(parts[0]) if len(parts) else -1
+
+    if geom_type == 0:  # Point
+        coords = shapely.get_coordinates(parts).astype(np.int64)
+        deltas = np.diff(np.vstack([cursor, coords]), axis=0)
+        zigzag = (deltas << 1) ^ (deltas >> 63)
+        return GEOM_POINT, [_command(CMD_MOVE_TO, len(coords)), *zigzag.ravel().tolist()]
+
+    if geom_type in (1, 2):  # LineString, LinearRing
+        for part in parts:
+            part_commands, cursor = _line_commands(shapely.get_coordinates(part).astype(np.int64), cursor)
+            commands.extend(part_commands)
+        return GEOM_LINESTRING, commands
+
+    if geom_type == 3:  # Polygon
+        for part in parts:
+            ring_commands, cursor = _ring_commands(
+                shapely.get_coordinates(part.exterior).astype(np.int64), cursor, exterior=True
+            )
+            if not ring_commands:
+                continue
+            commands.extend(ring_commands)
+            for interior in part.interiors:
+                ring_commands, cursor = _ring_commands(
+                    shapely.get_coordinates(interior).astype(np.int64), cursor, exterior=False
+                )
+                commands.extend(ring_commands)
+        return GEOM_POLYGON, commands
+
+    return None, []
+
+
+def encode_layer(name, geometries, properties, feature_ids=None, extent=DEFAULT_EXTENT):
+    """
+    Encode one MVT layer.
+
+    Args:
+        name (str): Layer name.
+        geometries (array): Geometries in integer tile coordinates.
+        properties (list): One dict of attributes per geometry.
+        feature_ids (array): Optional unsigned feature ids.
+        extent (int): Tile extent.
+
+    Returns:
+        bytes: The encoded Layer message, or b"" when no feature survived encoding.
+    """
+    keys, values = {}, {}
+    features = []
+    for i, geom in enumerate(geometries):
+        geom_type, commands = encode_geometry(geom)
+        if not commands:
+            continue
+
+        tags = []
+        for key, value in properties[i].items():
+            if value is None or (isinstance(value, float) and math.isnan(value)):
+                continue
+            key_index = keys.setdefault(key, len(keys))
+            value_key = (type(value).__name__, value)
+            value_index = values.setdefault(value_key, len(values))
+            tags.extend((key_index, value_index))
+
+        feature = b""
+        if feature_ids is not None:
+            feature += _field(1, 0, int(feature_ids[i]))
+        if tags:
+            feature += _packed(2, tags)
+        feature += _field(3, 0, geom_type) + _packed(4, commands)
+        features.append(feature)
+
+    if not features:
+        return b""
+
+    layer = _field(15, 0, 2) + _field(1, 2, name.encode("utf-8"))
+    layer += b"".join(_field(2, 2, feature) for feature in features)
+    layer += b"".join(_field(3, 2, key.encode("utf-8")) for key in keys)
+    layer += b"".join(_field(4, 2, _encode_value(value)) for _, value in values)
+    layer += _field(5, 0, extent)
+    return _field(3, 2, layer)
+
+
+# --- Tiling ------------------------------------------------------------------
+
+def tile_bounds(z, x, y):
+    """
+    Return the EPSG:3857 bounds (minx, miny, maxx, maxy) of an XYZ tile.
+    """
+    size = 2 * WORLD_HALF / (1 << z)
+    minx = -WORLD_HALF + x * size
+    maxy = WORLD_HALF - y * size
+    return minx, maxy - size, minx + size, maxy
+
+
+def tile_ranges(bounds, z, buffer_ratio=0.0):
+    """
+    Compute, for every bounding box, the range of tiles it touches at zoom `z`.
+
+    Args:
+        bounds (ndarray): (N, 4) array of EPSG:3857 bounds.
+        z (int): Zoom level.
+        buffer_ratio (float): Tile buffer as a fraction of the tile size.
+
+    Returns:
+        tuple: (x0, y0, x1, y1) integer arrays, inclusive.
+    """
+    n = 1 << z
+    size = 2 * WORLD_HALF / n
+    pad = buffer_ratio * size
+    x0 = np.floor((bounds[:, 0] - pad + WORLD_HALF) / size)
+    x1 = np.floor((bounds[:, 2] + pad + WORLD_HALF) / size)
+    y0 = np.floor((WORLD_HALF - bounds[:, 3] - pad) / size)
+    y1 = np.floor((WORLD_HALF - bounds[:, 1] + pad) / size)
+    return tuple(np.clip(a, 0, n - 1).astype(np.int64) for a in (x0, y0, x1, y1))
+
+
+def feature_tile_pairs(bounds, z, buffer_ratio=0.0):
+    """
+    Expand every feature into the (feature index, x, y) tiles it touches at zoom `z`.
+
+    Returns:
+        tuple: (feature indices, x, y) integer arrays sorted by tile then feature.
+    """
+    x0, y0, x1, y1 = tile_ranges(bounds, z, buffer_ratio)
+    widths = x1 - x0 + 1
+    counts = widths * (y1 - y0 + 1)
+    features = np.repeat(np.arange(len(bounds)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    xs = np.repeat(x0, counts) + offsets % np.repeat(widths, counts)
+    ys = np.repeat(y0, counts) + offsets // np.repeat(widths, counts)
+    order = np.lexsort((features, ys, xs))
+    return features[order], xs[order], ys[order]
+
+
+def to_tile_coordinates(geometries, z, x, y, extent=DEFAULT_EXTENT, buffer=DEFAULT_BUFFER, simplification=0.0):
+    """
+    Clip EPSG:3857 geometries to a buffered tile and quantize them to the integer tile grid.
+
+    Args:
+        geometries (array): Geometries in EPSG:3857.
+        z, x, y (int): Tile address.
+        extent (int): Tile extent.
+        buffer (int): Clip buffer in tile units.
+        simplification (float): Simplification tolerance in tile units (0 disables it).
+
+    Returns:
+        array: Quantized geometries in tile coordinates (empty where nothing is left).
+    """
+    minx, miny, maxx, maxy = tile_bounds(z, x, y)
+    scale = extent / (maxx - minx)
+    pad = buffer / scale
+
+    clipped = shapely.clip_by_rect(geometries, minx - pad, miny - pad, maxx + pad, maxy + pad)
+
+    def project(coords):
+        return np.column_stack(((coords[:, 0] - minx) * scale, (maxy - coords[:, 1]) * scale))
+
+    tiled = shapely.transform(clipped, project)
+    if simplification > 0:
+        tiled = shapely.simplify(tiled, simplification, preserve_topology=True)
+    return shapely.set_precision(tiled, 1.0)
+
+
+# --- Pyramid building ----------------------------------------------------------
+
+_WORKER = {}
+
+
+def _init_worker(wkb, properties, feature_ids, layer_name, options):
+    geometries = shapely.from_wkb(wkb)
+    _WORKER.update(
+        geometries=geometries,
+        bounds=shapely.bounds(geometries),
+        properties=properties,
+        feature_ids=feature_ids,
+        layer_name=layer_name,
+        options=options,
+    )
+
+
+def render_tile(geometries, properties, feature_ids, layer_name, z, x, y, options):
+    """
+    Render one tile from the candidate features that touch it.
+
+    Returns:
+        bytes: Gzip-compressed MVT bytes, or None when the tile is empty.
+    """
+    tiled = to_tile_coordinates(
+        geometries, z, x, y,
+        extent=options["extent"],
+        buffer=options["buffer"],
+        simplification=options["simplification"],
+    )
+    keep = ~shapely.is_empty(tiled) & ~shapely.is_missing(tiled)
+    if not keep.any():
+        return None
+
+    index = np.flatnonzero(keep)
+    layer = encode_layer(
+        layer_name,
+        tiled[index],
+        [properties[i] for i in index],
+        feature_ids=None if feature_ids is None else feature_ids[index],
+        extent=options["extent"],
+    )
+    if not layer:
+        return None
+    return gzip.compress(layer, mtime=0)
+
+
+def _render_zoom_shard(z, shard, n_shards):
+    geometries = _WORKER["geometries"]
+    properties = _WORKER["properties"]
+    feature_ids = _WORKER["feature_ids"]
+    options = _WORKER["options"]
+
+    features, xs, ys = feature_tile_pairs(_WORKER["bounds"], z, options["buffer"] / options["extent"])
+    selected = (xs + ys) % n_shards == shard
+    features, xs, ys = features[selected], xs[selected], ys[selected]
+    if len(features) == 0:
+        return z, []
+
+    starts = np.flatnonzero(np.r_[True, (xs[1:] != xs[:-1]) | (ys[1:] != ys[:-1])])
+    ends = np.r_[starts[1:], len(features)]
+
+    tiles = []
+    for start, end in zip(starts, ends):
+        members = features[start:end]
+        data = render_tile(
+            geometries[members],
+            [properties[i] for i in members],
+            None if feature_ids is None else feature_ids[members],
+            _WORKER["layer_name"],
+            z, int(xs[start]), int(ys[start]),
+            options,
+        )
+        if data is not None:
+            tiles.append((int(xs[start]), int(ys[start]), data))
+    return z, tiles
+
+
+def read_tile_source(input_path, columns=None):
+    """
+    Read a FlatGeobuf or GeoParquet file and reproject it to EPSG:3857 for tiling.
+    """
+    if input_path.endswith(".parquet"):
+        gdf = gpd.read_parquet(input_path, columns=None if columns is None else columns + ["geometry"])
+    else:
+        gdf = gpd.read_file(input_path, columns=columns)
+    gdf = gdf[gdf.geometry.notnull() & ~gdf.geometry.is_empty]
+    return gdf.to_crs(WEB_MERCATOR_CRS)
+
+
+def feature_properties(gdf, columns=None):
+    """
+    Convert the attribute table to one plain-Python dict per feature.
+    """
+    columns = [col for col in (columns or gdf.columns) if col != gdf.geometry.name]
+    records = gdf[columns].to_dict(orient="records")
+    return [{k: (v.item() if isinstance(v, np.generic) else v) for k, v in record.items()} for record in records]
+
+
+def create_mbtiles(output_mbtiles):
+    """
+    Create (or reset) an MBTiles file and return an open connection to it.
+    """
+    if os.path.exists(output_mbtiles):
+        os.remove(output_mbtiles)
+    conn = sqlite3.connect(output_mbtiles)
+    conn.executescript(
+        """
+        PRAGMA journal_mode = WAL;
+        PRAGMA synchronous = NORMAL;
+        CREATE TABLE metadata (name TEXT, value TEXT);
+        CREATE UNIQUE INDEX name ON metadata (name);
+        CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB);
+        CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row);
+        """
+    )
+    return conn
+
+
+def write_tiles(conn, z, tiles):
+    """
+    Insert or replace XYZ tiles in an MBTiles file (rows are stored in TMS order).
+    """
+    n = 1 << z
+    conn.executemany(
+        "INSERT OR REPLACE INTO tiles (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)",
+        [(z, x, n - 1 - y, data) for x, y, data in tiles],
+    )
+
+
+def write_metadata(conn, gdf, layer_name, min_zoom, max_zoom, columns=None):
+    """
+    Write the MBTiles metadata table, including the vector_layers description.
+    """
+    lon_lat = gdf.geometry.to_crs("EPSG:4326").total_bounds
+    columns = [col for col in (columns or gdf.columns) if col != gdf.geometry.name]
+    fields = {col: ("Number" if gdf[col].dtype.kind in "biuf" else "String") for col in columns}
+    metadata = {
+        "name": layer_name,
+        "format": "pbf",
+        "type": "overlay",
+        "minzoom": str(min_zoom),
+        "maxzoom": str(max_zoom),
+        "bounds": ",".join(f"{v:.6f}" for v in lon_lat),
+        "center": f"{(lon_lat[0] + lon_lat[2]) / 2:.6f},{(lon_lat[1] + lon_lat[3]) / 2:.6f},{min_zoom}",
+        "json": json.dumps({
+            "vector_layers": [{"id": layer_name, "fields": fields, "minzoom": min_zoom, "maxzoom": max_zoom}]
+        }),
+    }
+    conn.executemany("INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)", metadata.items())
+
+
+def build_mbtiles(input_path, output_mbtiles, min_zoom=0, max_zoom=14, layer_name=None, columns=None,
+                  extent=DEFAULT_EXTENT, buffer=DEFAULT_BUFFER, simplification=1.0, max_workers=None,
+                  gdf=None, feature_ids=None):
+    """
+    Build a vector-tile pyramid from a FlatGeobuf/GeoParquet file into an MBTiles file.
+
+    Each zoom level is split into shards rendered by a process pool; the parent process is the
+    only SQLite writer. Empty tiles are never written.
+
+    Args:
+        input_path (str): FlatGeobuf (.fgb) or GeoParquet (.parquet) input.
+        output_mbtiles (str): Path of the MBTiles file to create.
+        min_zoom (int): Minimum zoom level.
+        max_zoom (int): Maximum zoom level.
+        layer_name (str): MVT layer name (defaults to the input file name).
+        columns (list): Attributes to keep (all attributes when None).
+        extent (int): Tile extent.
+        buffer (int): Clip buffer in tile units.
+        simplification (float): Simplification tolerance in tile units.
+        max_workers (int): Number of worker processes (all cores when None).
+        gdf (GeoDataFrame): Already loaded EPSG:3857 data, used instead of reading `input_path`.
+        feature_ids (array): MVT feature ids (row positions when None).
+
+    Returns:
+        dict: Number of tiles and bytes written per zoom level.
+    """
+    layer_name = layer_name or os.path.splitext(os.path.basename(input_path))[0]
+    if gdf is None:
+        gdf = read_tile_source(input_path, columns=columns)
+    logging.info(f"Tiling {len(gdf)} features from {input_path} (zooms {min_zoom}-{max_zoom})...")
+
+    wkb = shapely.to_wkb(gdf.geometry.values)
+    properties = feature_properties(gdf, columns)
+    if feature_ids is None:
+        feature_ids = np.arange(len(gdf), dtype=np.uint64)
+    options = {"extent": extent, "buffer": buffer, "simplification": simplification}
+    max_workers = max_workers or os.cpu_count() or 1
+
+    stats = {z: {"tiles": 0, "bytes": 0} for z in range(min_zoom, max_zoom + 1)}
+    conn = create_mbtiles(output_mbtiles)
+    try:
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_worker,
+            initargs=(wkb, properties, feature_ids, layer_name, options),
+        ) as executor:
+            futures = [
+                executor.submit(_render_zoom_shard, z, shard, max_workers)
+                for z in range(min_zoom, max_zoom + 1)
+                for shard in range(max_workers)
+            ]
+            for future in as_completed(futures):
+                z, tiles = future.result()
+                write_tiles(conn, z, tiles)
+                stats[z]["tiles"] += len(tiles)
+                stats[z]["bytes"] += sum(len(data) for _, _, data in tiles)
+
+        write_metadata(conn, gdf, layer_name, min_zoom, max_zoom, columns)
+        conn.commit()
+    finally:
+        conn.close()
+
+    for z, zoom_stats in stats.items():
+        logging.info(f"Zoom {z}: {zoom_stats['tiles']} tiles, {zoom_stats['bytes']} bytes")
+    return stats
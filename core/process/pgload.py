@@ -0,0 +1,891 @@
+# pgload.py
+
+import re
+import json
+import time
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+import shapely
+import psycopg
+from geopandas.array import GeometryDtype
+from psycopg import errors, sql
+from psycopg_pool import ConnectionPool
+
+from .aggregates import build_aggregates, drop_aggregates, rename_aggregates
+from .breaks import compute_class_breaks, store_class_breaks
+from .config import POSTGIS_CONNECTION_STRING, POSTGIS_SCHEMA, SPLIT_ATTRIBUTE, ZOOM_BANDS
+from .tile_cache import bump_data_version
+from .tile_service import generalized_column
+
+COPY_BATCH_SIZE = 50000
+MAX_IDENTIFIER_LENGTH = 63
+
+# Failures worth retrying: lost connections, lock timeouts and serialization conflicts
+TRANSIENT_ERRORS = (
+    psycopg.OperationalError,
+    errors.SerializationFailure,
+    errors.DeadlockDetected,
+    errors.LockNotAvailable,
+)
+
+SPATIAL_INDEX_METHODS = ("gist", "spgist")
+
+# Column holding the Hilbert sort key of each row, indexed with BRIN
+HILBERT_COLUMN = "hilbert_key"
+
+# Web mercator tile width at zoom 0, in metres
+EARTH_CIRCUMFERENCE = 40075016.686
+
+# Column names usable without quoting: lower case letters, digits and underscores
+PLAIN_IDENTIFIER = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+# Keywords that cannot be used as column names without quoting
+RESERVED_KEYWORDS = "SELECT word FROM pg_get_keywords() WHERE catcode IN ('R', 'T')"
+
+# pandas dtype kind -> (column type, COPY binary type)
+PG_TYPES = {
+    "b": ("boolean", "bool"),
+    "i": ("bigint", "int8"),
+    "u": ("bigint", "int8"),
+    "f": ("double precision", "float8"),
+    "M": ("timestamp", "timestamp"),
+}
+
+
+def _identifier(name, suffix=""):
+    """
+    Build a table or index name that fits PostgreSQL's 63 byte identifier limit.
+    """
+    return name[:MAX_IDENTIFIER_LENGTH - len(suffix)] + suffix
+
+
+def column_types(gdf, srid=0):
+    """
+    Map the attribute columns of a GeoDataFrame to PostgreSQL types.
+
+    Secondary geometry columns (e.g. generalized geometries) become geometry columns in `srid`.
+
+    Returns:
+        list: (column name, column type, COPY binary type) for every column but the active geometry.
+    """
+    columns = []
+    for col in gdf.columns:
+        if col == gdf.geometry.name:
+            continue
+        if isinstance(gdf[col].dtype, GeometryDtype):
+            columns.append((col, f"geometry(Geometry, {int(srid)})", "bytea"))
+            continue
+        pg_type, copy_type = PG_TYPES.get(gdf[col].dtype.kind, ("text", "text"))
+        columns.append((col, pg_type, copy_type))
+    return columns
+
+
+def _column_values(series, copy_type):
+    """
+    Convert a column to Python values for COPY, with missing values as None.
+    """
+    if copy_type == "text":
+        values = series.astype(object).where(series.notna(), None)
+        return [None if v is None else str(v) for v in values]
+    if copy_type == "timestamp":
+        return [None if pd.isna(v) else v.to_pydatetime() for v in series]
+    values = series.to_numpy(dtype=object)
+    values[pd.isna(series).to_numpy()] = None
+    return values.tolist()
+
+
+def ewkb(geometries, srid):
+    """
+    Encode geometries as EWKB carrying their SRID.
+    """
+    return shapely.to_wkb(shapely.set_srid(geometries, srid), include_srid=True, flavor="extended")
+
+
+def copy_rows(cursor, gdf, table, geometry_column="geometry", srid=2154, batch_size=COPY_BATCH_SIZE):
+    """
+    Stream a GeoDataFrame into an existing table with COPY ... FROM STDIN (FORMAT BINARY).
+
+    Geometries are sent as EWKB, which PostGIS' binary input function accepts directly.
+
+    Args:
+        cursor: psycopg cursor.
+        gdf (GeoDataFrame): Rows to load.
+        table (sql.Composable): Target table identifier.
+        geometry_column (str): Name of the geometry column in the table.
+        srid (int): SRID of the geometries.
+        batch_size (int): Rows converted to COPY values at a time.
+
+    Returns:
+        int: Number of rows written.
+    """
+    columns = column_types(gdf, srid)
+    names = [col for col, _, _ in columns] + [geometry_column]
+    copy_types = [copy_type for _, _, copy_type in columns] + ["bytea"]
+    statement = sql.SQL("COPY {} ({}) FROM STDIN (FORMAT BINARY)").format(
+        table, sql.SQL(", ").join(sql.Identifier(name) for name in names)
+    )
+
+    written = 0
+    with cursor.copy(statement) as copy:
+        copy.set_types(copy_types)
+        for start in range(0, len(gdf), batch_size):
+            batch = gdf.iloc[start:start + batch_size]
+            values = [
+                ewkb(batch[col].values, srid).tolist() if copy_type == "bytea" else _column_values(batch[col], copy_type)
+                for col, _, copy_type in columns
+            ]
+            values.append(ewkb(batch.geometry.values, srid).tolist())
+            for row in zip(*values):
+                copy.write_row(row)
+            written += len(batch)
+    return written
+
+
+def create_table(cursor, gdf, table, geometry_column="geometry", srid=2154, partition_by=None):
+    """
+    Create a table matching a GeoDataFrame, with an identity primary key.
+
+    With `partition_by`, the table is created as a LIST-partitioned parent on that column.
+    """
+    definitions = [sql.SQL("id BIGINT GENERATED ALWAYS AS IDENTITY")]
+    definitions += [
+        sql.SQL("{} {}").format(sql.Identifier(col), sql.SQL(pg_type))
+        for col, pg_type, _ in column_types(gdf, srid)
+        if col != "id"
+    ]
+    definitions.append(sql.SQL("{} geometry(Geometry, {})").format(sql.Identifier(geometry_column), sql.Literal(srid)))
+    statement = sql.SQL("CREATE TABLE {} ({})").format(table, sql.SQL(", ").join(definitions))
+    if partition_by is not None:
+        statement += sql.SQL(" PARTITION BY LIST ({})").format(sql.Identifier(partition_by))
+    cursor.execute(statement)
+
+
+def create_spatial_index(cursor, schema, table_name, geometry_column="geometry", index_method="gist"):
+    """
+    Create the `<table>_geom_idx` spatial index with the given access method ("gist" or "spgist").
+    """
+    if index_method not in SPATIAL_INDEX_METHODS:
+        raise ValueError(f"Unsupported spatial index method: {index_method}")
+    cursor.execute(sql.SQL("CREATE INDEX {} ON {} USING {} ({})").format(
+        sql.Identifier(_identifier(table_name, "_geom_idx")), sql.Identifier(schema, table_name),
+        sql.SQL(index_method.upper()), sql.Identifier(geometry_column)))
+
+
+def build_indexes(cursor, schema, table_name, geometry_column="geometry", key_columns=("id",), index_method="gist",
+                  hilbert_column=None, cluster=False):
+    """
+    Create the primary key and the spatial index of a freshly loaded table, then ANALYZE it.
+
+    On a partitioned table both indexes are created on every partition as well, and
+    `key_columns` must include the partition keys. `index_method` is "gist" or "spgist".
+    With `hilbert_column`, a BRIN index is built on that sort key; with `cluster`, the heap
+    is rewritten in GiST order (SP-GiST indexes cannot be clustered on).
+    """
+    table = sql.Identifier(schema, table_name)
+    cursor.execute(sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} PRIMARY KEY ({})").format(
+        table, sql.Identifier(_identifier(table_name, "_pkey")),
+        sql.SQL(", ").join(sql.Identifier(col) for col in key_columns)))
+    create_spatial_index(cursor, schema, table_name, geometry_column=geometry_column, index_method=index_method)
+    if hilbert_column is not None:
+        cursor.execute(sql.SQL("CREATE INDEX {} ON {} USING BRIN ({})").format(
+            sql.Identifier(_identifier(table_name, "_hilbert_idx")), table, sql.Identifier(hilbert_column)))
+    if cluster:
+        if index_method == "gist":
+            cursor.execute(sql.SQL("CLUSTER {} USING {}").format(
+                table, sql.Identifier(_identifier(table_name, "_geom_idx"))))
+        else:
+            logging.warning(f"Cannot CLUSTER {schema}.{table_name} on an {index_method} index; keeping the load order.")
+    cursor.execute(sql.SQL("ANALYZE {}").format(table))
+
+
+def index_suffixes(zoom_bands=()):
+    """
+    Suffixes of the index names of a loaded table, appended to the table name.
+    """
+    suffixes = ["_pkey", "_geom_idx", "_hilbert_idx"]
+    return suffixes + [_band_index_suffix(min_zoom, max_zoom) for min_zoom, max_zoom, _ in zoom_bands]
+
+
+def swap_table(cursor, schema, staging_name, table_name, zoom_bands=()):
+    """
+    Replace `table_name` with the loaded staging table in the current transaction.
+
+    Index and constraint names (including the indexes of `zoom_bands` generalized columns)
+    are renamed along with the table so the next load can reuse them. The aggregate views of
+    the old table are dropped and those built on the staging table take their names.
+    """
+    drop_aggregates(cursor, schema, table_name)
+    cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(schema, table_name)))
+    cursor.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(
+        sql.Identifier(schema, staging_name), sql.Identifier(table_name)))
+    for suffix in index_suffixes(zoom_bands):
+        cursor.execute(sql.SQL("ALTER INDEX IF EXISTS {} RENAME TO {}").format(
+            sql.Identifier(schema, _identifier(staging_name, suffix)),
+            sql.Identifier(_identifier(table_name, suffix))))
+    rename_aggregates(cursor, schema, staging_name, table_name)
+
+
+def with_generalized_geometries(gdf, zoom_bands, geometry_column="geometry"):
+    """
+    Add one simplified copy of the geometry per zoom band, named by `generalized_column`.
+
+    Args:
+        gdf (GeoDataFrame): Input GeoDataFrame.
+        zoom_bands (list): (min_zoom, max_zoom, tolerance) tuples, tolerance in CRS units.
+        geometry_column (str): Name of the geometry column in the target table.
+
+    Returns:
+        GeoDataFrame: The input with the generalized geometry columns appended.
+    """
+    columns = {}
+    for min_zoom, max_zoom, tolerance in zoom_bands:
+        columns[generalized_column(geometry_column, min_zoom, max_zoom)] = gdf.geometry.simplify(
+            tolerance, preserve_topology=True)
+    return gdf.assign(**columns)
+
+
+def build_generalized_indexes(cursor, schema, table_name, zoom_bands, geometry_column="geometry"):
+    """
+    Create a GiST index on every generalized geometry column, so each zoom band has its own index.
+    """
+    for min_zoom, max_zoom, _ in zoom_bands:
+        cursor.execute(sql.SQL("CREATE INDEX {} ON {} USING GIST ({})").format(
+            sql.Identifier(_identifier(table_name, _band_index_suffix(min_zoom, max_zoom))),
+            sql.Identifier(schema, table_name),
+            sql.Identifier(generalized_column(geometry_column, min_zoom, max_zoom))))
+
+
+def _band_index_suffix(min_zoom, max_zoom):
+    return f"_z{min_zoom}_{max_zoom}_idx"
+
+
+def with_hilbert_key(gdf):
+    """
+    Add the Hilbert distance of every geometry as `hilbert_key` and sort the rows by it.
+
+    Loading rows in this order stores neighbouring features on the same heap pages.
+    """
+    if len(gdf) == 0:
+        return gdf.assign(**{HILBERT_COLUMN: pd.Series(dtype="int64")})
+    keys = gdf.geometry.hilbert_distance(total_bounds=gdf.total_bounds).astype("int64")
+    return gdf.assign(**{HILBERT_COLUMN: keys}).sort_values(HILBERT_COLUMN, kind="stable")
+
+
+def sample_envelopes(gdf, n=50, zooms=(10, 12, 14), seed=0):
+    """
+    Build tile-sized query boxes around a random sample of features.
+
+    Box sizes are the width of a web mercator tile at each zoom, in the (metric) units of
+    the layer CRS, which is close enough to exercise the index like tile requests do.
+
+    Returns:
+        list: (minx, miny, maxx, maxy) boxes.
+    """
+    if len(gdf) == 0:
+        return []
+    points = gdf.geometry.sample(min(n, len(gdf)), random_state=seed).representative_point()
+    envelopes = []
+    for z in zooms:
+        half = EARTH_CIRCUMFERENCE / (1 << z) / 2
+        envelopes += [(p.x - half, p.y - half, p.x + half, p.y + half) for p in points]
+    return envelopes
+
+
+def query_latency(cursor, schema, table_name, envelopes, geometry_column="geometry", srid=2154):
+    """
+    Time bbox queries on a table with EXPLAIN (ANALYZE, BUFFERS).
+
+    Returns:
+        dict: Median and 95th percentile execution time (ms) and mean buffers touched per query.
+    """
+    statement = sql.SQL(
+        "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) SELECT count(*) FROM {} WHERE {} && ST_MakeEnvelope(%s, %s, %s, %s, %s)"
+    ).format(sql.Identifier(schema, table_name), sql.Identifier(geometry_column))
+    times, buffers = [], []
+    for envelope in envelopes:
+        plan = cursor.execute(statement, (*envelope, srid)).fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        plan = plan[0]
+        times.append(plan["Execution Time"])
+        buffers.append(plan["Plan"].get("Shared Hit Blocks", 0) + plan["Plan"].get("Shared Read Blocks", 0))
+    if not times:
+        return {"median_ms": 0.0, "p95_ms": 0.0, "buffers": 0.0}
+    return {
+        "median_ms": float(np.median(times)),
+        "p95_ms": float(np.percentile(times, 95)),
+        "buffers": float(np.mean(buffers)),
+    }
+
+
+def choose_index_method(cursor, schema, table_name, envelopes, geometry_column="geometry", srid=2154):
+    """
+    Build each spatial index type in turn on a loaded table and keep the faster one for `envelopes`.
+
+    Returns:
+        str: "gist" or "spgist". The candidate indexes are dropped again.
+    """
+    results = {}
+    for method in SPATIAL_INDEX_METHODS:
+        create_spatial_index(cursor, schema, table_name, geometry_column=geometry_column, index_method=method)
+        cursor.execute(sql.SQL("ANALYZE {}").format(sql.Identifier(schema, table_name)))
+        results[method] = query_latency(cursor, schema, table_name, envelopes, geometry_column=geometry_column, srid=srid)
+        cursor.execute(sql.SQL("DROP INDEX {}").format(sql.Identifier(schema, _identifier(table_name, "_geom_idx"))))
+    best = min(results, key=lambda method: results[method]["median_ms"])
+    logging.info(
+        f"Index benchmark on {schema}.{table_name}: "
+        + ", ".join(f"{method} {stats['median_ms']:.2f} ms" for method, stats in results.items())
+        + f"; using {best}."
+    )
+    return best
+
+
+def _table_exists(cursor, schema, table_name):
+    return cursor.execute("SELECT to_regclass(%s) IS NOT NULL",
+                          (sql.Identifier(schema, table_name).as_string(cursor),)).fetchone()[0]
+
+
+def _log_latency(schema, table_name, before, after):
+    if before is not None:
+        logging.info(
+            f"bbox queries on {schema}.{table_name}: median {before['median_ms']:.2f} -> {after['median_ms']:.2f} ms, "
+            f"p95 {before['p95_ms']:.2f} -> {after['p95_ms']:.2f} ms, "
+            f"buffers {before['buffers']:.0f} -> {after['buffers']:.0f} per query."
+        )
+    else:
+        logging.info(f"bbox queries on {schema}.{table_name}: median {after['median_ms']:.2f} ms, "
+                     f"p95 {after['p95_ms']:.2f} ms, {after['buffers']:.0f} buffers per query.")
+
+
+def copy_to_postgis(gdf, table_name, connection_string=POSTGIS_CONNECTION_STRING, schema=POSTGIS_SCHEMA,
+                    geometry_column="geometry", batch_size=COPY_BATCH_SIZE, conn=None,
+                    index_method="gist", hilbert=True, cluster=False, report=False, zoom_bands=ZOOM_BANDS,
+                    derived=True):
+    """
+    Bulk load a GeoDataFrame into PostGIS and atomically replace the target table.
+
+    Rows are streamed with binary COPY into a staging table; the primary key and spatial index are
+    built after the load and the table is analyzed. The staging table then replaces the target
+    in a short transaction, so readers see either the old or the new table, never a partial one.
+    The aggregate views and the class breaks of the table are replaced in the same transaction.
+    An `id` attribute in the input is replaced by the table's identity key.
+
+    Args:
+        gdf (GeoDataFrame): Input GeoDataFrame.
+        table_name (str): Name of the target table.
+        connection_string (str): Connection string for PostGIS (ignored when `conn` is given).
+        schema (str): Schema name in PostGIS.
+        geometry_column (str): Name of the geometry column to create.
+        batch_size (int): Rows converted to COPY values at a time.
+        conn (psycopg.Connection): Existing connection (e.g. from a pool) to use.
+        index_method (str): "gist", "spgist", or "auto" to benchmark both on sample tile queries.
+        hilbert (bool): Load rows in Hilbert order with a BRIN-indexed `hilbert_key` column.
+        cluster (bool): CLUSTER the table on its GiST index after the load.
+        report (bool): Log bbox query latency of the previous and the new table.
+        zoom_bands (list): (min_zoom, max_zoom, tolerance) bands stored as GiST-indexed generalized
+            geometry columns for the tile service (None stores the full geometry only).
+        derived (bool): Replace the aggregate views and class breaks and bump the data version with
+            the table (False only loads and swaps it, see `upload_tables`).
+
+    Returns:
+        int: Number of rows loaded.
+    """
+    if conn is None:
+        with psycopg.connect(connection_string) as own_conn:
+            return copy_to_postgis(gdf, table_name, schema=schema, geometry_column=geometry_column,
+                                   batch_size=batch_size, conn=own_conn, index_method=index_method,
+                                   hilbert=hilbert, cluster=cluster, report=report, zoom_bands=zoom_bands,
+                                   derived=derived)
+
+    srid = gdf.crs.to_epsg() if gdf.crs is not None else 0
+    zoom_bands = zoom_bands or []
+    gdf = gdf[gdf.geometry.notnull()]
+    gdf = with_generalized_geometries(gdf, zoom_bands, geometry_column=geometry_column)
+    if hilbert:
+        gdf = with_hilbert_key(gdf)
+    envelopes = sample_envelopes(gdf) if report or index_method == "auto" else []
+    staging_name = _identifier(table_name, "__load")
+    staging = sql.Identifier(schema, staging_name)
+    start = time.perf_counter()
+
+    with conn.transaction():
+        with conn.cursor() as cursor:
+            before = None
+            if report and _table_exists(cursor, schema, table_name):
+                before = query_latency(cursor, schema, table_name, envelopes, geometry_column=geometry_column, srid=srid)
+            cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(staging))
+            create_table(cursor, gdf, staging, geometry_column=geometry_column, srid=srid)
+            rows = copy_rows(cursor, gdf.drop(columns=["id"], errors="ignore"), staging,
+                             geometry_column=geometry_column, srid=srid, batch_size=batch_size)
+            load_time = time.perf_counter() - start
+            if index_method == "auto":
+                index_method = choose_index_method(cursor, schema, staging_name, envelopes,
+                                                   geometry_column=geometry_column, srid=srid)
+            build_indexes(cursor, schema, staging_name, geometry_column=geometry_column, index_method=index_method,
+                          hilbert_column=HILBERT_COLUMN if hilbert else None, cluster=cluster)
+            build_generalized_indexes(cursor, schema, staging_name, zoom_bands, geometry_column=geometry_column)
+            if derived:
+                build_aggregates(cursor, schema, staging_name, gdf.columns)
+            if report:
+                after = query_latency(cursor, schema, staging_name, envelopes, geometry_column=geometry_column, srid=srid)
+                _log_latency(schema, table_name, before, after)
+
+    break_rows = compute_class_breaks(gdf, group_column=SPLIT_ATTRIBUTE) if derived else None
+    with conn.transaction():
+        with conn.cursor() as cursor:
+            swap_table(cursor, schema, staging_name, table_name, zoom_bands=zoom_bands)
+            if derived:
+                bump_data_version(cursor, table_name, schema=schema)
+                store_class_breaks(cursor, break_rows, table_name, schema=schema)
+
+    elapsed = time.perf_counter() - start
+    logging.info(
+        f"Loaded {rows} rows into {schema}.{table_name} in {elapsed:.1f}s "
+        f"(COPY {rows / max(load_time, 1e-9):.0f} rows/s)."
+    )
+    return rows
+
+
+def promote_to_multi(geometries):
+    """
+    Turn single points, lines and polygons into their multi counterparts (ogr2ogr's PROMOTE_TO_MULTI).
+    """
+    geometries = np.array(geometries, dtype=object)
+    type_ids = shapely.get_type_id(geometries)
+    for single, factory in ((0, shapely.multipoints), (1, shapely.multilinestrings), (3, shapely.multipolygons)):
+        mask = type_ids == single
+        if mask.any():
+            geometries[mask] = factory(geometries[mask], indices=np.arange(mask.sum()))
+    return geometries
+
+
+def launder_columns(gdf):
+    """
+    Lower-case attribute names and replace other characters with underscores, as ogr2ogr's LAUNDER does.
+    """
+    return gdf.rename(columns={
+        col: re.sub(r"[^a-z0-9_]", "_", col.lower())
+        for col in gdf.columns if col != gdf.geometry.name
+    })
+
+
+def check_column_names(cursor, names):
+    """
+    Reject column names that are SQL reserved words or need quoting to be used.
+
+    Raises:
+        ValueError: If any name is reserved or not a plain lower case identifier.
+    """
+    reserved = {row[0] for row in cursor.execute(RESERVED_KEYWORDS).fetchall()}
+    invalid = [name for name in names if name.lower() in reserved or not PLAIN_IDENTIFIER.match(name)]
+    if invalid:
+        raise ValueError(f"Reserved or invalid column names: {invalid}")
+
+
+def load_table(conn, gdf, table_name, schema=POSTGIS_SCHEMA, geometry_column="geom", srid=2154,
+               index_method="gist", owner=None, grantees=(), batch_size=COPY_BATCH_SIZE,
+               hilbert=True, cluster=False, report=False):
+    """
+    Replace a table with a GeoDataFrame in a single transaction on one connection.
+
+    The column names are checked against PostgreSQL's reserved keywords, rows are streamed with
+    binary COPY, the spatial index is built, the stored SRID is verified with `Find_SRID`, and
+    ownership and privileges are set. Any failure rolls back the whole load, leaving the
+    previous table in place.
+
+    Args:
+        conn (psycopg.Connection): Connection (e.g. from a pool) to load through.
+        gdf (GeoDataFrame): Rows to load, already in `srid`.
+        table_name (str): Name of the table to replace.
+        schema (str): Schema name in PostGIS.
+        geometry_column (str): Name of the geometry column to create.
+        srid (int): Expected SRID of the table.
+        index_method (str): "gist", "spgist", or "auto" to benchmark both on sample tile queries.
+        owner (str): Role given ownership of the table (unchanged when None).
+        grantees (iterable): Roles granted all privileges on the table.
+        batch_size (int): Rows converted to COPY values at a time.
+        hilbert (bool): Load rows in Hilbert order with a BRIN-indexed `hilbert_key` column.
+        cluster (bool): CLUSTER the table on its GiST index after the load.
+        report (bool): Log bbox query latency of the previous and the new table.
+
+    Returns:
+        int: Number of rows loaded.
+    """
+    gdf = gdf[gdf.geometry.notnull()].drop(columns=["id"], errors="ignore")
+    if hilbert:
+        gdf = with_hilbert_key(gdf)
+    envelopes = sample_envelopes(gdf) if report or index_method == "auto" else []
+    break_rows = compute_class_breaks(gdf, group_column=SPLIT_ATTRIBUTE)
+    table = sql.Identifier(schema, table_name)
+    start = time.perf_counter()
+
+    with conn.transaction():
+        with conn.cursor() as cursor:
+            check_column_names(cursor, [col for col, _, _ in column_types(gdf)] + [geometry_column])
+            before = None
+            if report and _table_exists(cursor, schema, table_name):
+                before = query_latency(cursor, schema, table_name, envelopes, geometry_column=geometry_column, srid=srid)
+            drop_aggregates(cursor, schema, table_name)
+            cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(table))
+            create_table(cursor, gdf, table, geometry_column=geometry_column, srid=srid)
+            rows = copy_rows(cursor, gdf, table, geometry_column=geometry_column, srid=srid, batch_size=batch_size)
+            if index_method == "auto":
+                index_method = choose_index_method(cursor, schema, table_name, envelopes,
+                                                   geometry_column=geometry_column, srid=srid)
+            build_indexes(cursor, schema, table_name, geometry_column=geometry_column, index_method=index_method,
+                          hilbert_column=HILBERT_COLUMN if hilbert else None, cluster=cluster)
+            build_aggregates(cursor, schema, table_name, gdf.columns)
+            if report:
+                after = query_latency(cursor, schema, table_name, envelopes, geometry_column=geometry_column, srid=srid)
+                _log_latency(schema, table_name, before, after)
+
+            found = cursor.execute("SELECT Find_SRID(%s, %s, %s)", (schema, table_name, geometry_column)).fetchone()[0]
+            if found != srid:
+                raise ValueError(f"CRS is not set to EPSG:{srid} for table {table_name} (found {found}).")
+
+            if owner:
+                cursor.execute(sql.SQL("ALTER TABLE {} OWNER TO {}").format(table, sql.Identifier(owner)))
+            for grantee in grantees:
+                cursor.execute(sql.SQL("GRANT ALL PRIVILEGES ON TABLE {} TO {}").format(table, sql.Identifier(grantee)))
+            bump_data_version(cursor, table_name, schema=schema)
+            store_class_breaks(cursor, break_rows, table_name, schema=schema)
+
+    elapsed = time.perf_counter() - start
+    logging.info(f"Loaded {rows} rows into {schema}.{table_name} in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):.0f} rows/s).")
+    return rows
+
+
+def partition_name(table_name, values, suffix=""):
+    """
+    Derive a stable partition name from the parent name and partition key values.
+
+    A short hash of the values keeps names unique after slugging and truncation. With
+    `suffix`, the name of an index of the partition is built the same way.
+    """
+    key = "/".join(str(v) for v in values)
+    slug = re.sub(r"[^a-z0-9]+", "_", key.lower()).strip("_")
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:8]
+    return _identifier(f"{table_name}_p_{slug}", f"_{digest}{suffix}")
+
+
+def _literal(value):
+    return sql.Literal(value.item() if hasattr(value, "item") else value)
+
+
+def create_partitions(cursor, schema, table_name, keys, partition_columns):
+    """
+    Create the LIST partitions (and sub-partitions) of a partitioned parent.
+
+    Args:
+        keys (DataFrame): Distinct partition key values, one column per partition level.
+        partition_columns (list): Partition columns, outermost first.
+
+    Returns:
+        list: Value tuples of every partition created, parents before their sub-partitions.
+    """
+    created = []
+    for level, column in enumerate(partition_columns):
+        sub_key = partition_columns[level + 1] if level + 1 < len(partition_columns) else None
+        for values in keys[partition_columns[:level + 1]].drop_duplicates().itertuples(index=False, name=None):
+            parent = table_name if level == 0 else partition_name(table_name, values[:-1])
+            statement = sql.SQL("CREATE TABLE {} PARTITION OF {} FOR VALUES IN ({})").format(
+                sql.Identifier(schema, partition_name(table_name, values)),
+                sql.Identifier(schema, parent),
+                _literal(values[-1]),
+            )
+            if sub_key is not None:
+                statement += sql.SQL(" PARTITION BY LIST ({})").format(sql.Identifier(sub_key))
+            cursor.execute(statement)
+            created.append(values)
+    return created
+
+
+def partition_indexes(cursor, schema, index_name):
+    """
+    List the indexes PostgreSQL attached to every partition for a partitioned index.
+
+    Returns:
+        list: (partition name, index name, whether the partition is a leaf) rows, sub-partitions included.
+    """
+    return cursor.execute(
+        """
+        WITH RECURSIVE tree AS (
+            SELECT inhrelid AS index_oid FROM pg_inherits WHERE inhparent = to_regclass(%s)
+            UNION ALL
+            SELECT i.inhrelid FROM pg_inherits i JOIN tree t ON i.inhparent = t.index_oid
+        )
+        SELECT tbl.relname, idx.relname, tbl.relkind = 'r'
+        FROM tree
+        JOIN pg_index pi ON pi.indexrelid = tree.index_oid
+        JOIN pg_class idx ON idx.oid = pi.indexrelid
+        JOIN pg_class tbl ON tbl.oid = pi.indrelid
+        """,
+        (sql.Identifier(schema, index_name).as_string(cursor),),
+    ).fetchall()
+
+
+def rename_partition_indexes(cursor, schema, table_name, partitions, suffixes):
+    """
+    Give the partition indexes of `table_name` names derived from their partition, like the parent's.
+
+    The indexes PostgreSQL creates on every partition are named after the staging partitions and
+    would otherwise keep those names after the swap.
+    """
+    values_by_name = {partition_name(table_name, values): values for values in partitions}
+    for suffix in suffixes:
+        for partition, index, _ in partition_indexes(cursor, schema, _identifier(table_name, suffix)):
+            cursor.execute(sql.SQL("ALTER INDEX {} RENAME TO {}").format(
+                sql.Identifier(schema, index),
+                sql.Identifier(partition_name(table_name, values_by_name[partition], suffix))))
+
+
+def cluster_partitions(cursor, schema, table_name):
+    """
+    CLUSTER every leaf partition of `table_name` on its part of the GiST index, then ANALYZE the table.
+
+    PostgreSQL cannot CLUSTER a partitioned table as a whole before version 17.
+    """
+    for partition, index, leaf in partition_indexes(cursor, schema, _identifier(table_name, "_geom_idx")):
+        if leaf:
+            cursor.execute(sql.SQL("CLUSTER {} USING {}").format(
+                sql.Identifier(schema, partition), sql.Identifier(index)))
+    cursor.execute(sql.SQL("ANALYZE {}").format(sql.Identifier(schema, table_name)))
+
+
+def extent_table_name(table_name):
+    """
+    Name of the table holding the extent of every leaf partition of `table_name`.
+    """
+    return _identifier(table_name, "_extent")
+
+
+def build_extent_table(cursor, schema, table_name, partition_columns, geometry_column="geometry", srid=2154):
+    """
+    Store the extent of every leaf partition, so tile queries can turn a bbox into partition keys.
+
+    The tile service filters on `key = ANY(ARRAY(SELECT key FROM <table>_extent WHERE extent && bbox))`,
+    an init-plan value the executor uses to prune partitions at startup.
+    """
+    extent = sql.Identifier(schema, extent_table_name(table_name))
+    keys = sql.SQL(", ").join(sql.Identifier(col) for col in partition_columns)
+    cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(extent))
+    cursor.execute(sql.SQL(
+        "CREATE TABLE {extent} AS SELECT {keys}, ST_SetSRID(ST_Extent({geometry})::geometry, {srid}) AS extent "
+        "FROM {table} GROUP BY {keys}"
+    ).format(extent=extent, keys=keys, geometry=sql.Identifier(geometry_column), srid=sql.Literal(srid),
+             table=sql.Identifier(schema, table_name)))
+    cursor.execute(sql.SQL("CREATE INDEX {} ON {} USING GIST (extent)").format(
+        sql.Identifier(_identifier(table_name, "_extent_idx")), extent))
+
+
+def copy_to_partitioned(gdf, table_name, partition_columns, connection_string=POSTGIS_CONNECTION_STRING,
+                        schema=POSTGIS_SCHEMA, geometry_column="geometry", batch_size=COPY_BATCH_SIZE, conn=None,
+                        zoom_bands=ZOOM_BANDS, hilbert=True, cluster=False):
+    """
+    Bulk load a GeoDataFrame into one LIST-partitioned table and atomically replace the target.
+
+    Partitions are created per commune (`["nom"]`) or per département then commune
+    (`["CODE_DEP", "nom"]`). Rows are COPYed into the parent and routed to their partition;
+    the GiST index and primary key are declared once on the parent and created on every
+    partition. An `<table>_extent` companion table lets the tile service prune partitions
+    by bbox. Staging tables are swapped in like `copy_to_postgis`, partitions and their
+    indexes included.
+
+    With `hilbert`, rows are COPYed in Hilbert order, which COPY keeps within each partition,
+    and the `hilbert_key` BRIN index is built on every partition; with `cluster`, each leaf
+    partition is rewritten in GiST order.
+
+    Rows with a missing partition key are skipped, as in the per-commune split.
+
+    Args:
+        gdf (GeoDataFrame): Input GeoDataFrame.
+        table_name (str): Name of the partitioned parent table.
+        partition_columns (list): Partition columns, outermost first.
+        connection_string (str): Connection string for PostGIS (ignored when `conn` is given).
+        schema (str): Schema name in PostGIS.
+        geometry_column (str): Name of the geometry column to create.
+        batch_size (int): Rows converted to COPY values at a time.
+        conn (psycopg.Connection): Existing connection (e.g. from a pool) to use.
+        zoom_bands (list): (min_zoom, max_zoom, tolerance) bands stored as GiST-indexed generalized
+            geometry columns (None stores the full geometry only).
+        hilbert (bool): Load rows in Hilbert order with a BRIN-indexed `hilbert_key` column.
+        cluster (bool): CLUSTER every partition on its GiST index after the load.
+
+    Returns:
+        int: Number of rows loaded.
+    """
+    if conn is None:
+        with psycopg.connect(connection_string) as own_conn:
+            return copy_to_partitioned(gdf, table_name, partition_columns, schema=schema,
+                                       geometry_column=geometry_column, batch_size=batch_size, conn=own_conn,
+                                       zoom_bands=zoom_bands, hilbert=hilbert, cluster=cluster)
+
+    partition_columns = list(partition_columns)
+    missing = [col for col in partition_columns if col not in gdf.columns]
+    if missing:
+        raise ValueError(f"Partition columns not found in the dataset: {missing}")
+
+    srid = gdf.crs.to_epsg() if gdf.crs is not None else 0
+    gdf = gdf[gdf.geometry.notnull()]
+    keyed = gdf[partition_columns].notna().all(axis=1)
+    if not keyed.all():
+        logging.warning(f"Skipping {(~keyed).sum()} rows without a value for {partition_columns}.")
+        gdf = gdf[keyed]
+    zoom_bands = zoom_bands or []
+    gdf = with_generalized_geometries(gdf, zoom_bands, geometry_column=geometry_column)
+    if hilbert:
+        gdf = with_hilbert_key(gdf)
+
+    staging_name = _identifier(table_name, "__load")
+    staging = sql.Identifier(schema, staging_name)
+    keys = gdf[partition_columns].drop_duplicates()
+    start = time.perf_counter()
+
+    with conn.transaction():
+        with conn.cursor() as cursor:
+            cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(staging))
+            create_table(cursor, gdf, staging, geometry_column=geometry_column, srid=srid,
+                         partition_by=partition_columns[0])
+            partitions = create_partitions(cursor, schema, staging_name, keys, partition_columns)
+            rows = copy_rows(cursor, gdf.drop(columns=["id"], errors="ignore"), staging,
+                             geometry_column=geometry_column, srid=srid, batch_size=batch_size)
+            load_time = time.perf_counter() - start
+            build_indexes(cursor, schema, staging_name, geometry_column=geometry_column,
+                          key_columns=["id"] + partition_columns,
+                          hilbert_column=HILBERT_COLUMN if hilbert else None)
+            if cluster:
+                cluster_partitions(cursor, schema, staging_name)
+            build_generalized_indexes(cursor, schema, staging_name, zoom_bands, geometry_column=geometry_column)
+            build_extent_table(cursor, schema, staging_name, partition_columns,
+                               geometry_column=geometry_column, srid=srid)
+            build_aggregates(cursor, schema, staging_name, gdf.columns)
+
+    break_rows = compute_class_breaks(gdf, group_column=SPLIT_ATTRIBUTE)
+    with conn.transaction():
+        with conn.cursor() as cursor:
+            cursor.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(
+                sql.Identifier(schema, extent_table_name(table_name))))
+            swap_table(cursor, schema, staging_name, table_name, zoom_bands=zoom_bands)
+            for values in partitions:
+                cursor.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(
+                    sql.Identifier(schema, partition_name(staging_name, values)),
+                    sql.Identifier(partition_name(table_name, values))))
+            rename_partition_indexes(cursor, schema, table_name, partitions, index_suffixes(zoom_bands))
+            cursor.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(
+                sql.Identifier(schema, extent_table_name(staging_name)),
+                sql.Identifier(extent_table_name(table_name))))
+            cursor.execute(sql.SQL("ALTER INDEX {} RENAME TO {}").format(
+                sql.Identifier(schema, _identifier(staging_name, "_extent_idx")),
+                sql.Identifier(_identifier(table_name, "_extent_idx"))))
+            bump_data_version(cursor, table_name, schema=schema)
+            store_class_breaks(cursor, break_rows, table_name, schema=schema)
+
+    elapsed = time.perf_counter() - start
+    logging.info(
+        f"Loaded {rows} rows into {len(partitions)} partitions of {schema}.{table_name} in {elapsed:.1f}s "
+        f"(COPY {rows / max(load_time, 1e-9):.0f} rows/s)."
+    )
+    return rows
+
+
+def _upload_with_retry(pool, table_name, source, schema, geometry_column, retries, backoff, options):
+    """
+    Load one table from a pooled connection, retrying transient failures with exponential backoff.
+
+    `options` are passed on to `copy_to_postgis`.
+    """
+    for attempt in range(1, retries + 1):
+        try:
+            gdf = source() if callable(source) else source
+            start = time.perf_counter()
+            with pool.connection() as conn:
+                rows = copy_to_postgis(gdf, table_name, schema=schema, geometry_column=geometry_column, conn=conn,
+                                       **options)
+            elapsed = time.perf_counter() - start
+            return {"rows": rows, "seconds": elapsed, "rows_per_s": rows / max(elapsed, 1e-9), "attempts": attempt}
+        except TRANSIENT_ERRORS as e:
+            if attempt == retries:
+                raise
+            delay = backoff * 2 ** (attempt - 1)
+            logging.warning(f"Transient error loading {schema}.{table_name} (attempt {attempt}/{retries}): {e}. Retrying in {delay:.1f}s.")
+            time.sleep(delay)
+
+
+def upload_tables(tables, connection_string=POSTGIS_CONNECTION_STRING, schema=POSTGIS_SCHEMA,
+                  geometry_column="geometry", max_workers=4, retries=3, backoff=1.0, derived=False):
+    """
+    Load many tables concurrently through one shared connection pool.
+
+    By default each table is only copied, given its primary key and GiST index, and swapped in:
+    no index benchmark, Hilbert key, generalized geometries, aggregate views or class breaks.
+    The data versions of all loaded tables are then bumped once, in a single transaction.
+    With `derived`, every table goes through the full `copy_to_postgis` chain instead.
+
+    Args:
+        tables (iterable): (table name, GeoDataFrame or zero-argument callable returning one) pairs.
+            Callables are evaluated inside the worker, so files can be read in parallel too.
+        connection_string (str): Connection string for PostGIS.
+        schema (str): Schema name in PostGIS.
+        geometry_column (str): Name of the geometry column to create.
+        max_workers (int): Number of concurrent loads (and pooled connections).
+        retries (int): Attempts per table before giving up on transient errors.
+        backoff (float): Initial delay in seconds between attempts, doubled each time.
+        derived (bool): Build the derived artefacts of every table with its load.
+
+    Returns:
+        dict: {table name: {"rows", "seconds", "rows_per_s", "attempts"} or {"error": message}}.
+    """
+    options = {} if derived else {"index_method": "gist", "hilbert": False, "zoom_bands": None, "derived": False}
+    results = {}
+    start = time.perf_counter()
+    with ConnectionPool(connection_string, min_size=1, max_size=max_workers, open=True) as pool:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(_upload_with_retry, pool, table_name, source, schema, geometry_column, retries, backoff,
+                                options): table_name
+                for table_name, source in tables
+            }
+            for future in as_completed(futures):
+                table_name = futures[future]
+                try:
+                    results[table_name] = future.result()
+                    stats = results[table_name]
+                    logging.info(f"Uploaded {schema}.{table_name}: {stats['rows']} rows in {stats['seconds']:.2f}s ({stats['rows_per_s']:.0f} rows/s)")
+                except Exception as e:
+                    results[table_name] = {"error": str(e)}
+                    logging.error(f"Failed to upload {schema}.{table_name}: {e}")
+
+        if not derived:
+            with pool.connection() as conn, conn.transaction(), conn.cursor() as cursor:
+                for table_name in sorted(name for name, r in results.items() if "error" not in r):
+                    bump_data_version(cursor, table_name, schema=schema)
+
+    loaded = [r for r in results.values() if "error" not in r]
+    total_rows = sum(r["rows"] for r in loaded)
+    elapsed = time.perf_counter() - start
+    logging.info(
+        f"Uploaded {len(loaded)}/{len(results)} tables, {total_rows} rows in {elapsed:.1f}s "
+        f"({total_rows / max(elapsed, 1e-9):.0f} rows/s overall)."
+    )
+    return results
+
+
+def upload_communes(gdf, attribute, connection_string=POSTGIS_CONNECTION_STRING, schema=POSTGIS_SCHEMA,
+                    max_workers=4, retries=3, derived=False):
+    """
+    Upload one table per value of `attribute` straight from memory, concurrently.
+
+    Tables are only loaded and swapped in unless `derived` is set, see `upload_tables`.
+
+    Returns:
+        dict: Per-table statistics, see `upload_tables`.
+    """
+    if attribute not in gdf.columns:
+        raise ValueError(f"Attribute '{attribute}' not found in the dataset.")
+    tables = ((str(value), subset) for value, subset in gdf.groupby(attribute))
+    return upload_tables(tables, connection_string=connection_string, schema=schema,
+                         max_workers=max_workers, retries=retries, derived=derived)
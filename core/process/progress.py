@@ -0,0 +1,108 @@
+# progress.py
+
+import os
+import json
+import time
+import logging
+import threading
+
+try:
+    import psutil
+except ImportError:  # psutil is optional: RSS is then read from /proc when available
+    psutil = None
+
+# File the job runner (panels/jobs.py) asks a pipeline to report its progress to
+PROGRESS_FILE_ENV = "PIPELINE_PROGRESS_FILE"
+
+
+def rss_mb():
+    """
+    Resident memory of the current process, in MB (None when it cannot be read).
+    """
+    if psutil is not None:
+        return psutil.Process(os.getpid()).memory_info().rss / 1024 / 1024
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class ProgressReporter:
+    """
+    Append pipeline progress events as JSON lines to a file, for the job runner to follow.
+
+    Each event carries the current stage, chunks done out of the total, features processed,
+    the feature rate since the stage started, and the resident memory of the process. Without
+    a path (no `PIPELINE_PROGRESS_FILE` in the environment) events are only logged at debug level.
+
+    Args:
+        path (str): File to append events to (default: $PIPELINE_PROGRESS_FILE).
+        min_interval (float): Minimum number of seconds between two `advance` events.
+    """
+
+    def __init__(self, path=None, min_interval=1.0):
+        self.path = path if path is not None else os.environ.get(PROGRESS_FILE_ENV)
+        self.min_interval = min_interval
+        self.stage_name = None
+        self.chunks_total = None
+        self.chunks_done = 0
+        self.features = 0
+        self._stage_start = time.monotonic()
+        self._last_event = 0.0
+        self._lock = threading.Lock()
+
+    def _emit(self, status, **extra):
+        elapsed = time.monotonic() - self._stage_start
+        memory = rss_mb()
+        event = {
+            "time": time.time(),
+            "status": status,
+            "stage": self.stage_name,
+            "chunks_done": self.chunks_done,
+            "chunks_total": self.chunks_total,
+            "features": self.features,
+            "features_per_s": round(self.features / elapsed, 1) if elapsed > 0 else None,
+            "rss_mb": round(memory, 1) if memory is not None else None,
+            **extra,
+        }
+        logging.debug(f"Progress: {event}")
+        if self.path:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(event) + "\n")
+        self._last_event = time.monotonic()
+
+    def stage(self, name, chunks_total=None):
+        """
+        Start a new stage, resetting the chunk and feature counters.
+        """
+        with self._lock:
+            self.stage_name = name
+            self.chunks_total = chunks_total
+            self.chunks_done = 0
+            self.features = 0
+            self._stage_start = time.monotonic()
+            self._emit("running")
+
+    def advance(self, chunks=1, features=0):
+        """
+        Record finished chunks and processed features; events are throttled to `min_interval`.
+        """
+        with self._lock:
+            self.chunks_done += chunks
+            self.features += features
+            finished = self.chunks_total is not None and self.chunks_done >= self.chunks_total
+            if finished or time.monotonic() - self._last_event >= self.min_interval:
+                self._emit("running")
+
+    def done(self, **extra):
+        with self._lock:
+            self._emit("succeeded", **extra)
+
+    def fail(self, error):
+        """
+        Report a failure that the pipeline handled itself (and may exit 0 after).
+        """
+        with self._lock:
+            self._emit("failed", error=str(error))
+
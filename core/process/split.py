@@ -1,21 +1,29 @@
 # split.py
 import os
-import geopandas as gpd
-from sqlalchemy import create_engine
-from config import OUTPUT_FOLDER, POSTGIS_CONNECTION_STRING, POSTGIS_SCHEMA, SPLIT_ATTRIBUTE
+from .config import OUTPUT_FOLDER, POSTGIS_CONNECTION_STRING, POSTGIS_SCHEMA, SPLIT_ATTRIBUTE, FGB_COLUMNS, PARTITION_COLUMNS
+from .fgb import write_indexed_flatgeobuf
+from .pgload import copy_to_postgis, copy_to_partitioned
 
-def split_and_save(gdf, attribute=SPLIT_ATTRIBUTE, output_folder=OUTPUT_FOLDER):
+def split_and_save(gdf, attribute=SPLIT_ATTRIBUTE, output_folder=OUTPUT_FOLDER, columns=FGB_COLUMNS):
     """
     Split a GeoDataFrame into smaller subsets based on the specified attribute.
+    Each subset is written as a Hilbert-sorted FlatGeobuf with a packed R-tree index,
+    keeping only `columns` (all attributes when None).
     """
-    os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+    os.makedirs(output_folder, exist_ok=True)
+    fgb_paths = []
     for value, subset in gdf.groupby(attribute):
-        output_path = os.path.join(OUTPUT_FOLDER, f"{value}.fgb")
-        subset.to_file(output_path, driver="FlatGeobuf")
+        output_path = os.path.join(output_folder, f"{value}.fgb")
+        write_indexed_flatgeobuf(subset, output_path, columns=columns)
+        fgb_paths.append(output_path)
+    return fgb_paths
 
-def upload_to_postgis(gdf, table_name, schema=POSTGIS_SCHEMA):
+def upload_to_postgis(gdf, table_name, schema=POSTGIS_SCHEMA, partition_columns=PARTITION_COLUMNS):
     """
-    Upload a GeoDataFrame to PostGIS.
+    Upload a GeoDataFrame to PostGIS with a binary COPY bulk load and an atomic table swap.
+    With `partition_columns`, the table is LIST-partitioned on those columns.
     """
-    engine = create_engine(POSTGIS_CONNECTION_STRING)
-    gdf.to_postgis(table_name, engine, schema=POSTGIS_SCHEMA, if_exists="replace", index=False)
\ No newline at end of file
+    if partition_columns:
+        copy_to_partitioned(gdf, table_name, partition_columns, connection_string=POSTGIS_CONNECTION_STRING, schema=schema)
+    else:
+        copy_to_postgis(gdf, table_name, connection_string=POSTGIS_CONNECTION_STRING, schema=schema)
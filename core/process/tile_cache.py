@@ -0,0 +1,246 @@
+# tile_cache.py
+
+import time
+import sqlite3
+import logging
+import argparse
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import mercantile
+
+from .config import POSTGIS_CONNECTION_STRING, POSTGIS_SCHEMA
+from .tile_service import PostGISTileService
+
+VERSION_TABLE = "tile_data_version"
+
+CREATE_VERSION_TABLE = f"""
+    CREATE TABLE IF NOT EXISTS public.{VERSION_TABLE} (
+        schema_name TEXT NOT NULL,
+        layer TEXT NOT NULL,
+        version BIGINT NOT NULL DEFAULT 1,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        PRIMARY KEY (schema_name, layer)
+    )
+"""
+
+BUMP_VERSION = f"""
+    INSERT INTO public.{VERSION_TABLE} (schema_name, layer) VALUES (%s, %s)
+    ON CONFLICT (schema_name, layer)
+    DO UPDATE SET version = {VERSION_TABLE}.version + 1, updated_at = now()
+"""
+
+# Versions only ever increase, so their sum changes whenever any layer of the schema changes
+SCHEMA_VERSION = f"SELECT COALESCE(SUM(version), 0) FROM public.{VERSION_TABLE} WHERE schema_name = %s"
+
+
+def bump_data_version(cursor, layer, schema=POSTGIS_SCHEMA):
+    """
+    Record that a layer's data changed, invalidating every cached tile built from it.
+
+    Args:
+        cursor: DB-API cursor (psycopg 2 or 3) on the PostGIS database.
+        layer (str): Table name that was replaced.
+        schema (str): Schema of the table.
+    """
+    cursor.execute(CREATE_VERSION_TABLE)
+    cursor.execute(BUMP_VERSION, (schema, layer))
+
+
+class LRUTileCache:
+    """
+    Thread-safe in-memory LRU of tile bytes.
+    """
+
+    def __init__(self, max_entries=20000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        with self._lock:
+            self._entries[key] = data
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class MBTilesTileCache:
+    """
+    Persistent SQLite tier storing tiles with the data version they were built from.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS tiles (
+                layer TEXT, zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER,
+                version INTEGER, tile_data BLOB,
+                PRIMARY KEY (layer, zoom_level, tile_column, tile_row)
+            );
+            """
+        )
+
+    def get(self, layer, z, x, y, version):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version, tile_data FROM tiles WHERE layer = ? AND zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                (layer, z, x, (1 << z) - 1 - y),
+            ).fetchone()
+        if row is None or row[0] != version:
+            return None
+        return row[1]
+
+    def put(self, layer, z, x, y, version, data):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO tiles (layer, zoom_level, tile_column, tile_row, version, tile_data) VALUES (?, ?, ?, ?, ?, ?)",
+                (layer, z, x, (1 << z) - 1 - y, version, data),
+            )
+            self._conn.commit()
+
+    def purge_stale(self, layer, version):
+        """
+        Delete tiles of a layer built from an older data version.
+        """
+        with self._lock:
+            deleted = self._conn.execute(
+                "DELETE FROM tiles WHERE layer = ? AND version != ?", (layer, version)
+            ).rowcount
+            self._conn.commit()
+        return deleted
+
+    def close(self):
+        self._conn.close()
+
+
+class CachedTileService:
+    """
+    Two-level tile cache (memory LRU, then SQLite) in front of a PostGIS tile service.
+
+    Entries are keyed by (layer, z, x, y, data version). The data version is read from
+    `tile_data_version` at most every `version_ttl` seconds, so a bump from
+    `upload_to_postgis` makes every older entry unreachable without an explicit flush.
+    """
+
+    def __init__(self, service, cache_path, layer=None, max_entries=20000, version_ttl=2.0):
+        self.service = service
+        self.layer = layer or service.schema
+        self.memory = LRUTileCache(max_entries)
+        self.disk = MBTilesTileCache(cache_path)
+        self.version_ttl = version_ttl
+        self._version = None
+        self._version_checked = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    def data_version(self):
+        """
+        Return the current data version of the served schema, refreshed every `version_ttl` seconds.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._version is not None and now - self._version_checked < self.version_ttl:
+                return self._version
+        with self.service.pool.connection() as conn:
+            if self._version is None:
+                conn.execute(CREATE_VERSION_TABLE)
+            version = conn.execute(SCHEMA_VERSION, (self.service.schema,)).fetchone()[0]
+        with self._lock:
+            if self._version is not None and version != self._version:
+                logging.info(f"Data version of {self.layer} changed from {self._version} to {version}.")
+                self.memory.clear()
+                self.service.refresh_tables()
+            self._version = version
+            self._version_checked = now
+        return version
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def get_tile(self, z, x, y):
+        """
+        Return the gzip-compressed tile, from memory, disk, or PostGIS in that order.
+        """
+        version = self.data_version()
+        key = (self.layer, z, x, y, version)
+
+        data = self.memory.get(key)
+        if data is not None:
+            self._count("memory_hits")
+            return data
+
+        data = self.disk.get(self.layer, z, x, y, version)
+        if data is not None:
+            self._count("disk_hits")
+            self.memory.put(key, data)
+            return data
+
+        self._count("misses")
+        data = self.service.get_tile(z, x, y, compress=True)
+        self.disk.put(self.layer, z, x, y, version, data)
+        self.memory.put(key, data)
+        return data
+
+    def prewarm(self, bbox, zooms, max_workers=8):
+        """
+        Fill both cache tiers with every tile covering a lon/lat bbox at the given zooms.
+
+        Args:
+            bbox (tuple): (west, south, east, north) in degrees.
+            zooms (list): Zoom levels to fill.
+            max_workers (int): Concurrent tile requests.
+
+        Returns:
+            int: Number of tiles visited.
+        """
+        self.disk.purge_stale(self.layer, self.data_version())
+        tiles = list(mercantile.tiles(*bbox, zooms=list(zooms)))
+        logging.info(f"Prewarming {len(tiles)} tiles of {self.layer}...")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for _ in executor.map(lambda t: self.get_tile(t.z, t.x, t.y), tiles):
+                pass
+        with self._lock:
+            stats = dict(self.stats)
+        logging.info(f"Prewarm done: {stats}")
+        return len(tiles)
+
+    def close(self):
+        self.disk.close()
+        self.service.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    parser = argparse.ArgumentParser(description="Prewarm the tile cache for a bbox")
+    parser.add_argument("--cache", default="tile_cache.mbtiles", help="Path of the SQLite cache tier")
+    parser.add_argument("--bbox", nargs=4, type=float, required=True, metavar=("WEST", "SOUTH", "EAST", "NORTH"))
+    parser.add_argument("--min-zoom", type=int, default=10)
+    parser.add_argument("--max-zoom", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    cache = CachedTileService(PostGISTileService(POSTGIS_CONNECTION_STRING, schema=POSTGIS_SCHEMA), args.cache)
+    try:
+        cache.prewarm(args.bbox, range(args.min_zoom, args.max_zoom + 1), max_workers=args.workers)
+    finally:
+        cache.close()
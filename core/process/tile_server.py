@@ -0,0 +1,102 @@
+# tile_server.py
+
+import re
+import sqlite3
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TILE_PATH = re.compile(r"^/(\d+)/(\d+)/(\d+)\.pbf$")
+
+
+class _MBTilesHandler(BaseHTTPRequestHandler):
+    """
+    Answer `/{z}/{x}/{y}.pbf` requests from the server's MBTiles file.
+    """
+
+    def do_GET(self):
+        match = TILE_PATH.match(self.path.split("?", 1)[0])
+        if not match:
+            self.send_error(404)
+            return
+        z, x, y = (int(value) for value in match.groups())
+        data = self.server.read_tile(z, x, y)
+        if data is None:
+            self.send_response(204)
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.mapbox-vector-tile")
+        if data[:2] == b"\x1f\x8b":
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Cache-Control", f"public, max-age={self.server.max_age}")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logging.debug("Tile server: " + format % args)
+
+
+class MBTilesServer(ThreadingHTTPServer):
+    """
+    Local HTTP endpoint serving the tiles of an MBTiles file, run on a background thread.
+
+    Only the tiles the map requests for its visible extent are read, so page size and load
+    time do not depend on the size of the dataset.
+
+    Args:
+        path (str): MBTiles file to serve.
+        host (str): Interface to bind.
+        port (int): Port to bind (a free port when 0).
+        max_age (int): Browser cache lifetime of a tile, in seconds.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, host="127.0.0.1", port=0, max_age=3600):
+        super().__init__((host, port), _MBTilesHandler)
+        self.path = path
+        self.max_age = max_age
+        self._local = threading.local()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def tile_url(self):
+        """
+        XYZ URL template of the tiles, for Leaflet/folium layers.
+        """
+        return self.url + "/{z}/{x}/{y}.pbf"
+
+    def read_tile(self, z, x, y):
+        # One read-only connection per handler thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            self._local.conn = conn
+        row = conn.execute(
+            "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (z, x, (1 << z) - 1 - y),
+        ).fetchone()
+        return row[0] if row else None
+
+    def start(self):
+        """
+        Serve on a daemon thread and return the tile URL template.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+            self._thread.start()
+            logging.info(f"Serving {self.path} at {self.tile_url}")
+        return self.tile_url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,192 @@
+# tile_service.py
+
+import gzip
+import logging
+import threading
+
+from psycopg import sql
+from psycopg_pool import ConnectionPool
+
+from .config import POSTGIS_CONNECTION_STRING, POSTGIS_SCHEMA, ZOOM_BANDS
+
+WEB_MERCATOR_SRID = 3857
+
+# Tables of a schema that carry the geometry column, with their attribute names.
+# Partitions are skipped: the partitioned parent is queried instead. For a parent with a
+# `<table>_extent` companion (see pgload.copy_to_partitioned), the key columns of that table
+# are returned so tile queries can prune partitions.
+CATALOG_QUERY = """
+    SELECT c.relname, array_agg(a.attname::text ORDER BY a.attnum),
+           CASE WHEN c.relkind = 'p' THEN (
+               SELECT array_agg(e.attname::text ORDER BY e.attnum)
+               FROM pg_attribute e
+               WHERE e.attrelid = to_regclass(format('%%I.%%I', n.nspname, left(c.relname, 56) || '_extent'))
+                 AND e.attnum > 0 AND NOT e.attisdropped AND e.attname <> 'extent'
+           ) END
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+    WHERE n.nspname = %s AND c.relkind IN ('r', 'p') AND NOT c.relispartition
+    GROUP BY c.relname, c.relkind, n.nspname
+    HAVING bool_or(a.attname = %s)
+    ORDER BY c.relname
+"""
+
+
+def generalized_column(geometry_column, min_zoom, max_zoom):
+    """
+    Name of the generalized geometry column serving zooms `min_zoom` to `max_zoom`.
+    """
+    return f"{geometry_column}_z{min_zoom}_{max_zoom}"
+
+
+class PostGISTileService:
+    """
+    Serve MVT tiles for every geometry table of a schema from a shared connection pool.
+
+    The table list is read from the catalog once and cached; all layers of a tile are produced
+    by a single prepared `ST_AsMVT` query over `ST_TileEnvelope`. Partitioned tables are
+    restricted to the partitions whose extent meets the tile. Tables loaded with generalized
+    geometry columns (see `pgload.copy_to_postgis`) are read from the column of the zoom band,
+    with one prepared query per band.
+    """
+
+    def __init__(self, connection_string=POSTGIS_CONNECTION_STRING, schema=POSTGIS_SCHEMA,
+                 geometry_column="geometry", attributes=("id", "PROD_EURO"), srid=2154,
+                 extent=4096, buffer=64, min_size=1, max_size=10, zoom_bands=ZOOM_BANDS):
+        self.schema = schema
+        self.geometry_column = geometry_column
+        self.attributes = list(attributes)
+        self.zoom_bands = [(min_zoom, max_zoom) for min_zoom, max_zoom, _ in zoom_bands or []]
+        self.srid = srid
+        self.extent = extent
+        self.buffer = buffer
+        self.pool = ConnectionPool(connection_string, min_size=min_size, max_size=max_size, open=True)
+        self._lock = threading.Lock()
+        self._tables = None
+        self._queries = {}
+
+    def close(self):
+        self.pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def tables(self):
+        """
+        Return the cached list of (table name, attributes, partition keys, generalized columns)
+        served as layers.
+        """
+        with self._lock:
+            if self._tables is None:
+                with self.pool.connection() as conn:
+                    rows = conn.execute(CATALOG_QUERY, (self.schema, self.geometry_column)).fetchall()
+                self._tables = [
+                    (name, [col for col in self.attributes if col in columns], partition_keys or [],
+                     {col for col in columns if col.startswith(f"{self.geometry_column}_z")})
+                    for name, columns, partition_keys in rows
+                ]
+                self._queries = {}
+                logging.info(f"Tile service serving {len(self._tables)} tables from schema {self.schema}.")
+            return self._tables
+
+    def refresh_tables(self):
+        """
+        Drop the cached table list so the next tile request reads the catalog again.
+        """
+        with self._lock:
+            self._tables = None
+            self._queries = {}
+
+    def _partition_filter(self, table_name, partition_keys):
+        # Uncorrelated ARRAY(...) sub-selects become init plans, which allow pruning at executor startup
+        extent = sql.Identifier(self.schema, table_name[:56] + "_extent")
+        return sql.SQL("").join(
+            sql.SQL(" AND t.{key} = ANY(ARRAY(SELECT e.{key} FROM {extent} e, bounds eb WHERE e.extent && eb.env_native))").format(
+                key=sql.Identifier(key), extent=extent)
+            for key in partition_keys
+        )
+
+    def zoom_band(self, z):
+        """
+        Return the (min_zoom, max_zoom) band containing `z`, or None to read the full geometry.
+        """
+        for band in self.zoom_bands:
+            if band[0] <= z <= band[1]:
+                return band
+        return None
+
+    def _layer_query(self, table_name, attributes, partition_keys=(), geometry_column=None):
+        geometry = sql.Identifier(geometry_column or self.geometry_column)
+        columns = sql.SQL("").join(sql.SQL("{}, ").format(sql.Identifier(col)) for col in attributes)
+        return sql.SQL(
+            """
+            SELECT ST_AsMVT(q, {layer}, {extent}, 'geom') AS mvt
+            FROM (
+                SELECT {columns}ST_AsMVTGeom(
+                    ST_Transform(t.{geometry}, {web_mercator}), b.env, {extent}, {buffer}, true
+                ) AS geom
+                FROM {table} t, bounds b
+                WHERE t.{geometry} && b.env_native{partition_filter}
+            ) q
+            """
+        ).format(
+            layer=sql.Literal(table_name),
+            extent=sql.Literal(self.extent),
+            buffer=sql.Literal(self.buffer),
+            columns=columns,
+            geometry=geometry,
+            web_mercator=sql.Literal(WEB_MERCATOR_SRID),
+            table=sql.Identifier(self.schema, table_name),
+            partition_filter=self._partition_filter(table_name, partition_keys),
+        )
+
+    def tile_query(self, z=None):
+        """
+        Build (once per table list and zoom band) the single query returning every layer of a tile.
+        """
+        tables = self.tables()
+        band = None if z is None else self.zoom_band(z)
+        with self._lock:
+            if band not in self._queries:
+                layers = []
+                for name, attributes, partition_keys, generalized in tables:
+                    column = None
+                    if band is not None and generalized_column(self.geometry_column, *band) in generalized:
+                        column = generalized_column(self.geometry_column, *band)
+                    layers.append(self._layer_query(name, attributes, partition_keys, geometry_column=column))
+                self._queries[band] = sql.SQL(
+                    """
+                    WITH bounds AS (
+                        SELECT ST_TileEnvelope(%(z)s, %(x)s, %(y)s) AS env,
+                               ST_Transform(ST_TileEnvelope(%(z)s, %(x)s, %(y)s, margin => {margin}), {srid})
+                                   AS env_native
+                    )
+                    SELECT string_agg(mvt, ''::bytea) FROM ({layers}) layers
+                    """
+                ).format(srid=sql.Literal(self.srid), margin=sql.Literal(self.buffer / self.extent),
+                         layers=sql.SQL(" UNION ALL ").join(layers))
+            return self._queries[band]
+
+    def get_tile(self, z, x, y, compress=True):
+        """
+        Render one tile with all layers.
+
+        Args:
+            z, x, y (int): Tile address.
+            compress (bool): Gzip the tile bytes.
+
+        Returns:
+            bytes: MVT bytes (gzip-compressed when `compress` is set), b"" for an empty tile.
+        """
+        if not self.tables():
+            return b""
+        with self.pool.connection() as conn:
+            row = conn.execute(self.tile_query(z), {"z": z, "x": x, "y": y}, prepare=True).fetchone()
+        data = bytes(row[0]) if row and row[0] else b""
+        if compress and data:
+            return gzip.compress(data)
+        return data
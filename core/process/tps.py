@@ -0,0 +1,372 @@
+# tps.py
+
+import os
+import hashlib
+import logging
+
+import numpy as np
+import pandas as pd
+import shapely
+import geopandas as gpd
+
+# Elements of the (vertices x control points) kernel matrix computed at a time
+TRANSFORM_BATCH_SIZE = 2000000
+
+_MODELS = {}
+
+
+def read_gcps(csv_file):
+    """
+    Read ground control points from a CSV file with source_x, source_y, target_x, target_y columns.
+
+    Returns:
+        tuple: (source, target) arrays of shape (n, 2).
+    """
+    gcps = pd.read_csv(csv_file)
+    missing = {"source_x", "source_y", "target_x", "target_y"} - set(gcps.columns)
+    if missing:
+        raise ValueError(f"Missing GCP columns in {csv_file}: {sorted(missing)}")
+    return (gcps[["source_x", "source_y"]].to_numpy(dtype=float),
+            gcps[["target_x", "target_y"]].to_numpy(dtype=float))
+
+
+def _kernel(r2):
+    # U(r) = r^2 log r^2, with U(0) = 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(r2 > 0, r2 * np.log(r2), 0.0)
+
+
+def _squared_distances(a, b):
+    # |a|^2 + |b|^2 - 2ab, without an (m, n, 2) temporary; rounding can dip just below 0
+    d2 = (a ** 2).sum(axis=1)[:, None] + (b ** 2).sum(axis=1)[None, :] - 2 * a @ b.T
+    return np.maximum(d2, 0.0)
+
+
+class ThinPlateSpline:
+    """
+    2D thin-plate spline mapping source coordinates onto target coordinates.
+
+    Coordinates are centred and scaled before fitting, so the linear system stays well
+    conditioned with projected coordinates in the millions. With no regularization the spline
+    interpolates the control points exactly, like `ogr2ogr -tps`.
+
+    Args:
+        source (array): (n, 2) control point coordinates in the input data.
+        target (array): (n, 2) coordinates the control points map to.
+        regularization (float): Smoothing weight (0 interpolates exactly).
+    """
+
+    def __init__(self, source, target, regularization=0.0):
+        source = np.asarray(source, dtype=float)
+        target = np.asarray(target, dtype=float)
+        if source.shape != target.shape or source.ndim != 2 or source.shape[1] != 2:
+            raise ValueError("Source and target control points must both be (n, 2) arrays.")
+        if len(source) < 3:
+            raise ValueError("A thin-plate spline needs at least 3 control points.")
+
+        self.center = source.mean(axis=0)
+        self.scale = max(np.abs(source - self.center).max(), 1e-12)
+        self.control = (source - self.center) / self.scale
+
+        n = len(source)
+        p = np.hstack([np.ones((n, 1)), self.control])
+        system = np.zeros((n + 3, n + 3))
+        system[:n, :n] = _kernel(_squared_distances(self.control, self.control)) + regularization * np.eye(n)
+        system[:n, n:] = p
+        system[n:, :n] = p.T
+        rhs = np.zeros((n + 3, 2))
+        rhs[:n] = target
+        coefficients = np.linalg.solve(system, rhs)
+        self.weights, self.affine = coefficients[:n], coefficients[n:]
+
+    @classmethod
+    def from_coefficients(cls, center, scale, control, weights, affine):
+        model = cls.__new__(cls)
+        model.center, model.scale, model.control = center, float(scale), control
+        model.weights, model.affine = weights, affine
+        return model
+
+    def save(self, path):
+        np.savez(path, center=self.center, scale=self.scale, control=self.control,
+                 weights=self.weights, affine=self.affine)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls.from_coefficients(data["center"], data["scale"], data["control"], data["weights"],
+                                         data["affine"])
+
+    def __call__(self, coords):
+        """
+        Transform an (m, 2) array of coordinates (extra dimensions, e.g. Z, are kept).
+        """
+        coords = np.asarray(coords, dtype=float)
+        result = coords.copy()
+        batch = max(TRANSFORM_BATCH_SIZE // len(self.control), 1)
+        for start in range(0, len(coords), batch):
+            points = (coords[start:start + batch, :2] - self.center) / self.scale
+            kernel = _kernel(_squared_distances(points, self.control))
+            result[start:start + batch, :2] = (
+                self.affine[0] + points @ self.affine[1:] + kernel @ self.weights
+            )
+        return result
+
+
+def gcp_digest(source, target, offset=(0.0, 0.0), regularization=0.0):
+    """
+    Key of a fitted model: a hash of the control points and fitting options.
+    """
+    digest = hashlib.sha1()
+    for array in (source, target, offset, [regularization]):
+        digest.update(np.ascontiguousarray(array, dtype=float).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def fit_tps(source, target, offset=(0.0, 0.0), regularization=0.0, cache_dir=None):
+    """
+    Fit (or fetch from cache) the spline of a GCP set, with a residual translation folded in.
+
+    Adding `offset` to the targets is exact: the affine part of the spline absorbs the
+    translation, so warping with the returned model equals warping then translating by
+    `offset`. Fitted models are kept in memory and, with `cache_dir`, saved as .npz files.
+
+    Args:
+        source (array): (n, 2) control point coordinates in the input data.
+        target (array): (n, 2) coordinates the control points map to.
+        offset (tuple): (dx, dy) translation applied after the spline.
+        regularization (float): Smoothing weight (0 interpolates exactly).
+        cache_dir (str): Folder of persisted coefficients (optional).
+
+    Returns:
+        ThinPlateSpline: Fitted model.
+    """
+    key = gcp_digest(source, target, offset, regularization)
+    model = _MODELS.get(key)
+    if model is not None:
+        return model
+    path = os.path.join(cache_dir, f"tps_{key}.npz") if cache_dir else None
+    if path and os.path.exists(path):
+        model = ThinPlateSpline.load(path)
+        logging.info(f"Loaded TPS coefficients from {path}")
+    else:
+        model = ThinPlateSpline(source, np.asarray(target, dtype=float) + np.asarray(offset, dtype=float),
+                                regularization=regularization)
+        if path:
+            os.makedirs(cache_dir, exist_ok=True)
+            model.save(path)
+    _MODELS[key] = model
+    return model
+
+
+class DisplacementGrid:
+    """
+    Tiled transformation: displacements precomputed at the nodes of a regular grid.
+
+    A vertex is moved by the bilinear interpolation of the displacements at the four nodes of
+    its cell, so the cost per vertex is constant whatever the number of GCPs, and neighbouring
+    cells blend continuously along their shared edges. Vertices outside the grid take the
+    displacement of the nearest edge.
+
+    Args:
+        origin (tuple): (x, y) of the lower-left node.
+        cell_size (float): Spacing of the nodes, in CRS units.
+        displacement (array): (rows, columns, 2) displacement at each node.
+    """
+
+    def __init__(self, origin, cell_size, displacement):
+        self.origin = np.asarray(origin, dtype=float)
+        self.cell_size = float(cell_size)
+        self.displacement = np.asarray(displacement, dtype=float)
+        if self.displacement.ndim != 3 or self.displacement.shape[2] != 2 or min(self.displacement.shape[:2]) < 2:
+            raise ValueError("The displacement grid must be a (rows, columns, 2) array of at least 2 x 2 nodes.")
+
+    @staticmethod
+    def nodes(bounds, cell_size):
+        """
+        Origin and (rows, columns, 2) node coordinates of a grid covering (minx, miny, maxx, maxy).
+        """
+        minx, miny, maxx, maxy = bounds
+        columns = max(int(np.ceil((maxx - minx) / cell_size)), 1) + 1
+        rows = max(int(np.ceil((maxy - miny) / cell_size)), 1) + 1
+        xs = minx + cell_size * np.arange(columns)
+        ys = miny + cell_size * np.arange(rows)
+        return (minx, miny), np.stack(np.meshgrid(xs, ys), axis=2)
+
+    @classmethod
+    def from_model(cls, model, bounds, cell_size):
+        """
+        Sample a transformation (e.g. a ThinPlateSpline) at the grid nodes, in one call: the
+        model is expected to bound its own memory (ThinPlateSpline batches by GCP count).
+        """
+        origin, nodes = cls.nodes(bounds, cell_size)
+        points = nodes.reshape(-1, 2)
+        return cls(origin, cell_size, (model(points) - points).reshape(nodes.shape))
+
+    @classmethod
+    def from_local_affine(cls, source, target, bounds, cell_size, radius=None, stiffness=1e-3):
+        """
+        Fit a weighted affine transform of the GCPs at each node and keep its displacement there.
+
+        GCP weights fall off as a Gaussian of the distance to the node (`radius` defaults to two
+        cells). Each local fit is pulled towards the global affine fit by `stiffness`, so nodes
+        far from any GCP fall back to the global transform instead of becoming degenerate.
+        """
+        source = np.asarray(source, dtype=float)
+        target = np.asarray(target, dtype=float)
+        radius = radius or 2 * cell_size
+        origin, nodes = cls.nodes(bounds, cell_size)
+        points = nodes.reshape(-1, 2)
+
+        # Work in coordinates centred on the GCPs and scaled by the radius, for conditioning
+        center = source.mean(axis=0)
+        design = np.hstack([(source - center) / radius, np.ones((len(source), 1))])
+        offsets = target - source
+        global_fit, *_ = np.linalg.lstsq(design, offsets, rcond=None)
+        ridge = stiffness * len(source) * np.eye(3)
+
+        displacement = np.empty_like(points)
+        batch = max(TRANSFORM_BATCH_SIZE // len(source), 1)
+        for start in range(0, len(points), batch):
+            local = (points[start:start + batch] - center) / radius
+            weights = np.exp(-_squared_distances(local, design[:, :2]))
+            normal = np.einsum("mn,ni,nj->mij", weights, design, design) + ridge
+            rhs = np.einsum("mn,ni,nd->mid", weights, design, offsets) + ridge @ global_fit
+            fits = np.linalg.solve(normal, rhs)
+            displacement[start:start + batch] = np.einsum("mi,mid->md", np.hstack([local, np.ones((len(local), 1))]), fits)
+        return cls(origin, cell_size, displacement.reshape(nodes.shape))
+
+    def save(self, path):
+        np.savez(path, origin=self.origin, cell_size=self.cell_size, displacement=self.displacement)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["origin"], data["cell_size"], data["displacement"])
+
+    def __call__(self, coords):
+        """
+        Transform an (m, 2) array of coordinates (extra dimensions, e.g. Z, are kept).
+        """
+        coords = np.asarray(coords, dtype=float)
+        rows, columns = self.displacement.shape[:2]
+        grid = (coords[:, :2] - self.origin) / self.cell_size
+        grid[:, 0] = np.clip(grid[:, 0], 0, columns - 1)
+        grid[:, 1] = np.clip(grid[:, 1], 0, rows - 1)
+        cell = np.minimum(grid.astype(np.int64), [columns - 2, rows - 2])
+        fx, fy = (grid - cell).T
+        i, j = cell[:, 1], cell[:, 0]
+        d = self.displacement
+        shift = ((d[i, j] * (1 - fx)[:, None] + d[i, j + 1] * fx[:, None]) * (1 - fy)[:, None]
+                 + (d[i + 1, j] * (1 - fx)[:, None] + d[i + 1, j + 1] * fx[:, None]) * fy[:, None])
+        result = coords.copy()
+        result[:, :2] += shift
+        return result
+
+
+def fit_grid(source, target, bounds, cell_size, offset=(0.0, 0.0), method="tps", regularization=0.0, radius=None,
+             cache_dir=None):
+    """
+    Fit (or fetch from cache) the displacement grid of a GCP set over `bounds`.
+
+    With method "tps" the grid samples the thin-plate spline of the GCPs, which is then only
+    evaluated once per node; with "affine" each node gets a local weighted affine fit, which
+    stays accurate far from the GCPs where a single spline bends. The offset is folded into
+    the targets, as in `fit_tps`.
+
+    Building the grid costs (nodes x GCPs), evaluated in batches of TRANSFORM_BATCH_SIZE kernel
+    elements; only applying it is independent of the GCP count. Keep GCP sets to a few hundred
+    points (see `gcp.extract_gcps(max_gcps=...)`) and cache the grid with `cache_dir`.
+
+    Args:
+        source (array): (n, 2) control point coordinates in the input data.
+        target (array): (n, 2) coordinates the control points map to.
+        bounds (tuple): (minx, miny, maxx, maxy) area covered by the grid.
+        cell_size (float): Node spacing, in CRS units.
+        offset (tuple): (dx, dy) translation applied after the transformation.
+        method (str): "tps" or "affine".
+        regularization (float): TPS smoothing weight (method "tps").
+        radius (float): Gaussian radius of the local fits (method "affine", default two cells).
+        cache_dir (str): Folder of persisted grids (optional).
+
+    Returns:
+        DisplacementGrid: Fitted model.
+    """
+    if method not in ("tps", "affine"):
+        raise ValueError(f"Unknown grid method: {method}")
+    key = gcp_digest(source, target, offset, regularization) + hashlib.sha1(
+        np.asarray([*bounds, cell_size, radius or 0], dtype=float).tobytes() + method.encode()
+    ).hexdigest()[:8]
+    model = _MODELS.get(key)
+    if model is not None:
+        return model
+    path = os.path.join(cache_dir, f"grid_{key}.npz") if cache_dir else None
+    if path and os.path.exists(path):
+        model = DisplacementGrid.load(path)
+        logging.info(f"Loaded displacement grid from {path}")
+    else:
+        if method == "tps":
+            spline = fit_tps(source, target, offset=offset, regularization=regularization)
+            model = DisplacementGrid.from_model(spline, bounds, cell_size)
+        else:
+            shifted = np.asarray(target, dtype=float) + np.asarray(offset, dtype=float)
+            model = DisplacementGrid.from_local_affine(source, shifted, bounds, cell_size, radius=radius)
+        if path:
+            os.makedirs(cache_dir, exist_ok=True)
+            model.save(path)
+    _MODELS[key] = model
+    return model
+
+
+def warp_geometries(geometries, model):
+    """
+    Warp every vertex of an array of geometries in a single vectorized call.
+    """
+    return shapely.transform(np.asarray(geometries), model, include_z=False)
+
+
+def warp_file(input_path, output_path, csv_file, offset=(0.0, 0.0), crs="EPSG:2154", regularization=0.0,
+              cache_dir=None, grid_cell_size=None, grid_method="tps"):
+    """
+    Warp a vector file with the TPS of a GCP file and write the result once.
+
+    Replaces `ogr2ogr -gcp ... -tps` followed by an `ST_Translate` pass: the translation is
+    part of the model, so the data is read and written a single time. With `grid_cell_size`
+    the vertices are moved through a displacement grid over the data extent instead of the
+    spline itself (see `fit_grid`).
+
+    Args:
+        input_path (str): Input vector file.
+        output_path (str): Output vector file (driver from the extension).
+        csv_file (str): GCP file (source_x, source_y, target_x, target_y).
+        offset (tuple): (dx, dy) residual translation folded into the model.
+        crs (str): CRS of the GCPs and of the output. Input in another CRS is reprojected to it
+            before warping; input without a CRS is assumed to be in it.
+        regularization (float): Smoothing weight (0 interpolates exactly).
+        cache_dir (str): Folder of persisted coefficients (optional).
+        grid_cell_size (float): Node spacing of a displacement grid (None warps with the spline directly).
+        grid_method (str): "tps" or "affine" displacement grid.
+
+    Returns:
+        GeoDataFrame: Warped data.
+    """
+    source, target = read_gcps(csv_file)
+    gdf = gpd.read_file(input_path)
+    if gdf.crs is None:
+        logging.warning(f"{input_path} has no CRS; assuming it is {crs}.")
+        gdf = gdf.set_crs(crs)
+    elif not gdf.crs.equals(crs):
+        logging.info(f"Reprojecting {input_path} from {gdf.crs.to_string()} to {crs} before warping.")
+        gdf = gdf.to_crs(crs)
+    if grid_cell_size:
+        model = fit_grid(source, target, gdf.total_bounds, grid_cell_size, offset=offset, method=grid_method,
+                         regularization=regularization, cache_dir=cache_dir)
+    else:
+        model = fit_tps(source, target, offset=offset, regularization=regularization, cache_dir=cache_dir)
+    warped = gpd.GeoDataFrame(
+        gdf.drop(columns=gdf.geometry.name),
+        geometry=warp_geometries(gdf.geometry.values, model),
+        crs=crs,
+    )
+    warped.to_file(output_path)
+    logging.info(f"Warped {len(warped)} features from {input_path} with {len(source)} GCPs into {output_path}")
+    return warped
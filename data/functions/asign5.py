@@ -1,12 +1,18 @@
 import geopandas as gpd
 import os
+import sys
 import time
 from datetime import timedelta
 import multiprocessing as mp
 from functools import partial
+import argparse
 import numpy as np
 import pandas as pd
 
+# The shared pipeline modules are the core.process package at the repository root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from core.process.progress import ProgressReporter
+
 def format_time(seconds):
     """Format seconds into a readable time string"""
     return str(timedelta(seconds=seconds))
@@ -86,13 +92,19 @@ def process_chunk(roof_indices, roofs_gdf, address_gdf):
 
 if __name__ == "__main__":
     # Input/output file paths
-    roofs_shp = "/home/mahdi/interface/data/output/divide/roofs_divided_by_parcelles.shp"
-    address_shp = "/home/mahdi/interface/data/raw/pq2/adresse.shp"
-    output_shp = "/home/mahdi/interface/data/output/asign/roofs_with_addresses.shp"
+    parser = argparse.ArgumentParser(description="Assign the nearest address to each roof")
+    parser.add_argument("--roofs", default="/home/mahdi/interface/data/output/divide/roofs_divided_by_parcelles.shp")
+    parser.add_argument("--addresses", default="/home/mahdi/interface/data/raw/pq2/adresse.shp")
+    parser.add_argument("--output", default="/home/mahdi/interface/data/output/asign/roofs_with_addresses.shp")
+    parser.add_argument("--processes", type=int, default=max(1, mp.cpu_count() // 2))
+    args = parser.parse_args()
+    roofs_shp, address_shp, output_shp = args.roofs, args.addresses, args.output
     
     # Multiprocessing setup
-    num_processes = max(1, mp.cpu_count() // 2)
+    num_processes = args.processes
     total_start_time = time.time()
+    progress = ProgressReporter()
+    progress.stage("read")
     
     print(f"Starting processing with {num_processes} parallel processes")
     print("Using nearest neighbor approach (no parcels)")
@@ -131,6 +143,7 @@ if __name__ == "__main__":
     chunks = [roof_indices[i:i + chunk_size] for i in range(0, len(roof_indices), chunk_size)]
     
     print(f"Processing {len(roof_indices)} roofs in {len(chunks)} chunks using {num_processes} processes")
+    progress.stage("nearest_address", chunks_total=len(chunks))
     
     with mp.Pool(processes=num_processes) as pool:
         chunk_processor = partial(
@@ -142,6 +155,7 @@ if __name__ == "__main__":
         results = []
         for i, chunk_result in enumerate(pool.imap_unordered(chunk_processor, chunks)):
             results.extend(chunk_result)
+            progress.advance(features=len(chunk_result))
             if (i+1) % max(1, len(chunks) // 10) == 0:
                 print(f"Progress: {i+1}/{len(chunks)} chunks processed ({(i+1)/len(chunks)*100:.1f}%)")
     
@@ -161,7 +175,9 @@ if __name__ == "__main__":
     
     # Save output
     print(f"Saving output to {output_shp}...")
+    progress.stage("save")
     output_gdf.to_file(output_shp)
+    progress.done(features=len(output_gdf))
     
     # Execution summary
     total_time = time.time() - total_start_time
@@ -7,9 +7,11 @@ import time
 import tempfile
 from pathlib import Path
 import os
+import sys
 import psutil  # For memory monitoring
 import signal
 import shutil  # For copying failed chunk files
+import argparse
 
 # Geospatial library imports
 import geopandas as gpd
@@ -19,6 +21,10 @@ from shapely.geometry import GeometryCollection
 import fiona
 import warnings
 
+# The shared pipeline modules are the core.process package at the repository root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from core.process.progress import ProgressReporter
+
 # Suppress UserWarnings related to keep_geom_type
 warnings.filterwarnings("ignore", category=UserWarning, message="`keep_geom_type=True` in overlay resulted in.*")
 
@@ -183,8 +189,10 @@ def divide_roofs_by_parcelles(divided_roofs_path, parcelles_path, output_path, f
         failed_chunks_dir: Directory to save failed chunks for later processing
         num_processes: Number of processes to use for parallel processing
     """
+    progress = ProgressReporter()
     try:
         start_time = time.time()
+        progress.stage("load")
 
         # Create failed chunks directory if it doesn't exist
         Path(failed_chunks_dir).mkdir(parents=True, exist_ok=True)
@@ -240,10 +248,12 @@ def divide_roofs_by_parcelles(divided_roofs_path, parcelles_path, output_path, f
             print("Saving chunks to temporary files...")
             save_start = time.time()
             temp_files = []
+            chunk_sizes = {}
             for i, chunk in enumerate(divided_roofs_chunks):
                 try:
                     temp_file = save_chunk_to_file(chunk, temp_dir, i)
                     temp_files.append(temp_file)
+                    chunk_sizes[temp_file] = len(chunk)
                     if (i + 1) % 10 == 0:
                         print(f"Saved {i + 1}/{len(divided_roofs_chunks)} chunks...")
                 except Exception as e:
@@ -262,6 +272,7 @@ def divide_roofs_by_parcelles(divided_roofs_path, parcelles_path, output_path, f
             # Step 7: Perform the intersection in parallel
             print(f"Performing intersection using {num_processes} cores...")
             intersection_start = time.time()
+            progress.stage("intersection", chunks_total=len(temp_files))
             results = []
             with mp.Pool(num_processes) as pool:
                 for i, temp_file in enumerate(temp_files):
@@ -286,6 +297,7 @@ def divide_roofs_by_parcelles(divided_roofs_path, parcelles_path, output_path, f
                         print(f"Error getting result for chunk {i+1}: {e}")
                         failed_chunks.append((i, temp_file))
                         processed_results.append(gpd.GeoDataFrame(geometry=[]))
+                    progress.advance(features=chunk_sizes[temp_file])
             
             intersection_end = time.time()
             print(f"Intersection completed in {intersection_end - intersection_start:.2f} seconds.")
@@ -333,11 +345,13 @@ def divide_roofs_by_parcelles(divided_roofs_path, parcelles_path, output_path, f
             combine_start = time.time()
             if all(len(r) == 0 for r in processed_results):
                 print("Error: All result chunks are empty. No intersections found.")
+                progress.fail("All result chunks are empty")
                 return
 
             non_empty_results = [r for r in processed_results if len(r) > 0]
             if len(non_empty_results) == 0:
                 print("Error: No non-empty results found.")
+                progress.fail("No non-empty results found")
                 return
 
             print(f"Concatenating {len(non_empty_results)} non-empty chunks...")
@@ -355,6 +369,7 @@ def divide_roofs_by_parcelles(divided_roofs_path, parcelles_path, output_path, f
             output_dir.mkdir(parents=True, exist_ok=True)
 
         print(f"Saving result to {output_path}...")
+        progress.stage("save")
         save_start = time.time()
         # Ensure result has proper column types
         for col in result.columns:
@@ -378,23 +393,28 @@ def divide_roofs_by_parcelles(divided_roofs_path, parcelles_path, output_path, f
         print(f"Successfully processed: {len(non_empty_results)} chunks")
         print(f"Failed chunks: {len(failed_chunks)} (saved to {failed_chunks_dir})")
         print("Division completed.")
+        progress.done(features=len(result), failed_chunks=len(failed_chunks))
     except Exception as e:
         print(f"An error occurred: {e}")
+        progress.fail(e)
         import traceback
         traceback.print_exc()
 
 
 if __name__ == "__main__":
-    divided_roofs_path = "/home/mahdi/interface/data/output/divide/filtered_roofs/filtered.shp"
-    parcelles_path = "/home/mahdi/interface/data/raw/pq2/PARCELLE.SHP"
-    output_path = "/home/mahdi/interface/data/output/divide/roofs_divided_by_parcelles61.shp"
-    failed_chunks_dir = "/home/mahdi/interface/data/output/divide/failed"
-    
+    parser = argparse.ArgumentParser(description="Divide roofs by cadastral parcels")
+    parser.add_argument("--roofs", default="/home/mahdi/interface/data/output/divide/filtered_roofs/filtered.shp")
+    parser.add_argument("--parcelles", default="/home/mahdi/interface/data/raw/pq2/PARCELLE.SHP")
+    parser.add_argument("--output", default="/home/mahdi/interface/data/output/divide/roofs_divided_by_parcelles61.shp")
+    parser.add_argument("--failed-dir", default="/home/mahdi/interface/data/output/divide/failed")
+    parser.add_argument("--processes", type=int, default=4)  # Adjust based on your system capabilities
+    args = parser.parse_args()
+
     # Run the division process with multiprocessing
     divide_roofs_by_parcelles(
-        divided_roofs_path,
-        parcelles_path,
-        output_path,
-        failed_chunks_dir,
-        num_processes=4  # Adjust based on your system capabilities
-    )
\ No newline at end of file
+        args.roofs,
+        args.parcelles,
+        args.output,
+        args.failed_dir,
+        num_processes=args.processes
+    )
@@ -1,8 +1,15 @@
 import geopandas as gpd
-from sqlalchemy import create_engine
-import psycopg2
 import os
+import sys
 import logging
+from functools import partial
+
+# The shared pipeline modules are the core.process package at the repository root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from core.process.fgb import write_indexed_flatgeobuf
+from core.process.incremental import write_changed_communes
+from core.process.tile_service import PostGISTileService
+from core.process.pgload import copy_to_partitioned, copy_to_postgis, upload_communes, upload_tables
 
 # Configure logging
 logging.basicConfig(
@@ -56,14 +63,19 @@ def round_numeric_columns(gdf, columns_to_round={'surface_ut': 2, 'production':
     return gdf
 
 
-def split_by_attribute(gdf, attribute="nom", output_folder="split_data"):
+def split_by_attribute(gdf, attribute="nom", output_folder="split_data", columns=None, incremental=False):
     """
     Split a GeoDataFrame into smaller subsets based on the specified attribute.
 
+    Each subset is written Hilbert-sorted with a packed R-tree index so that
+    bbox queries over HTTP only fetch the index nodes and features they need.
+
     Parameters:
         gdf (GeoDataFrame): Input GeoDataFrame.
         attribute (str): Attribute to split the data by.
         output_folder (str): Folder to save the output files.
+        columns (list): Attributes to keep in each output (all attributes when None).
+        incremental (bool): Only rewrite the files of communes whose features changed.
 
     Returns:
         list: List of paths to the exported FlatGeobuf files.
@@ -71,13 +83,18 @@ def split_by_attribute(gdf, attribute="nom", output_folder="split_data"):
     if attribute not in gdf.columns:
         raise ValueError(f"Attribute '{attribute}' not found in the dataset.")
 
+    if incremental:
+        fgb_paths, rewritten = write_changed_communes(gdf, output_folder, attribute=attribute, columns=columns)
+        print(f"Data split into {len(fgb_paths)} subsets based on '{attribute}' ({len(rewritten)} rewritten).")
+        return fgb_paths
+
     os.makedirs(output_folder, exist_ok=True)
     fgb_paths = []
 
     for nom_value, subset_gdf in gdf.groupby(attribute):
-        # Export subset to FlatGeobuf
+        # Export subset to an indexed FlatGeobuf
         fgb_path = os.path.join(output_folder, f"{nom_value}.fgb")
-        subset_gdf.to_file(fgb_path, driver="FlatGeobuf")
+        write_indexed_flatgeobuf(subset_gdf, fgb_path, columns=columns)
         fgb_paths.append(fgb_path)
 
     print(f"Data split into {len(fgb_paths)} subsets based on '{attribute}'.")
@@ -88,98 +105,90 @@ def upload_to_postgis(gdf, table_name, connection_string, schema="public"):
     """
     Upload a GeoDataFrame to PostGIS.
 
+    Rows are streamed with binary COPY into a staging table that replaces the
+    target table atomically once it is indexed and analyzed.
+
     Parameters:
         gdf (GeoDataFrame): Input GeoDataFrame.
         table_name (str): Name of the table in PostGIS.
         connection_string (str): Connection string for PostGIS.
         schema (str): Schema name in PostGIS.
     """
-    engine = create_engine(connection_string)
-    gdf.to_postgis(
-        name=table_name,
-        con=engine,
-        schema=schema,
-        if_exists="replace",
-        index=False,
-        dtype={"geometry": "Geometry"}
-    )
+    copy_to_postgis(gdf, table_name, connection_string=connection_string, schema=schema)
     print(f"Uploaded data to PostGIS table: {schema}.{table_name}")
 
 
-def upload_split_data_to_postgis(fgb_paths, connection_string, schema="public"):
+def upload_split_data_to_postgis(fgb_paths, connection_string, schema="public", max_workers=4):
     """
     Upload split data to PostGIS.
 
+    Files are read and loaded concurrently by a bounded worker pool sharing one connection pool.
+
     Parameters:
         fgb_paths (list): List of paths to FlatGeobuf files.
         connection_string (str): Connection string for PostGIS.
         schema (str): Schema name in PostGIS.
+        max_workers (int): Number of concurrent uploads.
+
+    Returns:
+        dict: Per-table upload statistics.
+    """
+    tables = [
+        (os.path.splitext(os.path.basename(fgb_path))[0], partial(gpd.read_file, fgb_path))
+        for fgb_path in fgb_paths
+    ]
+    return upload_tables(tables, connection_string=connection_string, schema=schema, max_workers=max_workers)
+
+
+# One pooled tile service per (connection string, schema), shared by all tile requests
+_tile_services = {}
+
+
+def get_tile_service(connection_string, schema="public"):
     """
-    for fgb_path in fgb_paths:
-        # Read FlatGeobuf file
-        subset_gdf = gpd.read_file(fgb_path)
+    Return the shared tile service for a database and schema, creating it on first use.
 
-        # Derive table name from the filename
-        table_name = os.path.splitext(os.path.basename(fgb_path))[0]
+    Parameters:
+        connection_string (str): Connection string for PostGIS.
+        schema (str): Schema name in PostGIS.
 
-        # Upload to PostGIS
-        upload_to_postgis(subset_gdf, table_name, connection_string, schema)
+    Returns:
+        PostGISTileService: Service holding the connection pool and the cached table list.
+    """
+    key = (connection_string, schema)
+    if key not in _tile_services:
+        _tile_services[key] = PostGISTileService(connection_string, schema=schema)
+    return _tile_services[key]
 
 
-def generate_vector_tiles_from_postgis(zoom, x, y, connection_string, schema="public"):
+def generate_vector_tiles_from_postgis(zoom, x, y, connection_string, schema="public", compress=True):
     """
     Generate vector tiles from PostGIS for a specific zoom level and tile.
 
+    All tables of the schema are emitted as layers of one tile by a single prepared
+    ST_AsMVT query, run on a pooled connection.
+
     Parameters:
         zoom (int): Zoom level.
         x (int): X coordinate of the tile.
         y (int): Y coordinate of the tile.
         connection_string (str): Connection string for PostGIS.
         schema (str): Schema name in PostGIS.
+        compress (bool): Gzip the tile bytes.
 
     Returns:
         bytes: Binary MVT data for the specified tile.
     """
     try:
-        conn = psycopg2.connect(connection_string)
-        cursor = conn.cursor()
-
-        # Get all table names in the schema
-        cursor.execute(f"""
-            SELECT table_name
-            FROM information_schema.tables
-            WHERE table_schema = %s AND table_type = 'BASE TABLE';
-        """, (schema,))
-        table_names = [row[0] for row in cursor.fetchall()]
-
-        mvt_data = b""
-
-        for table_name in table_names:
-            # Generate MVT for each table
-            cursor.execute(f"""
-                SELECT ST_AsMVT(q, %s, 4096, 'geom')
-                FROM (
-                    SELECT id, PROD_EURO, ST_AsMVTGeom(geometry, TileBBox(%s, %s, %s, 4096)) AS geom
-                    FROM {schema}.%s
-                    WHERE ST_Intersects(geometry, TileBBox(%s, %s, %s, 4096))
-                ) q;
-            """, (table_name, zoom, x, y, table_name, zoom, x, y))
-
-            tile_data = cursor.fetchone()[0]
-            if tile_data:
-                mvt_data += tile_data
-
-        cursor.close()
-        conn.close()
-
-        return mvt_data
+        return get_tile_service(connection_string, schema).get_tile(zoom, x, y, compress=compress)
 
     except Exception as e:
         logging.error(f"An error occurred while generating vector tiles: {e}")
         return None
 
 
-def convert_shapefile_to_postgis_tiles(input_shapefile, output_folder, connection_string, schema="public", attribute="nom"):
+def convert_shapefile_to_postgis_tiles(input_shapefile, output_folder, connection_string, schema="public", attribute="nom",
+                                       partition_columns=None, table_name="aligned_roofs"):
     """
     Converts a shapefile to vector tiles using PostGIS.
 
@@ -189,6 +198,9 @@ def convert_shapefile_to_postgis_tiles(input_shapefile, output_folder, connectio
         connection_string (str): Connection string for PostGIS.
         schema (str): Schema name in PostGIS.
         attribute (str): Attribute to split the data by.
+        partition_columns (list): Load everything into one table LIST-partitioned on these columns
+            (e.g. ["nom"] or ["CODE_DEP", "nom"]) instead of one table per commune.
+        table_name (str): Name of the partitioned table.
     """
     try:
         print("Reading shapefile...")
@@ -222,9 +234,18 @@ def convert_shapefile_to_postgis_tiles(input_shapefile, output_folder, connectio
         print(f"Splitting data by attribute '{attribute}'...")
         fgb_paths = split_by_attribute(gdf, attribute=attribute, output_folder=output_folder)
 
-        # Step 6: Upload split data to PostGIS
+        # Step 6: Upload split data to PostGIS straight from memory
+        if partition_columns:
+            print(f"Uploading data to the partitioned table {schema}.{table_name}...")
+            copy_to_partitioned(gdf, table_name, partition_columns, connection_string=connection_string, schema=schema)
+            print("Data uploaded to PostGIS successfully.")
+            return
+
         print("Uploading split data to PostGIS...")
-        upload_split_data_to_postgis(fgb_paths, connection_string, schema)
+        results = upload_communes(gdf, attribute, connection_string=connection_string, schema=schema)
+        failed = [table for table, stats in results.items() if "error" in stats]
+        if failed:
+            logging.error(f"{len(failed)} tables failed to upload: {failed}")
 
         print("Data uploaded to PostGIS successfully.")
 
@@ -234,7 +255,7 @@ def convert_shapefile_to_postgis_tiles(input_shapefile, output_folder, connectio
 
 if __name__ == "__main__":
 
-    from utils import check_dependencies
+    from core.process.utils import check_dependencies
     check_dependencies()
     # Example usage
     input_shapefile = "/home/mahdi/interface/data/output/aligned_results_20250219_165037.shp"  # Replace with your shapefile path
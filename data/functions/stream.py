@@ -1,15 +1,18 @@
-import pandas as pd
 import geopandas as gpd
-from shapely import geometry
-from shapely.ops import unary_union
+from shapely import geometry, wkt
 import mercantile
-from tqdm import tqdm
 import os
-import tempfile
+import sys
 import streamlit as st
 from streamlit_folium import st_folium
 import folium
-import matplotlib.pyplot as plt
+from folium.plugins import VectorGridProtobuf
+
+# The shared pipeline modules are the core.process package at the repository root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from core.process.footprints import DatasetLinksCatalog, aoi_clipper, download_footprints
+from core.process.mvt import build_mbtiles
+from core.process.tile_server import MBTilesServer
 
 # Define AOI geometry
 aoi_geom = {
@@ -25,78 +28,86 @@ aoi_geom = {
     "type": "Polygon",
 }
 aoi_shape = geometry.shape(aoi_geom)
-minx, miny, maxx, maxy = aoi_shape.bounds
-
-output_fn = "example_building_footprints.geojson"
-quad_keys = set()
-
-# Get tiles intersecting the AOI
-for tile in list(mercantile.tiles(minx, miny, maxx, maxy, zooms=9)):
-    quad_keys.add(mercantile.quadkey(tile))
-quad_keys = list(quad_keys)
-print(f"The input area spans {len(quad_keys)} tiles: {quad_keys}")
-
-# Load dataset links
-df = pd.read_csv(
-    "https://minedbuildings.z5.web.core.windows.net/global-buildings/dataset-links.csv", dtype=str
-)
-
-# Remove duplicate QuadKeys (if any)
-df = df.drop_duplicates(subset="QuadKey", keep="first")
-
-# Process each tile
-idx = 0
-combined_gdf = gpd.GeoDataFrame()
-with tempfile.TemporaryDirectory() as tmpdir:
-    tmp_fns = []
-    for quad_key in tqdm(quad_keys):
-        rows = df[df["QuadKey"] == quad_key]
-        if rows.shape[0] == 1:
-            url = rows.iloc[0]["Url"]
-            print(f"Processing QuadKey {quad_key} with URL: {url}")  # Debugging
-            df2 = pd.read_json(url, lines=True)
-            df2["geometry"] = df2["geometry"].apply(geometry.shape)
-            gdf = gpd.GeoDataFrame(df2, crs=4326)
-            fn = os.path.join(tmpdir, f"{quad_key}.geojson")
-            tmp_fns.append(fn)
-            if not os.path.exists(fn):
-                gdf.to_file(fn, driver="GeoJSON")
-        elif rows.shape[0] > 1:
-            raise ValueError(f"Multiple rows found for QuadKey: {quad_key}")
-        else:
-            raise ValueError(f"QuadKey not found in dataset: {quad_key}")
-
-    # Merge all GeoJSON files into a single GeoDataFrame
-    for fn in tmp_fns:
-        gdf = gpd.read_file(fn)
-        gdf = gdf[gdf.geometry.within(aoi_shape)]
+
+output_fn = "example_building_footprints.parquet"
+mbtiles_fn = "example_building_footprints.mbtiles"
+cache_dir = "footprint_cache"
+min_zoom, max_zoom = 10, 16
+
+
+@st.cache_resource
+def prepare_footprints(aoi_wkt):
+    """
+    Download the AOI footprints to GeoParquet and tile them into MBTiles, once per AOI.
+
+    Returns:
+        tuple: (number of footprints, total bounds).
+    """
+    aoi = wkt.loads(aoi_wkt)
+    quad_keys = set()
+
+    # Get tiles intersecting the AOI
+    for tile in list(mercantile.tiles(*aoi.bounds, zooms=9)):
+        quad_keys.add(mercantile.quadkey(tile))
+    quad_keys = list(quad_keys)
+    print(f"The input area spans {len(quad_keys)} tiles: {quad_keys}")
+
+    # Resolve dataset links from the local catalogue (revalidated with the server once a day)
+    catalog = DatasetLinksCatalog(os.path.join(cache_dir, "dataset-links.sqlite"))
+    links = catalog.links(quad_keys)
+
+    # Keep only the footprints inside the AOI
+    within_aoi = aoi_clipper(aoi)
+
+    def clip_to_aoi(quad_key, gdf):
+        gdf = within_aoi(quad_key, gdf)
         print(f"Downloaded {len(gdf)} geometries for QuadKey {quad_key}.")  # Debugging
-        gdf['id'] = range(idx, idx + len(gdf))
-        idx += len(gdf)
-        combined_gdf = pd.concat([combined_gdf, gdf], ignore_index=True)
-
-# Save the combined GeoDataFrame to a file
-combined_gdf = combined_gdf.to_crs('EPSG:4326')
-combined_gdf.to_file(output_fn, driver='GeoJSON')
-
-# Load the saved GeoJSON file
-try:
-    combined_gdf = gpd.read_file("example_building_footprints.geojson")
-except FileNotFoundError:
-    print("Error: example_building_footprints.geojson not found. Please run the building footprint extraction code first.")
-    exit()
-
-# Check if the GeoDataFrame is empty
-if combined_gdf.empty:
+        return gdf
+
+    # Download all tiles concurrently (cached per quadkey) and append them to one GeoParquet file
+    if os.path.exists(output_fn):
+        os.remove(output_fn)
+    count = download_footprints(quad_keys, links, output_path=output_fn, cache_dir=cache_dir, max_workers=8,
+                                clip=clip_to_aoi)
+    if count == 0:
+        return 0, None
+
+    # Tile the footprints so the map only loads what it shows
+    if os.path.exists(mbtiles_fn):
+        os.remove(mbtiles_fn)
+    build_mbtiles(output_fn, mbtiles_fn, min_zoom=min_zoom, max_zoom=max_zoom, layer_name="buildings", columns=["quadkey"])
+    bounds = gpd.read_parquet(output_fn, columns=["geometry"]).total_bounds
+    return count, bounds
+
+
+@st.cache_resource
+def start_tile_server(path):
+    """
+    Start one local vector tile server per MBTiles file, shared by all sessions and reruns.
+    """
+    server = MBTilesServer(path)
+    server.start()
+    return server
+
+
+count, bounds = prepare_footprints(aoi_shape.wkt)
+
+# Check if any footprint was found
+if count == 0:
     print("No building footprints found within the AOI.")
-    exit()
+    st.warning("No building footprints found within the AOI.")
+    st.stop()
+
+# Each browser session keeps the URL of the tiles it displays
+if "tile_url" not in st.session_state:
+    st.session_state["tile_url"] = start_tile_server(os.path.abspath(mbtiles_fn)).tile_url
 
-# Compute the centroid of the combined geometry
-combined_geometry = unary_union(combined_gdf.geometry)
-center = combined_geometry.centroid
+# Centre the map on the bounds of the footprints
+west, south, east, north = bounds
+center_x, center_y = (west + east) / 2, (south + north) / 2
 
 # Create the Folium map
-m = folium.Map(location=[center.y, center.x], zoom_start=12, tiles=None)
+m = folium.Map(location=[center_y, center_x], zoom_start=14, tiles=None)
 
 # Add Google Earth tile layer
 folium.TileLayer(
@@ -108,24 +119,32 @@ folium.TileLayer(
     show=True,
 ).add_to(m)
 
-# Add building footprints as a GeoJSON layer
-folium.GeoJson(
-    combined_gdf,
+# Add building footprints as vector tiles, fetched for the visible extent only
+VectorGridProtobuf(
+    st.session_state["tile_url"],
     name="buildings",
-    style_function=lambda feature: {
-        'color': 'red',
-        'weight': 2,
-        'fillOpacity': 0.3,
-        'opacity': 0.7
-    }
+    options={
+        "minNativeZoom": min_zoom,
+        "maxNativeZoom": max_zoom,
+        "vectorTileLayerStyles": {
+            "buildings": {
+                "color": "red",
+                "weight": 2,
+                "fill": True,
+                "fillColor": "red",
+                "fillOpacity": 0.3,
+                "opacity": 0.7,
+            }
+        },
+    },
 ).add_to(m)
 
 # Add LayerControl
 folium.LayerControl().add_to(m)
 
-# Save the map to an HTML file
+# Save the map to an HTML file (its tiles are only available while the local tile server runs)
 m.save("building_footprints_map_google_earth.html")
 
 # Display the map using Streamlit
 st_folium(m, width=700, height=500)
-print("Map displayed using Streamlit. HTML version saved to building_footprints_map_google_earth.html")
\ No newline at end of file
+print("Map displayed using Streamlit. HTML version saved to building_footprints_map_google_earth.html")
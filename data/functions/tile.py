@@ -4,10 +4,20 @@ from shapely.ops import unary_union
 from shapely.wkt import loads
 import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
-import numpy as np
 import os
+import sys
 import logging
 import subprocess
+import shutil
+import sqlite3
+from contextlib import closing
+import time
+
+# The shared pipeline modules are the core.process package at the repository root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from core.process.mvt import build_mbtiles
+from core.process.incremental import update_mbtiles
+from core.process.breaks import build_sketches, class_breaks
 
 # Configure logging
 logging.basicConfig(
@@ -61,19 +71,39 @@ def round_numeric_columns(gdf, columns_to_round={'surface_ut': 2, 'production':
     return gdf
 
 
-def generate_vector_tiles(input_fgb, output_mbtiles, max_zoom=14, min_zoom=0):
+def generate_vector_tiles(input_fgb, output_mbtiles, max_zoom=14, min_zoom=0, simplification=10, engine="native", max_workers=None):
     """
     Generate vector tiles (MBTiles) from a FlatGeobuf file.
 
     Parameters:
-        input_fgb (str): Path to the input FlatGeobuf file.
+        input_fgb (str): Path to the input FlatGeobuf (or GeoParquet) file.
         output_mbtiles (str): Path to save the output MBTiles file.
         max_zoom (int): Maximum zoom level for tile generation.
         min_zoom (int): Minimum zoom level for tile generation.
+        simplification (float): Simplification tolerance in tile units (4096 per tile).
+        engine (str): "native" for the in-process builder, "tippecanoe" to shell out.
+        max_workers (int): Number of worker processes for the native builder (all cores when None).
+
+    Returns:
+        dict: Tiles and bytes per zoom level for the native builder, None for tippecanoe.
     """
-    try:
-        print(f"Generating vector tiles from {input_fgb}...")
+    print(f"Generating vector tiles from {input_fgb}...")
+
+    if engine == "native":
+        stats = build_mbtiles(
+            input_fgb, output_mbtiles,
+            min_zoom=min_zoom, max_zoom=max_zoom,
+            simplification=simplification, max_workers=max_workers,
+        )
+        print(f"Vector tiles saved to {output_mbtiles}")
+        return stats
 
+    if engine != "tippecanoe":
+        raise ValueError(f"Unknown tile engine '{engine}'.")
+    if shutil.which("tippecanoe") is None:
+        raise FileNotFoundError("tippecanoe binary not found on PATH; use engine='native'.")
+
+    try:
         # Run tippecanoe to generate MBTiles
         subprocess.run([
             "tippecanoe",
@@ -82,7 +112,7 @@ def generate_vector_tiles(input_fgb, output_mbtiles, max_zoom=14, min_zoom=0):
             "--no-tile-stats",     # Disable tile statistics for faster processing
             "--maximum-zoom", str(max_zoom),
             "--minimum-zoom", str(min_zoom),
-            "--simplification", "10",  # Simplify geometries during tile generation
+            "--simplification", str(simplification),  # Simplify geometries during tile generation
             input_fgb              # Input FlatGeobuf file
         ], check=True)
 
@@ -91,15 +121,77 @@ def generate_vector_tiles(input_fgb, output_mbtiles, max_zoom=14, min_zoom=0):
         logging.error(f"An error occurred while generating vector tiles: {e}")
 
 
-def calculate_gradient_classes(gdf, attribute="PROD_EURO", num_classes=5, colormap="cividis"):
+def summarize_mbtiles(mbtiles_path):
+    """
+    Count tiles and bytes per zoom level in an MBTiles file.
+
+    Parameters:
+        mbtiles_path (str): Path to the MBTiles file.
+
+    Returns:
+        dict: {zoom: {"tiles": count, "bytes": total size}}.
+    """
+    with closing(sqlite3.connect(mbtiles_path)) as conn:
+        rows = conn.execute(
+            "SELECT zoom_level, COUNT(*), SUM(LENGTH(tile_data)) FROM tiles GROUP BY zoom_level ORDER BY zoom_level"
+        ).fetchall()
+    return {z: {"tiles": count, "bytes": size} for z, count, size in rows}
+
+
+def benchmark_tile_builders(input_fgb, output_folder, max_zoom=14, min_zoom=0, simplification=10):
+    """
+    Time the native tile builder against tippecanoe on the same input.
+
+    Parameters:
+        input_fgb (str): Path to the input FlatGeobuf file.
+        output_folder (str): Folder for the benchmark MBTiles files.
+        max_zoom (int): Maximum zoom level.
+        min_zoom (int): Minimum zoom level.
+        simplification (float): Simplification tolerance passed to both builders.
+
+    Returns:
+        dict: Wall time, tile count and size for each available engine.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    engines = ["native"] + (["tippecanoe"] if shutil.which("tippecanoe") else [])
+    results = {}
+
+    for engine in engines:
+        output_mbtiles = os.path.join(output_folder, f"benchmark_{engine}.mbtiles")
+        start = time.perf_counter()
+        generate_vector_tiles(input_fgb, output_mbtiles, max_zoom=max_zoom, min_zoom=min_zoom,
+                              simplification=simplification, engine=engine)
+        elapsed = time.perf_counter() - start
+
+        summary = summarize_mbtiles(output_mbtiles)
+        results[engine] = {
+            "seconds": elapsed,
+            "tiles": sum(z["tiles"] for z in summary.values()),
+            "bytes": sum(z["bytes"] for z in summary.values()),
+        }
+        print(f"{engine}: {elapsed:.2f}s, {results[engine]['tiles']} tiles, {results[engine]['bytes']} bytes")
+
+    if "tippecanoe" not in results:
+        logging.warning("tippecanoe not found on PATH; only the native builder was benchmarked.")
+    return results
+
+
+def calculate_gradient_classes(gdf, attribute="PROD_EURO", num_classes=5, colormap="cividis", method="pretty",
+                               group_attribute=None):
     """
-    Calculate gradient classes for an attribute using pretty breaks.
+    Calculate gradient classes for an attribute, globally and optionally per commune.
+
+    Breaks come from a quantile sketch of the attribute (see core/process/breaks.py), the same
+    computation `pgload` stores with every PostGIS load and the API serves, so exported legends
+    match the served ones.
 
     Parameters:
         gdf (GeoDataFrame): Input GeoDataFrame.
         attribute (str): Attribute to calculate gradient classes for.
         num_classes (int): Number of classes for the gradient.
         colormap (str): Matplotlib colormap name.
+        method (str): "pretty", "quantile" or "jenks".
+        group_attribute (str): Commune attribute to also compute per-commune breaks for (optional).
 
     Returns:
         dict: A dictionary containing class breaks and colors.
@@ -107,29 +199,36 @@ def calculate_gradient_classes(gdf, attribute="PROD_EURO", num_classes=5, colorm
     if attribute not in gdf.columns:
         raise ValueError(f"Attribute '{attribute}' not found in the dataset.")
 
-    # Extract values for the specified attribute
-    values = gdf[attribute].dropna()
+    if group_attribute not in gdf.columns:
+        group_attribute = None
+    sketch, groups = build_sketches([gdf], attribute, group_column=group_attribute)
 
-    if len(values) == 0:
+    if sketch.count == 0:
         raise ValueError(f"No valid values found for attribute '{attribute}'.")
 
-    # Calculate pretty breaks
-    breaks = plt.matplotlib.ticker.MaxNLocator(nbins=num_classes).tick_values(values.min(), values.max())
+    breaks = class_breaks(sketch, num_classes, methods=[method])[method]
 
-    # Generate colors from the colormap
-    cmap = plt.cm.get_cmap(colormap, num_classes)
-    colors = [mcolors.to_hex(cmap(i)) for i in range(num_classes)]
+    # Generate one color per class: pretty breaks may give more or fewer than num_classes
+    classes = max(len(breaks) - 1, 1)
+    cmap = plt.cm.get_cmap(colormap, classes)
+    colors = [mcolors.to_hex(cmap(i)) for i in range(classes)]
 
     # Create a mapping of breaks to colors
     gradient_classes = {
-        "breaks": breaks.tolist(),
+        "method": method,
+        "breaks": breaks,
         "colors": colors
     }
+    if groups:
+        gradient_classes["communes"] = {
+            group: class_breaks(group_sketch, num_classes, methods=[method])[method]
+            for group, group_sketch in sorted(groups.items()) if group_sketch.count
+        }
 
     return gradient_classes
 
 
-def convert_shapefile_to_vector_tiles(input_shapefile, output_folder, attribute="PROD_EURO", num_classes=5, colormap="cividis"):
+def convert_shapefile_to_vector_tiles(input_shapefile, output_folder, attribute="PROD_EURO", num_classes=5, colormap="cividis", incremental=False, split_attribute="nom"):
     """
     Converts a shapefile to vector tiles (MBTiles) with gradient styling.
 
@@ -139,6 +238,8 @@ def convert_shapefile_to_vector_tiles(input_shapefile, output_folder, attribute=
         attribute (str): Attribute to use for gradient styling.
         num_classes (int): Number of classes for the gradient.
         colormap (str): Matplotlib colormap name.
+        incremental (bool): Only regenerate the tiles of communes that changed since the last build.
+        split_attribute (str): Commune attribute used to track changes when `incremental` is set.
     """
     try:
         print("Reading shapefile...")
@@ -177,13 +278,18 @@ def convert_shapefile_to_vector_tiles(input_shapefile, output_folder, attribute=
         # Step 6: Generate vector tiles (MBTiles)
         print("Generating vector tiles with gradient styling...")
         mbtiles_path = os.path.join(output_folder, "data.mbtiles")
-        generate_vector_tiles(fgb_path, mbtiles_path, max_zoom=14, min_zoom=0)
+        if incremental:
+            result = update_mbtiles(fgb_path, mbtiles_path, attribute=split_attribute, min_zoom=0, max_zoom=14, simplification=10)
+            print(f"Changed communes: {len(result['changed'])}")
+        else:
+            generate_vector_tiles(fgb_path, mbtiles_path, max_zoom=14, min_zoom=0)
         print(f"Vector tiles saved to {mbtiles_path}")
 
         # Step 7: Calculate gradient classes for styling
-        gradient_classes = calculate_gradient_classes(gdf, attribute=attribute, num_classes=num_classes, colormap=colormap)
+        gradient_classes = calculate_gradient_classes(gdf, attribute=attribute, num_classes=num_classes, colormap=colormap,
+                                                      group_attribute=split_attribute)
         print("Gradient classes calculated:")
-        print(gradient_classes)
+        print(gradient_classes["breaks"])
 
         # Save gradient classes to a JSON file for use in frontend styling
         json_path = os.path.join(output_folder, "gradient_classes.json")
@@ -4,10 +4,16 @@ from shapely.ops import unary_union
 from shapely.wkt import loads
 import matplotlib.pyplot as plt
 import os
+import sys
 import logging
 import json
 import pandas as pd
 
+# The shared pipeline modules are the core.process package at the repository root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from core.process.fgb import write_indexed_flatgeobuf, validate_bbox_byte_ranges
+from core.process.incremental import commune_digests
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -138,13 +144,14 @@ def round_numeric_columns(gdf, columns_to_round={'surface_ut': 2, 'production':
     return gdf
 
 
-def generate_metadata(gdf, output_path="metadata.json"):
+def generate_metadata(gdf, output_path="metadata.json", digests=None):
     """
     Generate metadata for a GeoDataFrame and save it as a JSON file.
 
     Parameters:
         gdf (GeoDataFrame): Input GeoDataFrame.
         output_path (str): Path to save the metadata file.
+        digests (dict): Per-commune feature digests recorded for incremental builds.
     """
     metadata = {
         "bounding_box": gdf.total_bounds.tolist(),  # Bounding box [minx, miny, maxx, maxy]
@@ -154,6 +161,8 @@ def generate_metadata(gdf, output_path="metadata.json"):
         "processed_at": pd.Timestamp.now().isoformat(),  # Timestamp of processing
         "script_version": "1.0.0"                   # Script version
     }
+    if digests is not None:
+        metadata["commune_digests"] = digests
 
     # Save metadata to a JSON file
     with open(output_path, "w") as f:
@@ -188,14 +197,55 @@ def plot_comparison(original_gdf, simplified_gdf, output_image="comparison.png")
     print(f"Comparison plot saved to {output_image}")
 
 
-def convert_shapefile_to_flatgeobuf(input_shapefile, output_folder):
+def validation_bbox(gdf, fraction=0.01):
+    """
+    Build a small bbox around the centre of a GeoDataFrame for range-read validation.
+
+    Parameters:
+        gdf (GeoDataFrame): Input GeoDataFrame.
+        fraction (float): Width and height of the bbox as a fraction of the data extent.
+
+    Returns:
+        tuple: (minx, miny, maxx, maxy).
+    """
+    minx, miny, maxx, maxy = gdf.total_bounds
+    cx, cy = (minx + maxx) / 2, (miny + maxy) / 2
+    half_w, half_h = (maxx - minx) * fraction / 2, (maxy - miny) * fraction / 2
+    return (cx - half_w, cy - half_h, cx + half_w, cy + half_h)
+
+
+def load_commune_digests(metadata_path):
+    """
+    Read the per-commune digests recorded by the previous build, if any.
+
+    Parameters:
+        metadata_path (str): Path to the metadata file.
+
+    Returns:
+        dict: {commune: digest}, empty when no previous build is recorded.
+    """
+    if not os.path.exists(metadata_path):
+        return {}
+    with open(metadata_path) as f:
+        return json.load(f).get("commune_digests", {})
+
+
+def convert_shapefile_to_flatgeobuf(input_shapefile, output_folder, columns=None, incremental=False, split_attribute="nom",
+                                    validate=False):
     """
     Converts a shapefile to multiple FlatGeobuf files for different zoom levels, drops unnecessary attributes,
     rounds numeric attributes, generates metadata, and calculates metrics.
 
+    Every output is Hilbert-sorted with a packed R-tree index. With `validate`, a bbox query
+    is also checked to read only the index nodes and features it needs.
+
     Parameters:
         input_shapefile (str): Path to the input shapefile.
         output_folder (str): Folder to save the output FlatGeobuf files.
+        columns (list): Attributes to keep in each output (all attributes when None).
+        incremental (bool): Skip the export when no commune changed since the last build.
+        split_attribute (str): Commune attribute used to track changes.
+        validate (bool): Check a bbox query against each output (a failed check only logs a warning).
     """
     try:
         print("Reading shapefile...")
@@ -228,7 +278,19 @@ def convert_shapefile_to_flatgeobuf(input_shapefile, output_folder):
         # Step 5: Generate metadata
         print("Generating metadata...")
         metadata_path = os.path.join(output_folder, "metadata.json")
-        generate_metadata(gdf, output_path=metadata_path)
+        digests = commune_digests(gdf, attribute=split_attribute) if split_attribute in gdf.columns else None
+
+        # The zoom-band files cover the whole dataset and their packed index cannot be patched,
+        # so an incremental run only decides whether they need rewriting at all.
+        if incremental and digests is not None:
+            previous = load_commune_digests(metadata_path)
+            changed = {k for k in set(previous) | set(digests) if previous.get(k) != digests.get(k)}
+            if previous and not changed:
+                print("No commune changed since the last build. Skipping export.")
+                return
+            print(f"{len(changed)} communes changed since the last build.")
+
+        generate_metadata(gdf, output_path=metadata_path, digests=digests)
 
         # Step 6: Simplify geometries for multiple zoom levels
         print("Simplifying geometries for multiple zoom levels...")
@@ -247,9 +309,17 @@ def convert_shapefile_to_flatgeobuf(input_shapefile, output_folder):
             })
 
             output_path = os.path.join(output_folder, f"{zoom_range}.fgb")
-            simplified_gdf.to_file(output_path, driver="FlatGeobuf")
+            write_indexed_flatgeobuf(simplified_gdf, output_path, columns=columns)
             print(f"Saved {output_path}")
 
+            # Check that a bbox query only touches the expected byte ranges
+            if validate:
+                try:
+                    stats = validate_bbox_byte_ranges(output_path, validation_bbox(simplified_gdf))
+                    print(f"Zoom Range {zoom_range}: bbox query reads {stats['bytes_read']} bytes ({stats['fraction']:.2%} of file)")
+                except ValueError as e:
+                    logging.warning(f"Zoom Range {zoom_range}: bbox validation failed: {e}")
+
             # Calculate and display metrics
             metrics = compare_simplified_geometries(gdf, simplified_gdf)
             if metrics["vertex_reduction"]:
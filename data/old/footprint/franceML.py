@@ -4,21 +4,27 @@ data from .csv.gz to geojson for use in common GIS tools. You will
 need to install pandas, geopandas, and shapely.
 """
 
+import os
+import sys
+
 import pandas as pd
 import geopandas as gpd
 from shapely.geometry import shape
 
+# The shared pipeline modules are the core.process package at the repository root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..")))
+from core.process.footprints import DatasetLinksCatalog
+
 def main():
     # this is the name of the geography you want to retrieve. update to meet your needs
     location = 'France'
 
-    dataset_links = pd.read_csv("https://minedbuildings.z5.web.core.windows.net/global-buildings/dataset-links.csv")
-    greece_links = dataset_links[dataset_links.Location == location]
-    for _, row in greece_links.iterrows():
-        df = pd.read_json(row.Url, lines=True)
+    catalog = DatasetLinksCatalog()
+    for quad_key, url in catalog.location_links(location):
+        df = pd.read_json(url, lines=True)
         df['geometry'] = df['geometry'].apply(shape)
         gdf = gpd.GeoDataFrame(df, crs=4326)
-        gdf.to_file(f"{row.QuadKey}.geojson", driver="GeoJSON")
+        gdf.to_file(f"{quad_key}.geojson", driver="GeoJSON")
 
 
 if __name__ == "__main__":
@@ -1,9 +1,13 @@
 import subprocess
 import os
+import sys
 import logging
-import csv
 from concurrent.futures import ThreadPoolExecutor
 
+# The shared pipeline modules are the core.process package at the repository root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from core.process.tps import warp_file
+
 # Configure logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -25,22 +29,6 @@ def validate_file(file_path):
         logging.error(f"File not found: {file_path}")
         raise FileNotFoundError(f"File not found: {file_path}")
 
-def read_gcps_from_csv(csv_file):
-    """Read GCPs from a CSV file and return a list of GCP arguments."""
-    gcps = []
-    try:
-        with open(csv_file, mode='r', newline='') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                gcps.extend([
-                    "-gcp", row['source_x'], row['source_y'],
-                    row['target_x'], row['target_y']
-                ])
-        return gcps
-    except Exception as e:
-        logging.error(f"Failed to read GCPs from CSV file: {e}")
-        raise
-
 def get_layer_name(shapefile):
     """Get the layer name from a shapefile using ogrinfo."""
     try:
@@ -162,50 +150,30 @@ def load_to_postgis(shapefile, layer_name, postgis_config):
             raise ValueError(f"Reserved word or invalid field name detected in table {table_name}.")
     logging.info(f"Field names validated successfully for table {table_name}.")
 
-def process_dataset(input_shp, tps_transformed_shp, adjusted_shp, csv_file, postgis_config):
+# Residual shift measured after the TPS warp, folded into the TPS model
+TRANSLATION = (0.733, -5.179)
+
+def process_dataset(input_shp, adjusted_shp, csv_file, postgis_config, offset=TRANSLATION):
     """
-    Process a single dataset by running TPS transformation, translation adjustment,
+    Process a single dataset by running the TPS transformation (translation adjustment included)
     and loading into PostGIS with all validations and enhancements.
     """
     # Validate input files
     validate_file(input_shp)
     validate_file(csv_file)
 
-    # Read GCPs from CSV
-    gcps = read_gcps_from_csv(csv_file)
-
-    # Step 1: Run the TPS transformation
-    warp_cmd = [
-        "ogr2ogr",
-        *gcps,  # Insert GCPs here
-        "-tps",
-        "-t_srs", "EPSG:2154",
-        tps_transformed_shp,
-        input_shp
-    ]
+    # Step 1: Run the TPS transformation, translation adjustment included
     logging.info("Running TPS transformation...")
-    run_command(warp_cmd)
+    warp_file(input_shp, adjusted_shp, csv_file, offset=offset, crs="EPSG:2154", cache_dir="tps_cache")
     logging.info("TPS transformation complete.")
 
-    # Get the layer name from the TPS-transformed shapefile
-    layer_name = get_layer_name(tps_transformed_shp)
-
-    # Step 2: Apply the translate adjustment
-    adjust_cmd = [
-        "ogr2ogr",
-        adjusted_shp,  # Output adjusted shapefile
-        tps_transformed_shp,  # Input: TPS-transformed shapefile
-        "-dialect", "Sqlite",
-        "-sql", f"SELECT ST_Translate(Geometry, 0.733, -5.179, 0 ) AS geometry, * FROM {layer_name}"
-    ]
-    logging.info("Running translation adjustment...")
-    run_command(adjust_cmd)
-    logging.info("Translation adjustment complete.")
+    # Get the layer name from the adjusted shapefile
+    layer_name = get_layer_name(adjusted_shp)
 
-    # Step 3: Validate geometries in the adjusted shapefile
+    # Step 2: Validate geometries in the adjusted shapefile
     validate_geometries(adjusted_shp)
 
-    # Step 4: Load the adjusted shapefile into PostGIS with all checks
+    # Step 3: Load the adjusted shapefile into PostGIS with all checks
     load_to_postgis(adjusted_shp, layer_name, postgis_config)
 
 def main():
@@ -221,13 +189,13 @@ def main():
 
     # List of datasets to process
     datasets = [
-        {"input_shp": "roof.shp", "tps_transformed_shp": "roof1_warped5_tps.shp", "adjusted_shp": "roof1_warped_adjusted_tps.shp", "csv_file": "gcps.csv"},
+        {"input_shp": "roof.shp", "adjusted_shp": "roof1_warped_adjusted_tps.shp", "csv_file": "gcps.csv"},
         # Add more datasets as needed
     ]
 
     # Use ThreadPoolExecutor to run datasets in parallel
     with ThreadPoolExecutor(max_workers=4) as executor:
-        futures = [executor.submit(process_dataset, ds["input_shp"], ds["tps_transformed_shp"], ds["adjusted_shp"], ds["csv_file"], postgis_config) for ds in datasets]
+        futures = [executor.submit(process_dataset, ds["input_shp"], ds["adjusted_shp"], ds["csv_file"], postgis_config) for ds in datasets]
         
         for future in futures:
             try:
@@ -1,112 +1,49 @@
-import subprocess
 import os
+import sys
 import logging
-import csv
 from concurrent.futures import ThreadPoolExecutor
 
+# The shared pipeline modules are the core.process package at the repository root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from core.process.tps import warp_file
+
 # Configure logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def run_command(command):
-    """Run a command using subprocess and handle errors."""
-    try:
-        logging.debug(f"Running command: {' '.join(command)}")
-        result = subprocess.run(command, check=True, text=True, capture_output=True)
-        logging.debug(result.stdout)
-        return result.stdout
-    except subprocess.CalledProcessError as e:
-        logging.error(f"Command failed with return code {e.returncode}")
-        logging.error(e.stderr)
-        raise
-
 def validate_file(file_path):
     """Check if the file exists."""
     if not os.path.isfile(file_path):
         logging.error(f"File not found: {file_path}")
         raise FileNotFoundError(f"File not found: {file_path}")
 
-def read_gcps_from_csv(csv_file):
-    """Read GCPs from a CSV file and return a list of GCP arguments."""
-    gcps = []
-    try:
-        with open(csv_file, mode='r', newline='') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                gcps.extend([
-                    "-gcp", row['source_x'], row['source_y'],
-                    row['target_x'], row['target_y']
-                ])
-        return gcps
-    except Exception as e:
-        logging.error(f"Failed to read GCPs from CSV file: {e}")
-        raise
+# Residual shift measured after the TPS warp, folded into the TPS model
+TRANSLATION = (0.733, -5.179)
 
-def get_layer_name(shapefile):
-    """Get the layer name from a shapefile using ogrinfo."""
-    try:
-        cmd = ["ogrinfo", "-so", shapefile]
-        output = run_command(cmd)
-        for line in output.splitlines():
-            if line.strip().startswith("1:"):
-                # Extract the layer name from the line
-                layer_name = line.split(":")[1].split()[0].strip()
-                logging.info(f"Determined layer name: {layer_name}")
-                return layer_name
-        logging.error("Could not determine layer name from shapefile.")
-        logging.debug(f"Raw ogrinfo output:\n{output}")
-        raise ValueError("Could not determine layer name from shapefile.")
-    except subprocess.CalledProcessError as e:
-        logging.error(f"Failed to get layer name: {e.stderr}")
-        raise
+# Node spacing (metres) of the displacement grid the vertices are warped through
+GRID_CELL_SIZE = 25
 
-def process_dataset(input_shp, tps_transformed_shp, adjusted_shp, csv_file):
-    """Process a single dataset by running TPS transformation and translation adjustment."""
+def process_dataset(input_shp, adjusted_shp, csv_file, offset=TRANSLATION, grid_cell_size=GRID_CELL_SIZE):
+    """Warp a single dataset with the TPS of its GCPs, sampled on a grid, translation included, in one pass."""
     # Validate input files
     validate_file(input_shp)
     validate_file(csv_file)
 
-    # Read GCPs from CSV
-    gcps = read_gcps_from_csv(csv_file)
-
-    # Step 1: Run the TPS transformation
-    warp_cmd = [
-        "ogr2ogr",
-        *gcps,  # Insert GCPs here
-        "-tps",
-        "-t_srs", "EPSG:2154",
-        tps_transformed_shp,
-        input_shp
-    ]
     logging.info("Running TPS transformation...")
-    run_command(warp_cmd)
+    warp_file(input_shp, adjusted_shp, csv_file, offset=offset, crs="EPSG:2154", cache_dir="tps_cache",
+              grid_cell_size=grid_cell_size)
     logging.info("TPS transformation complete.")
 
-    # Get the layer name from the TPS-transformed shapefile
-    layer_name = get_layer_name(tps_transformed_shp)
-
-    # Step 2: Apply the translate adjustment
-    adjust_cmd = [
-        "ogr2ogr",
-        adjusted_shp,  # Output adjusted shapefile
-        tps_transformed_shp,  # Input: TPS-transformed shapefile
-        "-dialect", "Sqlite",
-        "-sql", f"SELECT ST_Translate(Geometry, 0.733, -5.179, 0 ) AS geometry, * FROM {layer_name}"
-    ]
-    logging.info("Running translation adjustment...")
-    run_command(adjust_cmd)
-    logging.info("Translation adjustment complete.")
-
 def main():
     # List of datasets to process
     datasets = [
-        {"input_shp": "roof.shp", "tps_transformed_shp": "roof1_warped5_tps.shp", "adjusted_shp": "roof1_warped_adjusted_tps.shp", "csv_file": "gcps.csv"},
-        #{"input_shp": "roof2.shp", "tps_transformed_shp": "roof2_warped5_tps.shp", "adjusted_shp": "roof2_warped_adjusted_tps.shp", "csv_file": "gcps.csv"},
+        {"input_shp": "roof.shp", "adjusted_shp": "roof1_warped_adjusted_tps.shp", "csv_file": "gcps.csv"},
+        #{"input_shp": "roof2.shp", "adjusted_shp": "roof2_warped_adjusted_tps.shp", "csv_file": "gcps.csv"},
         # Add more datasets as needed
     ]
 
     # Use ThreadPoolExecutor to run datasets in parallel
     with ThreadPoolExecutor(max_workers=4) as executor:
-        futures = [executor.submit(process_dataset, ds["input_shp"], ds["tps_transformed_shp"], ds["adjusted_shp"], ds["csv_file"]) for ds in datasets]
+        futures = [executor.submit(process_dataset, ds["input_shp"], ds["adjusted_shp"], ds["csv_file"]) for ds in datasets]
         
         for future in futures:
             try:
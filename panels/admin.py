@@ -1,3 +1,18 @@
-from django.contrib import admin
+from django.contrib.gis import admin
 
-# Register your models here.
+from .models import AlignedRoof, PipelineJob
+
+
+@admin.register(AlignedRoof)
+class AlignedRoofAdmin(admin.GISModelAdmin):
+    list_display = ('id', 'nom', 'alignment', 'surface_ut', 'prod_euro')
+    list_filter = ('alignment',)
+    search_fields = ('nom',)
+    show_full_result_count = False
+
+
+@admin.register(PipelineJob)
+class PipelineJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'pipeline', 'status', 'created_at', 'started_at', 'finished_at')
+    list_filter = ('pipeline', 'status')
+    readonly_fields = ('progress', 'pid', 'runner', 'heartbeat_at', 'returncode', 'error', 'log_path', 'started_at', 'finished_at')
@@ -0,0 +1,209 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from core.process.aggregates import aggregate_view_name
+
+# Must match core/process/aggregates.py, which builds the views with each pipeline load
+LEVELS = ('commune', 'parcel')
+
+DATA_VERSION_QUERY = """
+    SELECT COALESCE(
+        (SELECT version FROM public.tile_data_version WHERE schema_name = %s AND layer = %s), 0
+    )
+"""
+
+
+def _aggregate_settings():
+    return {
+        'schema': getattr(settings, 'AGGREGATE_SCHEMA', 'public'),
+        'table': getattr(settings, 'AGGREGATE_TABLE', 'aligned_roofs'),
+        'values': getattr(settings, 'AGGREGATE_VALUES', ['production', 'PROD_EURO', 'surface_ut']),
+        'bins': getattr(settings, 'HISTOGRAM_BINS', 20),
+        'version_ttl': getattr(settings, 'AGGREGATE_VERSION_TTL', 2),
+        'cache_ttl': getattr(settings, 'AGGREGATE_CACHE_TTL', 3600),
+        'geometry_column': getattr(settings, 'TILE_GEOMETRY_COLUMN', 'geometry'),
+        'srid': getattr(settings, 'TILE_SRID', 2154),
+    }
+
+
+def data_version():
+    """
+    Data version of the aggregated table, read from `tile_data_version` at most every few seconds.
+    """
+    options = _aggregate_settings()
+    key = f"aggregates:version:{options['schema']}.{options['table']}"
+    version = cache.get(key)
+    if version is None:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('public.tile_data_version')")
+            if cursor.fetchone()[0] is None:
+                version = 0
+            else:
+                cursor.execute(DATA_VERSION_QUERY, [options['schema'], options['table']])
+                version = cursor.fetchone()[0]
+        cache.set(key, version, options['version_ttl'])
+    return version
+
+
+def cached(name, params, compute):
+    """
+    Return `compute()` cached under the current data version, so a new load invalidates it.
+
+    Entries of older versions are never read again and expire after AGGREGATE_CACHE_TTL seconds.
+    """
+    key = f"aggregates:{data_version()}:{name}:{':'.join(str(param) for param in params)}"
+    result = cache.get(key)
+    if result is None:
+        result = compute()
+        cache.set(key, result, _aggregate_settings()['cache_ttl'])
+    return result
+
+
+def _summaries(row, values):
+    """
+    Group the flat `<value>_<statistic>` columns of an aggregate row by value.
+    """
+    summaries = {}
+    for value in values:
+        name = value.lower()
+        if f'{name}_sum' not in row:
+            continue
+        summaries[value] = {
+            'sum': row[f'{name}_sum'],
+            'avg': row[f'{name}_avg'],
+            'min': row[f'{name}_min'],
+            'max': row[f'{name}_max'],
+            'histogram': {
+                'low': row[f'{name}_low'],
+                'high': row[f'{name}_high'],
+                'counts': list(row[f'{name}_histogram']),
+            },
+        }
+    return summaries
+
+
+def _rows(cursor):
+    names = [column[0] for column in cursor.description]
+    return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+
+def _format(row, level, values):
+    result = {level: row[level], 'count': row['count'], 'values': _summaries(row, values)}
+    if level == 'parcel' and 'commune' in row:
+        result['commune'] = row['commune']
+    return result
+
+
+def level_aggregates(level, key=None, commune=None):
+    """
+    Rows of the materialized view of `level`: every group, one group (`key`), or the parcels of a commune.
+
+    Returns None when the view does not exist (the table has no column for that level).
+    """
+    options = _aggregate_settings()
+    quote = connection.ops.quote_name
+    view = f"{quote(options['schema'])}.{quote(aggregate_view_name(options['table'], level))}"
+
+    def compute():
+        query, params = f'SELECT * FROM {view}', []
+        if key is not None:
+            query, params = query + f' WHERE {quote(level)} = %s', [key]
+        elif commune is not None and level != 'commune':
+            query, params = query + ' WHERE commune = %s', [commune]
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT to_regclass(%s)', [view])
+            if cursor.fetchone()[0] is None:
+                return None
+            cursor.execute(query + f' ORDER BY {quote(level)}', params)
+            return [_format(row, level, options['values']) for row in _rows(cursor)]
+
+    return cached(level, [key, commune], compute)
+
+
+def bbox_aggregates(bbox):
+    """
+    Aggregates of the rows meeting a lon/lat bbox, computed from the table in one index-backed scan.
+
+    The histogram buckets span the range of each value within the bbox.
+    """
+    options = _aggregate_settings()
+    quote = connection.ops.quote_name
+    table = f"{quote(options['schema'])}.{quote(options['table'])}"
+    geometry = quote(options['geometry_column'])
+    srid = int(options['srid'])
+    bins = options['bins']
+
+    def compute():
+        bounds, selects = [], ['count(*) AS count']
+        for value in options['values']:
+            name, column = value.lower(), quote(value)
+            low, high = quote(f'{name}_low'), quote(f'{name}_high')
+            bounds.append(
+                f'min({column}) AS {low}, '
+                f'CASE WHEN max({column}) > min({column}) THEN max({column}) ELSE min({column}) + 1 END AS {high}'
+            )
+            bucket = f'least(width_bucket(r.{column}, b.{low}, b.{high}, {bins}), {bins})'
+            histogram = ', '.join(f'count(*) FILTER (WHERE {bucket} = {i})' for i in range(1, bins + 1))
+            selects += [
+                f'sum(r.{column}) AS {quote(name + "_sum")}',
+                f'avg(r.{column}) AS {quote(name + "_avg")}',
+                f'min(r.{column}) AS {quote(name + "_min")}',
+                f'max(r.{column}) AS {quote(name + "_max")}',
+                f'ARRAY[{histogram}] AS {quote(name + "_histogram")}',
+                f'min(b.{low}) AS {low}',
+                f'min(b.{high}) AS {high}',
+            ]
+        query = f"""
+            WITH r AS MATERIALIZED (
+                SELECT {', '.join(quote(value) for value in options['values'])}
+                FROM {table}
+                WHERE {geometry} && ST_Transform(ST_MakeEnvelope(%s, %s, %s, %s, 4326), {srid})
+            ),
+            b AS (SELECT {', '.join(bounds)} FROM r)
+            SELECT {', '.join(selects)}
+            FROM r CROSS JOIN b
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(query, list(bbox))
+            row = _rows(cursor)[0]
+        return {'bbox': list(bbox), 'count': row['count'], 'values': _summaries(row, options['values'])}
+
+    return cached('bbox', bbox, compute)
+
+
+CLASS_BREAKS_QUERY = """
+    SELECT commune, method, num_classes, version, breaks
+    FROM public.class_breaks
+    WHERE schema_name = %s AND layer = %s AND attribute = %s AND commune = %s AND version = %s
+"""
+
+
+def class_breaks(attribute, commune=None):
+    """
+    Legend class breaks of an attribute, globally or for one commune, as {method: edges}.
+
+    The breaks are computed by the pipeline with each load and stored with its data version;
+    only breaks of the current version are returned. Returns None when there are none.
+    """
+    options = _aggregate_settings()
+    version = data_version()
+
+    def compute():
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('public.class_breaks')")
+            if cursor.fetchone()[0] is None:
+                return None
+            cursor.execute(CLASS_BREAKS_QUERY, [options['schema'], options['table'], attribute, commune or '', version])
+            rows = _rows(cursor)
+        if not rows:
+            return None
+        return {
+            'attribute': attribute,
+            'commune': commune,
+            'version': version,
+            'num_classes': rows[0]['num_classes'],
+            'breaks': {row['method']: list(row['breaks']) for row in rows},
+        }
+
+    return cached('breaks', [attribute, commune], compute)
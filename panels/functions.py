@@ -0,0 +1,12 @@
+from django.contrib.gis.db.models.functions import GeomOutputGeoFunc
+
+
+class SimplifyPreserveTopology(GeomOutputGeoFunc):
+    """
+    ST_SimplifyPreserveTopology(geometry, tolerance), tolerance in units of the geometry's SRID.
+    """
+
+    function = 'ST_SimplifyPreserveTopology'
+
+    def __init__(self, expression, tolerance, **extra):
+        super().__init__(expression, tolerance, **extra)
@@ -0,0 +1,203 @@
+import json
+import logging
+import os
+import signal
+import socket
+import subprocess
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import PipelineJob
+
+logger = logging.getLogger(__name__)
+
+# Must match core/process/progress.py
+PROGRESS_FILE_ENV = 'PIPELINE_PROGRESS_FILE'
+
+
+def read_events(path, offset=0):
+    """
+    Read the complete progress events appended to a file since `offset`.
+
+    Returns a (events, new offset) tuple; a partially written last line is left for the next read.
+    """
+    try:
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+    except FileNotFoundError:
+        return [], offset
+    end = data.rfind(b'\n') + 1
+    events = []
+    for line in data[:end].splitlines():
+        try:
+            events.append(json.loads(line))
+        except ValueError:
+            logger.warning('Skipping malformed progress line in %s', path)
+    return events, offset + end
+
+
+def pipeline_command(job):
+    """
+    Command line of a job: the configured command of its pipeline followed by its arguments.
+    """
+    return [str(part) for part in settings.PIPELINES[job.pipeline]] + [str(arg) for arg in job.args]
+
+
+class JobRunner:
+    """
+    Run queued pipeline jobs as subprocesses, at most `concurrency` at a time.
+
+    Jobs are claimed with `SELECT ... FOR UPDATE SKIP LOCKED`, so several runners can share the
+    queue. Each claimed job records its runner ("host:pid"), and the runner refreshes the
+    heartbeat of its jobs on every poll. Pipelines report progress as JSON lines to the file
+    named by PIPELINE_PROGRESS_FILE; the runner copies the last event to the job on every poll.
+    """
+
+    def __init__(self, concurrency=None, interval=1.0):
+        self.concurrency = concurrency or getattr(settings, 'PIPELINE_MAX_WORKERS', 2)
+        self.interval = interval
+        self.stale_after = getattr(settings, 'PIPELINE_STALE_AFTER', 60)
+        self.job_dir = Path(getattr(settings, 'PIPELINE_JOB_DIR', settings.BASE_DIR / 'jobs'))
+        self.host = socket.gethostname()
+        self.identity = f'{self.host}:{os.getpid()}'
+        self.running = {}  # job id -> (process, progress path, offset)
+
+    def _runner_gone(self, runner):
+        """
+        Whether a runner of this host has exited (runners of other hosts are judged by their heartbeat).
+        """
+        host, _, pid = runner.rpartition(':')
+        if host != self.host or not pid.isdigit():
+            return False
+        if runner == self.identity:
+            return True  # a job of ours that this runner is not following
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass
+        return False
+
+    def recover(self):
+        """
+        Fail the running jobs whose runner stopped, as their process can no longer be followed.
+
+        A runner is considered gone when it was a process of this host that no longer exists, or
+        when it has not refreshed the heartbeat of its jobs for PIPELINE_STALE_AFTER seconds.
+        Jobs followed by other live runners are left alone.
+        """
+        cutoff = timezone.now() - timedelta(seconds=self.stale_after)
+        running = PipelineJob.objects.filter(status=PipelineJob.Status.RUNNING).exclude(id__in=list(self.running))
+        runners = running.exclude(runner='').values_list('runner', flat=True).distinct()
+        gone = [runner for runner in runners if self._runner_gone(runner)]
+        stale = running.filter(
+            Q(runner__in=gone) | Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at=None, started_at__lt=cutoff)
+        )
+        count = stale.update(status=PipelineJob.Status.FAILED, error='Job runner stopped during the run.',
+                             finished_at=timezone.now())
+        if count:
+            logger.warning('Marked %d orphaned jobs as failed.', count)
+
+    def claim(self, limit):
+        with transaction.atomic():
+            jobs = list(
+                PipelineJob.objects.select_for_update(skip_locked=True)
+                .filter(status=PipelineJob.Status.QUEUED).order_by('id')[:limit]
+            )
+            for job in jobs:
+                job.status = PipelineJob.Status.RUNNING
+                job.started_at = job.heartbeat_at = timezone.now()
+                job.runner = self.identity
+                job.save(update_fields=['status', 'started_at', 'heartbeat_at', 'runner'])
+        return jobs
+
+    def start(self, job):
+        self.job_dir.mkdir(parents=True, exist_ok=True)
+        progress_path = self.job_dir / f'job-{job.id}.jsonl'
+        log_path = self.job_dir / f'job-{job.id}.log'
+        env = dict(os.environ)
+        env[PROGRESS_FILE_ENV] = str(progress_path)
+        try:
+            with open(log_path, 'ab') as log:
+                process = subprocess.Popen(
+                    pipeline_command(job), stdout=log, stderr=subprocess.STDOUT, env=env,
+                    cwd=settings.BASE_DIR, start_new_session=True,
+                )
+        except (OSError, KeyError) as e:
+            self.finish(job, PipelineJob.Status.FAILED, error=f'Could not start the pipeline: {e}')
+            return
+        job.pid, job.log_path = process.pid, str(log_path)
+        job.save(update_fields=['pid', 'log_path'])
+        self.running[job.id] = (process, progress_path, 0)
+        logger.info('Started job %d (%s) as pid %d.', job.id, job.pipeline, process.pid)
+
+    def finish(self, job, status, returncode=None, error=''):
+        job.status, job.returncode, job.error = status, returncode, error
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'returncode', 'error', 'finished_at', 'progress'])
+        logger.info('Job %d %s.', job.id, status)
+
+    def poll(self):
+        """
+        Update the progress of running jobs, cancel those requested, and record the finished ones.
+        """
+        PipelineJob.objects.filter(id__in=list(self.running)).update(heartbeat_at=timezone.now())
+        for job_id, (process, progress_path, offset) in list(self.running.items()):
+            job = PipelineJob.objects.filter(id=job_id).first()
+            if job is None:
+                # Deleted (e.g. from the admin) while running: stop following it
+                logger.warning('Job %d was deleted while running; stopping its process.', job_id)
+                if process.poll() is None:
+                    os.killpg(process.pid, signal.SIGTERM)
+                del self.running[job_id]
+                continue
+            events, offset = read_events(progress_path, offset)
+            self.running[job_id] = (process, progress_path, offset)
+            if events:
+                job.progress = events[-1]
+                job.save(update_fields=['progress'])
+            if job.cancel_requested and process.poll() is None:
+                os.killpg(process.pid, signal.SIGTERM)
+            returncode = process.poll()
+            if returncode is None:
+                continue
+            del self.running[job_id]
+            reported = (job.progress or {}).get('status')
+            if job.cancel_requested:
+                self.finish(job, PipelineJob.Status.CANCELLED, returncode)
+            elif returncode == 0 and reported != 'failed':
+                self.finish(job, PipelineJob.Status.SUCCEEDED, returncode)
+            else:
+                error = (job.progress or {}).get('error') or f'Exited with status {returncode}.'
+                self.finish(job, PipelineJob.Status.FAILED, returncode, error=error)
+
+    def run_once(self):
+        self.poll()
+        free = self.concurrency - len(self.running)
+        if free > 0:
+            for job in self.claim(free):
+                self.start(job)
+
+    def run(self):
+        self.recover()
+        last_recover = time.monotonic()
+        logger.info('Running pipeline jobs with %d workers as %s.', self.concurrency, self.identity)
+        try:
+            while True:
+                self.run_once()
+                if time.monotonic() - last_recover >= self.stale_after:
+                    self.recover()
+                    last_recover = time.monotonic()
+                time.sleep(self.interval)
+        finally:
+            for process, _, _ in self.running.values():
+                if process.poll() is None:
+                    os.killpg(process.pid, signal.SIGTERM)
@@ -0,0 +1,161 @@
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import shapely
+from django.conf import settings
+from django.contrib.gis.db.models import Extent
+from django.contrib.gis.db.models.functions import AsWKB
+from django.contrib.gis.geos import Point
+from django.db import close_old_connections, connection
+
+from . import aggregates
+from .models import AlignedRoof
+
+logger = logging.getLogger(__name__)
+
+# Columns left out of the attributes returned for a roof
+GEOMETRY_COLUMNS = ('geometry', 'hilbert_key')
+
+
+class CommuneTree:
+    """
+    STRtree over the roof polygons of one commune, with their ids.
+    """
+
+    def __init__(self, ids, geometries):
+        self.ids = np.asarray(ids)
+        self.tree = shapely.STRtree(geometries)
+
+    def query(self, point):
+        return self.ids[self.tree.query(point, predicate='intersects')].tolist()
+
+
+class RoofLookup:
+    """
+    Point-in-polygon lookup of roofs, answered from per-commune STRtrees held in memory.
+
+    The commune of a point is found from the extents of every commune. Trees are built lazily
+    on a background thread the first time a commune is queried; until then (a cold commune)
+    the point is matched in PostGIS with `ST_Intersects` on the spatial index. At most
+    `max_communes` trees are kept, least recently used first out, and all of them are dropped
+    when the data version of the table changes.
+    """
+
+    def __init__(self, max_communes=32):
+        self.max_communes = max_communes
+        self._version = None
+        self._communes = None  # (STRtree of commune extents, commune names)
+        self._trees = OrderedDict()
+        self._loading = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='roof-lookup')
+
+    def _check_version(self):
+        version = aggregates.data_version()
+        with self._lock:
+            if version != self._version:
+                if self._version is not None:
+                    logger.info('Data version changed from %s to %s: dropping the roof lookup trees.',
+                                self._version, version)
+                self._version = version
+                self._communes = None
+                self._trees.clear()
+        return version
+
+    def _commune_extents(self):
+        with self._lock:
+            if self._communes is not None:
+                return self._communes
+        rows = list(AlignedRoof.objects.exclude(nom=None).values('nom').annotate(extent=Extent('geometry'))
+                    .values_list('nom', 'extent'))
+        names = [name for name, extent in rows if extent]
+        boxes = shapely.box(*np.array([extent for _, extent in rows if extent]).reshape(-1, 4).T)
+        communes = (shapely.STRtree(boxes), np.array(names, dtype=object))
+        with self._lock:
+            self._communes = communes
+        return communes
+
+    def communes_at(self, point):
+        tree, names = self._commune_extents()
+        return names[tree.query(point, predicate='intersects')].tolist()
+
+    def _load(self, commune, version):
+        try:
+            rows = list(AlignedRoof.objects.filter(nom=commune).annotate(wkb=AsWKB('geometry'))
+                        .values_list('id', 'wkb'))
+            ids = [row[0] for row in rows]
+            geometries = shapely.from_wkb([bytes(row[1]) for row in rows])
+            tree = CommuneTree(ids, geometries)
+            with self._lock:
+                if version == self._version:
+                    self._trees[commune] = tree
+                    while len(self._trees) > self.max_communes:
+                        self._trees.popitem(last=False)
+            logger.info('Loaded the roof lookup tree of %s (%d roofs).', commune, len(ids))
+        except Exception:
+            logger.exception('Could not load the roof lookup tree of %s.', commune)
+        finally:
+            with self._lock:
+                self._loading.discard(commune)
+            close_old_connections()
+
+    def roof_ids_at(self, lon, lat):
+        """
+        Return the ids of the roofs under a lon/lat point, and whether they came from memory.
+        """
+        version = self._check_version()
+        native = Point(lon, lat, srid=4326)
+        native.transform(AlignedRoof._meta.get_field('geometry').srid)
+        point = shapely.Point(native.x, native.y)
+
+        communes = self.communes_at(point)
+        with self._lock:
+            trees = [self._trees.get(commune) for commune in communes]
+            for commune, tree in zip(communes, trees):
+                if tree is not None:
+                    self._trees.move_to_end(commune)
+            cold = [c for c, tree in zip(communes, trees) if tree is None and c not in self._loading]
+            self._loading.update(cold)
+        for commune in cold:
+            self._executor.submit(self._load, commune, version)
+
+        if all(tree is not None for tree in trees):
+            return [roof_id for tree in trees for roof_id in tree.query(point)], True
+        ids = list(AlignedRoof.objects.filter(geometry__intersects=native).values_list('id', flat=True))
+        return ids, False
+
+
+def roof_attributes(ids):
+    """
+    Every non-geometry column of the given roofs (address, parcel, production...), as dicts.
+    """
+    if not ids:
+        return []
+    table = connection.ops.quote_name(AlignedRoof._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT to_jsonb(t) - %s::text[] - ARRAY(
+                SELECT attname::text FROM pg_attribute
+                WHERE attrelid = %s::regclass AND atttypid = 'geometry'::regtype
+            )
+            FROM {table} t WHERE t.id = ANY(%s) ORDER BY t.id
+            """,
+            [list(GEOMETRY_COLUMNS), AlignedRoof._meta.db_table, list(ids)],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+_lookup = None
+_lookup_lock = threading.Lock()
+
+
+def get_lookup():
+    global _lookup
+    with _lookup_lock:
+        if _lookup is None:
+            _lookup = RoofLookup(max_communes=getattr(settings, 'LOOKUP_MAX_COMMUNES', 32))
+    return _lookup
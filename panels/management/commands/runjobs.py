@@ -0,0 +1,21 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from panels.jobs import JobRunner
+
+
+class Command(BaseCommand):
+    help = 'Run queued pipeline jobs as subprocesses with bounded concurrency.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=None,
+                            help='Maximum number of simultaneous jobs (default: PIPELINE_MAX_WORKERS).')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds between two polls of the queue.')
+
+    def handle(self, *args, **options):
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+        try:
+            JobRunner(concurrency=options['concurrency'], interval=options['interval']).run()
+        except KeyboardInterrupt:
+            self.stdout.write('Stopped.')
@@ -0,0 +1,29 @@
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name='AlignedRoof',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('nom', models.TextField(null=True)),
+                ('alignment', models.TextField(null=True)),
+                ('surface_ut', models.FloatField(null=True)),
+                ('production', models.FloatField(null=True)),
+                ('prod_euro', models.FloatField(db_column='PROD_EURO', null=True)),
+                ('geometry', django.contrib.gis.db.models.fields.GeometryField(srid=2154)),
+            ],
+            options={
+                'db_table': 'aligned_roofs',
+                'ordering': ['id'],
+                'managed': False,
+            },
+        ),
+    ]
@@ -1,3 +1,68 @@
-from django.db import models
+from django.contrib.gis.db import models
 
-# Create your models here.
+
+class AlignedRoof(models.Model):
+    """
+    Aligned roof polygons loaded into PostGIS by the processing pipeline (`aligned_roofs`).
+
+    The table is created and replaced by `core/process/pgload.py`, so Django does not manage it.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    nom = models.TextField(null=True)
+    alignment = models.TextField(null=True)
+    surface_ut = models.FloatField(null=True)
+    production = models.FloatField(null=True)
+    prod_euro = models.FloatField(db_column='PROD_EURO', null=True)
+    geometry = models.GeometryField(srid=2154)
+
+    class Meta:
+        managed = False
+        db_table = 'aligned_roofs'
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.nom} #{self.id}"
+
+
+class PipelineJob(models.Model):
+    """
+    A pipeline run queued from the API and executed out of process by `manage.py runjobs`.
+
+    `progress` holds the last event the pipeline reported through `core/process/progress.py`;
+    `runner` ("host:pid") and `heartbeat_at` identify the runner process following a running job.
+    """
+
+    class Status(models.TextChoices):
+        QUEUED = 'queued'
+        RUNNING = 'running'
+        SUCCEEDED = 'succeeded'
+        FAILED = 'failed'
+        CANCELLED = 'cancelled'
+
+    pipeline = models.CharField(max_length=50)
+    args = models.JSONField(default=list, blank=True)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.QUEUED, db_index=True)
+    progress = models.JSONField(null=True, blank=True)
+    cancel_requested = models.BooleanField(default=False)
+    pid = models.IntegerField(null=True, blank=True)
+    runner = models.CharField(max_length=255, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    returncode = models.IntegerField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    log_path = models.CharField(max_length=500, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    FINISHED = (Status.SUCCEEDED, Status.FAILED, Status.CANCELLED)
+
+    class Meta:
+        ordering = ['-id']
+
+    def __str__(self):
+        return f"{self.pipeline} #{self.id} ({self.status})"
+
+    @property
+    def finished(self):
+        return self.status in self.FINISHED
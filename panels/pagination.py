@@ -0,0 +1,17 @@
+from rest_framework.pagination import CursorPagination
+
+
+class RoofCursorPagination(CursorPagination):
+    """
+    Keyset pagination on the primary key: every page is an index range scan, however deep.
+    """
+
+    page_size = 500
+    page_size_query_param = 'page_size'
+    max_page_size = 2000
+    ordering = 'id'
+
+
+class JobCursorPagination(CursorPagination):
+    page_size = 50
+    ordering = '-id'
@@ -0,0 +1,40 @@
+from django.conf import settings
+from rest_framework import serializers
+from rest_framework_gis.fields import GeometryField
+from rest_framework_gis.serializers import GeoFeatureModelSerializer
+
+from .models import AlignedRoof, PipelineJob
+
+
+class AlignedRoofSerializer(GeoFeatureModelSerializer):
+    """
+    GeoJSON feature of a roof, with the geometry simplified for the requested zoom.
+    """
+
+    geometry = GeometryField(source='display_geometry', read_only=True, precision=6, remove_duplicates=True)
+
+    class Meta:
+        model = AlignedRoof
+        geo_field = 'geometry'
+        id_field = 'id'
+        fields = ['id', 'nom', 'alignment', 'surface_ut', 'production', 'prod_euro']
+
+
+class PipelineJobSerializer(serializers.ModelSerializer):
+    """
+    A pipeline job; only `pipeline` and `args` are set by clients.
+    """
+
+    args = serializers.ListField(child=serializers.CharField(), required=False, default=list)
+
+    class Meta:
+        model = PipelineJob
+        fields = ['id', 'pipeline', 'args', 'status', 'progress', 'cancel_requested', 'returncode', 'error',
+                  'created_at', 'started_at', 'finished_at']
+        read_only_fields = ['status', 'progress', 'cancel_requested', 'returncode', 'error',
+                            'created_at', 'started_at', 'finished_at']
+
+    def validate_pipeline(self, value):
+        if value not in settings.PIPELINES:
+            raise serializers.ValidationError(f'Unknown pipeline; expected one of {sorted(settings.PIPELINES)}.')
+        return value
@@ -0,0 +1,244 @@
+import asyncio
+import gzip
+import logging
+import re
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, HttpResponseNotModified
+from psycopg import AsyncConnection, sql
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool
+
+logger = logging.getLogger(__name__)
+
+# Bump when the tile encoding changes, so cached tiles of the same data version are refetched
+TILE_FORMAT = 1
+
+WEB_MERCATOR_SRID = 3857
+GENERALIZED_COLUMN = re.compile(r'^(?P<geometry>.+)_z(?P<min_zoom>\d+)_(?P<max_zoom>\d+)$')
+
+# Geometry tables of a schema with their columns
+LAYERS_QUERY = """
+    SELECT c.relname, array_agg(a.attname::text ORDER BY a.attnum)
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+    WHERE n.nspname = %s AND c.relkind IN ('r', 'p') AND NOT c.relispartition
+    GROUP BY c.relname
+    HAVING bool_or(a.attname = %s)
+"""
+
+# Same table as core/process/tile_cache.py, bumped by the pipeline loader on every table replacement
+CREATE_VERSION_TABLE = """
+    CREATE TABLE IF NOT EXISTS public.tile_data_version (
+        schema_name TEXT NOT NULL,
+        layer TEXT NOT NULL,
+        version BIGINT NOT NULL DEFAULT 1,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        PRIMARY KEY (schema_name, layer)
+    )
+"""
+
+DATA_VERSION_QUERY = """
+    SELECT version FROM public.tile_data_version WHERE schema_name = %s AND layer = %s
+"""
+
+_pool = None
+# Event loop the pool (and its lock) belong to: a pool cannot be used from another loop
+_pool_loop = None
+_pool_lock = None
+_version_table_ready = False
+_layers = None
+# Data version each layer's columns were read at, as a replacement may add generalized columns
+_layer_versions = {}
+
+
+def _tile_settings():
+    return {
+        'schema': getattr(settings, 'TILE_SCHEMA', 'public'),
+        'geometry_column': getattr(settings, 'TILE_GEOMETRY_COLUMN', 'geometry'),
+        'attributes': getattr(settings, 'TILE_ATTRIBUTES', ['id', 'PROD_EURO']),
+        'srid': getattr(settings, 'TILE_SRID', 2154),
+        'extent': getattr(settings, 'TILE_EXTENT', 4096),
+        'buffer': getattr(settings, 'TILE_BUFFER', 64),
+        'max_age': getattr(settings, 'TILE_MAX_AGE', 60),
+    }
+
+
+def _conninfo():
+    database = settings.DATABASES['default']
+    return make_conninfo(
+        dbname=database['NAME'], user=database.get('USER') or None,
+        password=database.get('PASSWORD') or None, host=database.get('HOST') or None,
+        port=database.get('PORT') or None,
+    )
+
+
+async def get_pool():
+    """
+    Return the process-wide async connection pool, opened on first use from the default database.
+
+    The pool belongs to the event loop it was opened on. If the view runs on another loop (the
+    server restarted its loop), the old pool is dropped and a new one is opened on this loop.
+    """
+    global _pool, _pool_loop, _pool_lock
+    loop = asyncio.get_running_loop()
+    if _pool_loop is not loop:
+        if _pool is not None:
+            logger.warning('Event loop changed; opening a new tile connection pool.')
+        _pool, _pool_loop, _pool_lock = None, loop, asyncio.Lock()
+    async with _pool_lock:
+        if _pool is None:
+            pool = AsyncConnectionPool(_conninfo(), min_size=1, max_size=getattr(settings, 'TILE_POOL_SIZE', 10),
+                                       open=False)
+            await pool.open()
+            async with pool.connection() as conn:
+                await conn.execute(CREATE_VERSION_TABLE)
+            _pool = pool
+    return _pool
+
+
+@asynccontextmanager
+async def tile_connection(request):
+    """
+    Yield a database connection for a tile request.
+
+    Under ASGI connections come from the pool. Under WSGI Django runs every async view in its
+    own short-lived event loop, which no pool can outlive, so each request opens and closes a
+    connection instead: serve tiles with an ASGI server to reuse connections.
+    """
+    global _version_table_ready
+    if isinstance(request, ASGIRequest):
+        pool = await get_pool()
+        async with pool.connection() as conn:
+            yield conn
+        return
+    async with await AsyncConnection.connect(_conninfo()) as conn:
+        if not _version_table_ready:
+            await conn.execute(CREATE_VERSION_TABLE)
+            _version_table_ready = True
+        yield conn
+
+
+async def get_layers(conn, refresh=False):
+    """
+    Return the cached {table name: columns} of the tile schema, read again when `refresh` is set.
+    """
+    global _layers
+    if _layers is None or refresh:
+        options = _tile_settings()
+        cursor = await conn.execute(LAYERS_QUERY, (options['schema'], options['geometry_column']))
+        _layers = dict(await cursor.fetchall())
+    return _layers
+
+
+def geometry_column_for_zoom(columns, geometry_column, z):
+    """
+    Pick the generalized geometry column of the zoom band containing `z`, or the full geometry.
+    """
+    for column in columns:
+        match = GENERALIZED_COLUMN.match(column)
+        if match and match['geometry'] == geometry_column and int(match['min_zoom']) <= z <= int(match['max_zoom']):
+            return column
+    return geometry_column
+
+
+def tile_query(layer, columns, z):
+    """
+    Build the single parameterized ST_AsMVT query of one layer at zoom `z`.
+    """
+    options = _tile_settings()
+    geometry = sql.Identifier(geometry_column_for_zoom(columns, options['geometry_column'], z))
+    attributes = sql.SQL('').join(
+        sql.SQL('{}, ').format(sql.Identifier(col)) for col in options['attributes'] if col in columns
+    )
+    return sql.SQL(
+        """
+        WITH bounds AS (
+            SELECT ST_TileEnvelope(%(z)s, %(x)s, %(y)s) AS env,
+                   ST_Transform(ST_TileEnvelope(%(z)s, %(x)s, %(y)s, margin => {margin}), {srid}) AS env_native
+        )
+        SELECT ST_AsMVT(q, {layer}, {extent}, 'geom')
+        FROM (
+            SELECT {attributes}ST_AsMVTGeom(
+                ST_Transform(t.{geometry}, {web_mercator}), b.env, {extent}, {buffer}, true
+            ) AS geom
+            FROM {table} t, bounds b
+            WHERE t.{geometry} && b.env_native
+        ) q
+        """
+    ).format(
+        srid=sql.Literal(options['srid']),
+        margin=sql.Literal(options['buffer'] / options['extent']),
+        layer=sql.Literal(layer),
+        extent=sql.Literal(options['extent']),
+        buffer=sql.Literal(options['buffer']),
+        attributes=attributes,
+        geometry=geometry,
+        web_mercator=sql.Literal(WEB_MERCATOR_SRID),
+        table=sql.Identifier(options['schema'], layer),
+    )
+
+
+def _etag(layer, version):
+    return f'"{layer}-{version}-{TILE_FORMAT}"'
+
+
+def _matches(request, etag):
+    header = request.headers.get('If-None-Match', '')
+    return header.strip() == '*' or etag in (tag.strip() for tag in header.split(','))
+
+
+async def tile_view(request, layer, z, x, y):
+    """
+    Serve one gzip-compressed MVT tile of a PostGIS layer.
+
+    The strong ETag is derived from the layer's row in `tile_data_version`, which the loader
+    bumps on every replacement, so a matching If-None-Match is answered with 304 after a
+    single primary key lookup, without rendering the tile.
+    """
+    if z < 0 or z > 24 or not (0 <= x < 1 << z and 0 <= y < 1 << z):
+        raise Http404('Invalid tile address.')
+
+    options = _tile_settings()
+    async with tile_connection(request) as conn:
+        layers = await get_layers(conn)
+        if layer not in layers:
+            # The layer may have been loaded since the catalog was read
+            layers = await get_layers(conn, refresh=True)
+            if layer not in layers:
+                raise Http404('Unknown layer.')
+
+        cursor = await conn.execute(DATA_VERSION_QUERY, (options['schema'], layer), prepare=True)
+        row = await cursor.fetchone()
+        version = row[0] if row else 0
+        etag = _etag(layer, version)
+        cache_control = f"public, max-age={options['max_age']}, must-revalidate"
+
+        if _matches(request, etag):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            response['Cache-Control'] = cache_control
+            return response
+
+        if _layer_versions.setdefault(layer, version) != version:
+            layers = await get_layers(conn, refresh=True)
+            _layer_versions[layer] = version
+            if layer not in layers:
+                raise Http404('Unknown layer.')
+
+        cursor = await conn.execute(tile_query(layer, layers[layer], z), {'z': z, 'x': x, 'y': y}, prepare=True)
+        row = await cursor.fetchone()
+
+    data = bytes(row[0]) if row and row[0] else b''
+    if not data:
+        response = HttpResponse(status=204)
+    else:
+        response = HttpResponse(gzip.compress(data), content_type='application/vnd.mapbox-vector-tile')
+        response['Content-Encoding'] = 'gzip'
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control
+    response['Access-Control-Allow-Origin'] = '*'
+    return response
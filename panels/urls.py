@@ -0,0 +1,17 @@
+from django.urls import include, path
+from rest_framework.routers import DefaultRouter
+
+from . import views
+
+router = DefaultRouter()
+router.register('roofs', views.AlignedRoofViewSet, basename='roof')
+router.register('jobs', views.PipelineJobViewSet, basename='job')
+
+urlpatterns = [
+    path('', include(router.urls)),
+    path('jobs/<int:pk>/events/', views.job_events, name='job-events'),
+    path('aggregates/bbox/', views.BBoxAggregateView.as_view(), name='aggregate-bbox'),
+    path('aggregates/<str:level>/', views.LevelAggregateView.as_view(), name='aggregate-list'),
+    path('aggregates/<str:level>/<str:key>/', views.LevelAggregateView.as_view(), name='aggregate-detail'),
+    path('breaks/<str:attribute>/', views.ClassBreaksView.as_view(), name='class-breaks'),
+]
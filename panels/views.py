@@ -1,3 +1,221 @@
-from django.shortcuts import render
+import asyncio
+import json
+import math
 
-# Create your views here.
+from asgiref.sync import sync_to_async
+from django.contrib.gis.db.models.functions import Transform
+from django.db import transaction
+from django.http import Http404, StreamingHttpResponse
+from django.core.exceptions import PermissionDenied
+from rest_framework import mixins
+from rest_framework.decorators import action
+from rest_framework.exceptions import ParseError
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework.viewsets import GenericViewSet, ReadOnlyModelViewSet
+from rest_framework_gis.filters import InBBoxFilter
+
+from . import aggregates, lookup
+from .functions import SimplifyPreserveTopology
+from .models import AlignedRoof, PipelineJob
+from .pagination import JobCursorPagination, RoofCursorPagination
+from .serializers import AlignedRoofSerializer, PipelineJobSerializer
+
+# Web mercator ground resolution at zoom 0, in metres per pixel
+ZOOM0_RESOLUTION = 156543.03392804097
+MAX_ZOOM = 22
+
+
+class LonLatInBBoxFilter(InBBoxFilter):
+    """
+    `in_bbox=west,south,east,north` in EPSG:4326, matched against the EPSG:2154 geometries.
+    """
+
+    def get_filter_bbox(self, request):
+        bbox = super().get_filter_bbox(request)
+        if bbox is not None:
+            bbox.srid = 4326
+        return bbox
+
+
+def request_zoom(request):
+    """
+    Zoom of a request: the `zoom` parameter, or the zoom at which `in_bbox` fills a 256 px tile.
+    """
+    zoom = request.query_params.get('zoom')
+    if zoom is not None:
+        try:
+            return max(0, min(MAX_ZOOM, int(zoom)))
+        except ValueError:
+            raise ParseError('Invalid zoom parameter.')
+    bbox = request.query_params.get('in_bbox')
+    if bbox:
+        try:
+            west, _, east, _ = (float(value) for value in bbox.split(','))
+        except ValueError:
+            raise ParseError('Invalid bbox string supplied for parameter in_bbox')
+        width = max(abs(east - west), 1e-9)
+        return max(0, min(MAX_ZOOM, int(math.log2(360 / width))))
+    return 0
+
+
+class AlignedRoofViewSet(ReadOnlyModelViewSet):
+    """
+    Aligned roofs as GeoJSON, filtered by `in_bbox` and paginated by cursor.
+
+    Geometries are simplified in PostGIS to about one pixel at the request zoom and returned
+    in EPSG:4326; only the served columns are read.
+    """
+
+    serializer_class = AlignedRoofSerializer
+    pagination_class = RoofCursorPagination
+    filter_backends = [LonLatInBBoxFilter]
+    bbox_filter_field = 'geometry'
+    bbox_filter_include_overlapping = True
+
+    @action(detail=False)
+    def at(self, request):
+        """
+        Attributes of the roofs under a clicked point (`lon`, `lat` in EPSG:4326).
+        """
+        try:
+            lon, lat = float(request.query_params['lon']), float(request.query_params['lat'])
+        except (KeyError, ValueError):
+            raise ParseError('lon and lat parameters are required.')
+        ids, cached = lookup.get_lookup().roof_ids_at(lon, lat)
+        return Response({'cached': cached, 'roofs': lookup.roof_attributes(ids)})
+
+    def get_queryset(self):
+        tolerance = ZOOM0_RESOLUTION / 2 ** request_zoom(self.request)
+        geometry = SimplifyPreserveTopology('geometry', tolerance) if tolerance >= 0.5 else 'geometry'
+        return (
+            AlignedRoof.objects
+            .only('id', 'nom', 'alignment', 'surface_ut', 'production', 'prod_euro')
+            .annotate(display_geometry=Transform(geometry, 4326))
+        )
+
+
+class LevelAggregateView(APIView):
+    """
+    Production statistics per commune or parcel, read from the views built with each load.
+
+    `/aggregates/<level>/` lists every group (parcels can be restricted with `commune=`),
+    `/aggregates/<level>/<key>/` returns one group. Results are cached in-process until the
+    next load.
+    """
+
+    def get(self, request, level, key=None):
+        if level not in aggregates.LEVELS:
+            raise Http404('Unknown aggregation level.')
+        rows = aggregates.level_aggregates(level, key=key, commune=request.query_params.get('commune'))
+        if rows is None:
+            raise Http404(f'No {level} aggregates for this table.')
+        if key is None:
+            return Response(rows)
+        if not rows:
+            raise Http404(f'No {level} {key}.')
+        return Response(rows[0])
+
+
+class BBoxAggregateView(APIView):
+    """
+    Production statistics of the roofs meeting `in_bbox=west,south,east,north` (EPSG:4326).
+    """
+
+    def get(self, request):
+        bbox = request.query_params.get('in_bbox')
+        if not bbox:
+            raise ParseError('Missing in_bbox parameter.')
+        try:
+            west, south, east, north = (round(float(value), 6) for value in bbox.split(','))
+        except ValueError:
+            raise ParseError('Invalid bbox string supplied for parameter in_bbox')
+        return Response(aggregates.bbox_aggregates((west, south, east, north)))
+
+
+class ClassBreaksView(APIView):
+    """
+    Legend class breaks (quantile, Jenks and pretty) of an attribute, global or per `commune=`.
+    """
+
+    def get(self, request, attribute):
+        breaks = aggregates.class_breaks(attribute, commune=request.query_params.get('commune'))
+        if breaks is None:
+            raise Http404(f'No class breaks for {attribute}.')
+        method = request.query_params.get('method')
+        if method is not None:
+            if method not in breaks['breaks']:
+                raise ParseError(f'Unknown method {method}.')
+            breaks = {**breaks, 'breaks': {method: breaks['breaks'][method]}}
+        return Response(breaks)
+
+
+class PipelineJobViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin, GenericViewSet):
+    """
+    Queue pipeline runs (`POST {"pipeline": ..., "args": [...]}`) and poll their state and progress.
+
+    Jobs are run by `manage.py runjobs`, never in the web process; `/jobs/<id>/events/` streams
+    the progress of one job as server-sent events.
+    """
+
+    queryset = PipelineJob.objects.all()
+    serializer_class = PipelineJobSerializer
+    pagination_class = JobCursorPagination
+    permission_classes = [IsAdminUser]
+
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        with transaction.atomic():
+            job = PipelineJob.objects.select_for_update().get(pk=self.get_object().pk)
+            if job.status == PipelineJob.Status.QUEUED:
+                job.status = PipelineJob.Status.CANCELLED
+            elif not job.finished:
+                # The runner terminates the process on its next poll
+                job.cancel_requested = True
+            job.save(update_fields=['status', 'cancel_requested'])
+        return Response(self.get_serializer(job).data)
+
+
+def _is_staff(request):
+    return request.user.is_authenticated and request.user.is_staff
+
+
+def _event(data):
+    return f'data: {json.dumps(data, default=str)}\n\n'
+
+
+async def job_events(request, pk):
+    """
+    Stream the state and progress of a job as server-sent events until it finishes.
+
+    The job row is polled every second on the event loop, so open streams do not hold a worker thread.
+    """
+    if not await sync_to_async(_is_staff)(request):
+        raise PermissionDenied
+    try:
+        job = await PipelineJob.objects.aget(pk=pk)
+    except PipelineJob.DoesNotExist:
+        raise Http404('No such job.')
+
+    async def stream(job):
+        last, idle = None, 0
+        while True:
+            state = PipelineJobSerializer(job).data
+            if state != last:
+                yield _event(state)
+                last, idle = state, 0
+            elif idle >= 15:
+                # Comment line keeping proxies from closing an idle stream
+                yield ': keep-alive\n\n'
+                idle = 0
+            if job.finished:
+                return
+            await asyncio.sleep(1)
+            idle += 1
+            job = await PipelineJob.objects.aget(pk=job.pk)
+
+    response = StreamingHttpResponse(stream(job), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -2,6 +2,8 @@
 ASGI config for panels_api project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server (e.g. ``uvicorn panels_api.asgi:application``) so the
+async tile view runs on the event loop instead of a thread per request.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
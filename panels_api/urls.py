@@ -15,8 +15,12 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path
+from django.urls import include, path
+
+from panels.tiles import tile_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/', include('panels.urls')),
+    path('tiles/<str:layer>/<int:z>/<int:x>/<int:y>.pbf', tile_view, name='tile'),
 ]
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from core.process.breaks import (
+    QuantileSketch,
+    build_sketches,
+    class_breaks,
+    jenks_breaks,
+    pretty_breaks,
+    quantile_breaks,
+)
+
+
+def sketch_of(values, relative_accuracy=0.01):
+    return QuantileSketch(relative_accuracy).add(values)
+
+
+def test_quantile_breaks_on_uniform_values():
+    breaks = quantile_breaks(sketch_of(np.arange(101)), 4)
+    # The extremes are exact, the inner edges within the relative accuracy of the sketch
+    assert breaks[0] == 0 and breaks[-1] == 100
+    np.testing.assert_allclose(breaks[1:-1], [25, 50, 75], rtol=0.02)
+
+
+def test_quantile_breaks_of_merged_sketches():
+    merged = sketch_of(np.arange(50)).merge(sketch_of(np.arange(50, 101)))
+    np.testing.assert_array_equal(quantile_breaks(merged, 4), quantile_breaks(sketch_of(np.arange(101)), 4))
+
+
+def test_jenks_breaks_separate_clusters():
+    values = [1, 1.1, 1.2, 10, 10.5, 11, 100, 101, 102]
+    breaks = jenks_breaks(sketch_of(values), 3)
+    assert len(breaks) == 4
+    assert breaks[0] == 1 and breaks[-1] == 102
+    # Each inner edge is the top of a cluster
+    np.testing.assert_allclose(breaks[1:-1], [1.2, 11], rtol=0.02)
+
+
+def test_jenks_breaks_with_few_distinct_values():
+    breaks = jenks_breaks(sketch_of([5, 5, 5, 8]), 5)
+    assert breaks[0] == 5 and breaks[-1] == 8
+    assert np.all(np.diff(breaks) > 0)
+
+
+@pytest.mark.parametrize(("values", "num_classes", "expected"), [
+    ([3, 587], 5, [0, 200, 400, 600]),
+    ([0.12, 0.97], 4, [0, 0.25, 0.5, 0.75, 1]),
+    ([-14, 36], 5, [-20, -10, 0, 10, 20, 30, 40]),
+])
+def test_pretty_breaks(values, num_classes, expected):
+    np.testing.assert_allclose(pretty_breaks(sketch_of(values), num_classes), expected)
+
+
+def test_pretty_breaks_of_constant_values():
+    np.testing.assert_array_equal(pretty_breaks(sketch_of([4, 4]), 5), [4, 4])
+
+
+def test_class_breaks_methods():
+    breaks = class_breaks(sketch_of(np.arange(1, 101)), 5, methods=["quantile", "jenks", "pretty"])
+    assert set(breaks) == {"quantile", "jenks", "pretty"}
+    assert len(breaks["quantile"]) == len(breaks["jenks"]) == 6
+    with pytest.raises(ValueError):
+        class_breaks(sketch_of([1, 2]), 5, methods=["equal"])
+
+
+def test_build_sketches_per_group():
+    frames = [
+        pd.DataFrame({"nom": ["a", "a", "b"], "PROD_EURO": [1.0, 2.0, None]}),
+        pd.DataFrame({"nom": ["b", "b"], "PROD_EURO": [10.0, 20.0]}),
+    ]
+    overall, groups = build_sketches(frames, "PROD_EURO", group_column="nom")
+    assert overall.count == 4 and (overall.min, overall.max) == (1.0, 20.0)
+    assert {group: sketch.count for group, sketch in groups.items()} == {"a": 2, "b": 2}
@@ -0,0 +1,181 @@
+import gzip
+import json
+import threading
+import time
+import urllib.error
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from core.process.footprints import DatasetLinksCatalog, download_footprints
+
+
+def feature_lines(n, offset=0.0):
+    lines = []
+    for i in range(n):
+        x = offset + i * 0.001
+        ring = [[x, 45.0], [x + 0.0005, 45.0], [x + 0.0005, 45.0005], [x, 45.0005], [x, 45.0]]
+        feature = {"type": "Feature", "properties": {"height": i}, "geometry": {"type": "Polygon", "coordinates": [ring]}}
+        lines.append(json.dumps(feature))
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+class StandIn:
+    """
+    Local HTTP stand-in for the footprint host: gzipped tiles, a flaky tile and the links CSV.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.active = 0
+        self.peak = 0
+        self.delay = 0.0
+        self.failures = {}  # path -> statuses returned before succeeding
+        self.files = {}  # path -> (body, content type)
+        self.etag = '"v1"'
+
+    def handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with stand_in.lock:
+                    stand_in.requests[self.path] = stand_in.requests.get(self.path, 0) + 1
+                    stand_in.active += 1
+                    stand_in.peak = max(stand_in.peak, stand_in.active)
+                    failures = stand_in.failures.get(self.path)
+                    status = failures.pop(0) if failures else 200
+                try:
+                    time.sleep(stand_in.delay)
+                    if status != 200:
+                        self.send_error(status)
+                    elif self.path not in stand_in.files:
+                        self.send_error(404)
+                    elif self.path.endswith(".csv") and self.headers.get("If-None-Match") == stand_in.etag:
+                        self.send_response(304)
+                        self.end_headers()
+                    else:
+                        body, content_type = stand_in.files[self.path]
+                        self.send_response(200)
+                        self.send_header("Content-Type", content_type)
+                        self.send_header("Content-Length", str(len(body)))
+                        self.send_header("ETag", stand_in.etag)
+                        self.end_headers()
+                        self.wfile.write(body)
+                finally:
+                    with stand_in.lock:
+                        stand_in.active -= 1
+
+        return Handler
+
+
+@pytest.fixture
+def stand_in():
+    stand_in = StandIn()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), stand_in.handler())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    stand_in.url = f"http://127.0.0.1:{server.server_address[1]}"
+    for i, quad_key in enumerate(["1202", "1203", "1212", "1213"]):
+        stand_in.files[f"/tiles/{quad_key}.csv.gz"] = (gzip.compress(feature_lines(5, offset=i)), "application/gzip")
+    yield stand_in
+    server.shutdown()
+    server.server_close()
+
+
+def tile_links(stand_in, quad_keys):
+    return {quad_key: f"{stand_in.url}/tiles/{quad_key}.csv.gz" for quad_key in quad_keys}
+
+
+def test_download_footprints_concurrently(stand_in):
+    stand_in.delay = 0.3
+    quad_keys = ["1202", "1203", "1212", "1213"]
+    start = time.monotonic()
+    gdf = download_footprints(quad_keys, tile_links(stand_in, quad_keys), max_workers=4, with_properties=True)
+    elapsed = time.monotonic() - start
+
+    assert len(gdf) == 20
+    assert sorted(gdf["quadkey"].unique()) == quad_keys
+    assert sorted(gdf["height"].unique()) == [0, 1, 2, 3, 4]
+    assert gdf.crs.to_epsg() == 4326
+    assert stand_in.peak > 1
+    assert elapsed < 4 * stand_in.delay
+
+
+def test_download_footprints_to_geoparquet_and_cache(stand_in, tmp_path):
+    import geopandas as gpd
+
+    quad_keys = ["1202", "1203"]
+    links = tile_links(stand_in, quad_keys)
+    output = tmp_path / "footprints.parquet"
+    written = download_footprints(quad_keys, links, output_path=str(output), cache_dir=str(tmp_path / "cache"))
+
+    assert written == 10
+    assert len(gpd.read_parquet(output)) == 10
+    assert sorted(p.name for p in (tmp_path / "cache").iterdir()) == ["1202.parquet", "1203.parquet"]
+
+    # Cached tiles are not downloaded again
+    gdf = download_footprints(quad_keys, links, cache_dir=str(tmp_path / "cache"))
+    assert len(gdf) == 10
+    assert all(stand_in.requests[f"/tiles/{quad_key}.csv.gz"] == 1 for quad_key in quad_keys)
+
+
+def test_download_retries_transient_errors(stand_in):
+    stand_in.failures["/tiles/1202.csv.gz"] = [503, 500]
+    gdf = download_footprints(["1202"], tile_links(stand_in, ["1202"]), retries=3, backoff=0)
+
+    assert len(gdf) == 5
+    assert stand_in.requests["/tiles/1202.csv.gz"] == 3
+
+
+def test_download_gives_up(stand_in):
+    stand_in.failures["/tiles/1202.csv.gz"] = [503, 503, 503]
+    with pytest.raises(urllib.error.HTTPError):
+        download_footprints(["1202"], tile_links(stand_in, ["1202"]), retries=2, backoff=0)
+    assert stand_in.requests["/tiles/1202.csv.gz"] == 2
+
+    # Client errors are not retried
+    with pytest.raises(urllib.error.HTTPError):
+        download_footprints(["0000"], {"0000": f"{stand_in.url}/tiles/0000.csv.gz"}, retries=3, backoff=0)
+    assert stand_in.requests["/tiles/0000.csv.gz"] == 1
+
+
+def test_download_rejects_unknown_quadkeys(stand_in):
+    with pytest.raises(ValueError):
+        download_footprints(["9999"], tile_links(stand_in, ["1202"]))
+
+
+def test_dataset_links_catalog_cache(stand_in, tmp_path):
+    rows = ["Location,QuadKey,Url,Size,UploadDate"]
+    rows += [f"France,{quad_key},{stand_in.url}/tiles/{quad_key}.csv.gz,1KB,2024-01-01" for quad_key in ["1202", "1203"]]
+    rows += [f"Spain,1212,{stand_in.url}/tiles/1212.csv.gz,1KB,2024-01-01"]
+    stand_in.files["/dataset-links.csv"] = (("\n".join(rows) + "\n").encode("utf-8"), "text/csv")
+    path = str(tmp_path / "links.sqlite")
+    url = f"{stand_in.url}/dataset-links.csv"
+
+    catalog = DatasetLinksCatalog(path=path, url=url, max_age=3600)
+    links = catalog.links(["1202", "1212", "9999"])
+    assert links == {"1202": f"{stand_in.url}/tiles/1202.csv.gz", "1212": f"{stand_in.url}/tiles/1212.csv.gz"}
+    assert [quad_key for quad_key, _ in catalog.location_links("France")] == ["1202", "1203"]
+    assert stand_in.requests["/dataset-links.csv"] == 1
+    catalog.close()
+
+    # A fresh catalogue on the same file is answered locally until max_age expires
+    catalog = DatasetLinksCatalog(path=path, url=url, max_age=3600)
+    assert catalog.links(["1203"]) == {"1203": f"{stand_in.url}/tiles/1203.csv.gz"}
+    assert stand_in.requests["/dataset-links.csv"] == 1
+
+    # Revalidation with the stored ETag costs a 304 and keeps the rows
+    assert catalog.refresh(force=True) is False
+    assert stand_in.requests["/dataset-links.csv"] == 2
+    assert len(catalog.location_links("France")) == 2
+    catalog.close()
+
+    # An unreachable server falls back to the cached copy
+    offline = DatasetLinksCatalog(path=path, url="http://127.0.0.1:9/dataset-links.csv", max_age=0, timeout=1)
+    assert offline.links(["1212"]) == {"1212": f"{stand_in.url}/tiles/1212.csv.gz"}
+    offline.close()
@@ -0,0 +1,94 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+import shapely
+
+from core.process import gcp
+from core.process.gcp import apply_affine, extract_gcps, fit_affine, ransac_affine, thin_gcps
+
+ORIGIN = np.array([650000.0, 6860000.0])
+AFFINE = np.array([[1.0002, 0.0010], [-0.0008, 0.9997], [0.0, 0.0]])
+SHIFT = np.array([2.5, -1.5])
+
+
+def transform(points):
+    return (points - ORIGIN) @ AFFINE[:2] + ORIGIN + SHIFT
+
+
+def pairs_with_outliers(n=500, outliers=150, noise=0.05, seed=0):
+    rng = np.random.default_rng(seed)
+    source = ORIGIN + rng.uniform(0, 5000, size=(n, 2))
+    target = transform(source) + rng.normal(scale=noise, size=(n, 2))
+    bad = rng.choice(n, size=outliers, replace=False)
+    target[bad] += rng.uniform(20, 200, size=(outliers, 2)) * rng.choice([-1, 1], size=(outliers, 2))
+    return source, target, bad
+
+
+def test_fit_affine_is_exact_without_noise():
+    source = ORIGIN + np.random.default_rng(1).uniform(0, 100, size=(10, 2))
+    np.testing.assert_allclose(apply_affine(fit_affine(source, transform(source)), source), transform(source))
+
+
+def test_ransac_rejects_injected_outliers():
+    source, target, bad = pairs_with_outliers()
+    coefficients, inliers = ransac_affine(source, target, threshold=0.5, iterations=500)
+
+    expected = np.ones(len(source), dtype=bool)
+    expected[bad] = False
+    np.testing.assert_array_equal(inliers, expected)
+    # The refit on the inliers recovers the transform to well under the noise level
+    points = ORIGIN + np.random.default_rng(2).uniform(0, 5000, size=(100, 2))
+    assert np.abs(apply_affine(coefficients, points) - transform(points)).max() < 0.05
+
+
+def test_ransac_scores_on_a_sample(monkeypatch):
+    monkeypatch.setattr(gcp, "RANSAC_SAMPLE_SIZE", 50)
+    source, target, bad = pairs_with_outliers(n=2000, outliers=600, seed=3)
+    _, inliers = ransac_affine(source, target, threshold=0.5, iterations=300)
+    # Inliers are still decided on every pair, not only the scored sample
+    assert not inliers[bad].any()
+    assert inliers.sum() == 2000 - 600
+
+
+def test_ransac_is_reproducible():
+    source, target, _ = pairs_with_outliers(seed=4)
+    first = ransac_affine(source, target, iterations=100, seed=7)
+    second = ransac_affine(source, target, iterations=100, seed=7)
+    np.testing.assert_array_equal(first[0], second[0])
+    np.testing.assert_array_equal(first[1], second[1])
+
+
+def test_ransac_needs_three_non_collinear_pairs():
+    with pytest.raises(ValueError):
+        ransac_affine(ORIGIN + [[0, 0], [1, 1]], ORIGIN + [[0, 0], [1, 1]])
+    line = ORIGIN + np.column_stack((np.arange(5.0), np.arange(5.0)))
+    with pytest.raises(ValueError, match="degenerate"):
+        ransac_affine(line, line, iterations=10)
+
+
+def test_thin_gcps_keeps_the_best_point_per_cell():
+    gcps = pd.DataFrame({
+        "source_x": [0.5, 0.6, 5.5, 5.6, 12.0],
+        "source_y": [0.5, 0.6, 0.5, 0.4, 12.0],
+        "residual": [0.3, 0.1, 0.2, 0.4, 0.5],
+    })
+    kept = thin_gcps(gcps, cell_size=5, max_gcps=None)
+    assert kept.index.tolist() == [1, 2, 4]
+    assert len(thin_gcps(gcps, cell_size=5, max_gcps=2)) <= 2
+
+
+def test_extract_gcps_from_shifted_polygons():
+    rng = np.random.default_rng(5)
+    corners = ORIGIN + rng.uniform(0, 3000, size=(200, 2))
+    target = gpd.GeoDataFrame(geometry=shapely.box(corners[:, 0], corners[:, 1], corners[:, 0] + 12, corners[:, 1] + 9),
+                              crs="EPSG:2154")
+    reference = target.translate(*SHIFT)
+    # A few reference polygons that moved on their own
+    reference.iloc[:10] = reference.iloc[:10].translate(4.0, 4.0)
+    reference = gpd.GeoDataFrame(geometry=reference, crs="EPSG:2154")
+
+    gcps, coefficients = extract_gcps(target, reference, min_overlap_ratio=0.3, threshold=0.5, max_gcps=50)
+    assert 0 < len(gcps) <= 50
+    assert gcps["residual"].max() < 0.5
+    np.testing.assert_allclose(apply_affine(coefficients, ORIGIN[None]), ORIGIN[None] + SHIFT, atol=1e-6)
@@ -0,0 +1,160 @@
+import sqlite3
+from contextlib import closing
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+import shapely
+from shapely import affinity
+
+from core.process.incremental import (
+    _state_frame,
+    affected_tiles,
+    diff_state,
+    feature_hashes,
+    update_mbtiles,
+)
+from core.process.mvt import build_mbtiles, tile_bounds
+
+ZOOMS = {"min_zoom": 4, "max_zoom": 8, "max_workers": 1}
+
+
+def roofs():
+    # Two communes of small squares around Lyon, in EPSG:3857
+    x0, y0 = 538000.0, 5740000.0
+    rows = []
+    for i in range(6):
+        for commune, dx in (("Lyon", 0.0), ("Villeurbanne", 40000.0)):
+            rows.append({"nom": commune, "height": float(i),
+                         "geometry": shapely.box(x0 + dx + i * 3000, y0, x0 + dx + i * 3000 + 500, y0 + 500)})
+    return gpd.GeoDataFrame(rows, crs="EPSG:3857")
+
+
+def state_of(gdf):
+    return _state_frame(gdf, feature_hashes(gdf), "nom")
+
+
+def read_tiles(path):
+    with closing(sqlite3.connect(path)) as conn:
+        return dict(((z, x, y), data) for z, x, y, data in conn.execute(
+            "SELECT zoom_level, tile_column, tile_row, tile_data FROM tiles"))
+
+
+def test_feature_hashes_are_stable_and_distinguish_duplicates():
+    gdf = roofs()
+    gdf = pd.concat([gdf, gdf.iloc[[0]]], ignore_index=True)
+    hashes = feature_hashes(gdf)
+    assert len(set(hashes.tolist())) == len(gdf)
+    np.testing.assert_array_equal(hashes, feature_hashes(gdf.copy()))
+    # Attributes left out of the hash do not change it
+    edited = gdf.assign(height=gdf["height"] + 1)
+    np.testing.assert_array_equal(feature_hashes(edited, ["nom"]), feature_hashes(gdf, ["nom"]))
+    assert not np.array_equal(feature_hashes(edited), hashes)
+
+
+def test_diff_added_feature():
+    old = roofs()
+    new = pd.concat([old, gpd.GeoDataFrame([{"nom": "Lyon", "height": 9.0, "geometry": shapely.box(0, 0, 1, 1)}],
+                                           crs=old.crs)], ignore_index=True)
+    changed, removed, added = diff_state(state_of(old), state_of(new))
+    assert changed == ["Lyon"]
+    assert removed.empty
+    assert len(added) == 1
+    assert added[["minx", "miny", "maxx", "maxy"]].to_numpy().tolist() == [[0, 0, 1, 1]]
+
+
+def test_diff_removed_feature():
+    old = roofs()
+    new = old.drop(index=3)
+    changed, removed, added = diff_state(state_of(old), state_of(new))
+    assert changed == [old.loc[3, "nom"]]
+    assert added.empty
+    assert removed[["minx", "miny", "maxx", "maxy"]].to_numpy().tolist() == [list(old.geometry[3].bounds)]
+
+
+def test_diff_moved_feature():
+    old = roofs()
+    new = old.copy()
+    new.loc[0, "geometry"] = affinity.translate(old.geometry[0], 10000, 0)
+    changed, removed, added = diff_state(state_of(old), state_of(new))
+    assert changed == ["Lyon"]
+    # A move is the removal of the old geometry and the addition of the new one
+    assert removed[["minx", "maxx"]].to_numpy().tolist() == [[old.geometry[0].bounds[0], old.geometry[0].bounds[2]]]
+    assert added[["minx", "maxx"]].to_numpy().tolist() == [[new.geometry[0].bounds[0], new.geometry[0].bounds[2]]]
+
+
+def test_diff_unchanged():
+    assert diff_state(state_of(roofs()), state_of(roofs()))[0] == []
+
+
+def test_affected_tiles_include_the_buffer():
+    minx, miny, maxx, maxy = tile_bounds(8, 130, 90)
+    inside = np.array([[minx + 10, miny + 10, minx + 20, miny + 20]])
+    assert affected_tiles(inside, 8, 8, buffer_ratio=0) == {8: [(130, 90)]}
+    # Close to the west and south edges, the buffered neighbours are touched too
+    assert affected_tiles(inside, 8, 8, buffer_ratio=0.01) == {8: [(129, 90), (129, 91), (130, 90), (130, 91)]}
+    assert affected_tiles(np.empty((0, 4)), 3, 4) == {3: [], 4: []}
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "roofs.parquet"
+    roofs().to_parquet(path)
+    return path
+
+
+def rebuild_matches(tmp_path, gdf, output, columns=None):
+    path = str(tmp_path / "fresh.parquet")
+    gdf.to_parquet(path)
+    fresh = str(tmp_path / "fresh.mbtiles")
+    build_mbtiles(path, fresh, layer_name="roofs", columns=columns, simplification=1.0,
+                  feature_ids=feature_hashes(gdf.to_crs("EPSG:3857").reset_index(drop=True), columns), **ZOOMS)
+    return read_tiles(fresh) == read_tiles(output)
+
+
+def test_update_mbtiles_full_then_incremental(tmp_path, source):
+    output = str(tmp_path / "roofs.mbtiles")
+    result = update_mbtiles(str(source), output, attribute="nom", **ZOOMS)
+    assert result["changed"] == ["Lyon", "Villeurbanne"]
+    assert result["written"] == len(read_tiles(output)) > 0
+
+    assert update_mbtiles(str(source), output, attribute="nom", **ZOOMS)["changed"] == []
+
+    # Move a Villeurbanne roof far east, alone in its new tiles
+    gdf = roofs()
+    gdf.loc[1, "geometry"] = affinity.translate(gdf.geometry[1], 400000, 0)
+    gdf.to_parquet(source)
+    result = update_mbtiles(str(source), output, attribute="nom", **ZOOMS)
+    assert result["changed"] == ["Villeurbanne"]
+    assert result["written"] > 0
+    assert rebuild_matches(tmp_path, gdf, output)
+
+    # Remove it again, which empties its tiles, and add a Lyon roof
+    gdf = pd.concat([gdf.drop(index=1), gpd.GeoDataFrame(
+        [{"nom": "Lyon", "height": 7.0, "geometry": shapely.box(500000, 5700000, 500500, 5700500)}], crs=gdf.crs,
+    )], ignore_index=True)
+    gdf.to_parquet(source)
+    result = update_mbtiles(str(source), output, attribute="nom", **ZOOMS)
+    assert result["changed"] == ["Lyon", "Villeurbanne"]
+    assert result["deleted"] > 0
+    assert rebuild_matches(tmp_path, gdf, output)
+
+
+def test_update_mbtiles_uses_the_stored_columns(tmp_path, source):
+    output = str(tmp_path / "roofs.mbtiles")
+    update_mbtiles(str(source), output, attribute="nom", columns=["nom"], **ZOOMS)
+
+    # Without columns, the update hashes and renders with those of the last build
+    assert update_mbtiles(str(source), output, attribute="nom", **ZOOMS)["changed"] == []
+    gdf = roofs()
+    gdf.loc[0, "geometry"] = affinity.translate(gdf.geometry[0], 0, 5000)
+    gdf.to_parquet(source)
+    assert update_mbtiles(str(source), output, attribute="nom", **ZOOMS)["changed"] == ["Lyon"]
+    assert rebuild_matches(tmp_path, gdf, output, columns=["nom"])
+
+    # Other columns rebuild everything
+    result = update_mbtiles(str(source), output, attribute="nom", columns=["nom", "height"], **ZOOMS)
+    assert result["changed"] == ["Lyon", "Villeurbanne"]
+    assert result["written"] == len(read_tiles(output))
+    assert rebuild_matches(tmp_path, gdf, output, columns=["nom", "height"])
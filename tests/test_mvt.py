@@ -0,0 +1,232 @@
+import gzip
+import struct
+
+import numpy as np
+import shapely
+
+from core.process.mvt import (
+    CMD_CLOSE_PATH,
+    CMD_LINE_TO,
+    CMD_MOVE_TO,
+    GEOM_LINESTRING,
+    GEOM_POINT,
+    GEOM_POLYGON,
+    encode_geometry,
+    encode_layer,
+    render_tile,
+    tile_bounds,
+)
+
+
+# --- Minimal protobuf / MVT decoder ---------------------------------------------
+
+def read_varint(data, pos):
+    result, shift = 0, 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def read_fields(data):
+    pos, fields = 0, []
+    while pos < len(data):
+        key, pos = read_varint(data, pos)
+        number, wire_type = key >> 3, key & 0x7
+        if wire_type == 0:
+            value, pos = read_varint(data, pos)
+        elif wire_type == 1:
+            value, pos = data[pos:pos + 8], pos + 8
+        elif wire_type == 2:
+            length, pos = read_varint(data, pos)
+            value, pos = data[pos:pos + length], pos + length
+        else:
+            raise ValueError(f"Unexpected wire type {wire_type}")
+        fields.append((number, value))
+    return fields
+
+
+def read_packed(data):
+    pos, values = 0, []
+    while pos < len(data):
+        value, pos = read_varint(data, pos)
+        values.append(value)
+    return values
+
+
+def unzigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def decode_value(data):
+    (number, value), = read_fields(data)
+    if number == 1:
+        return value.decode("utf-8")
+    if number == 3:
+        return struct.unpack("<d", value)[0]
+    if number == 6:
+        return unzigzag(value)
+    if number == 7:
+        return bool(value)
+    raise ValueError(f"Unexpected value field {number}")
+
+
+def decode_commands(commands):
+    """
+    Decode a command stream into parts: lists of absolute (x, y) with a closed flag.
+    """
+    parts, x, y, i = [], 0, 0, 0
+    while i < len(commands):
+        command_id, count = commands[i] & 0x7, commands[i] >> 3
+        i += 1
+        if command_id == CMD_CLOSE_PATH:
+            parts[-1][1] = True
+            continue
+        for _ in range(count):
+            x += unzigzag(commands[i])
+            y += unzigzag(commands[i + 1])
+            i += 2
+            if command_id == CMD_MOVE_TO:
+                parts.append([[(x, y)], False])
+            else:
+                assert command_id == CMD_LINE_TO
+                parts[-1][0].append((x, y))
+    return parts
+
+
+def decode_tile(data):
+    """
+    Decode a (single layer) tile into its name, extent and features.
+    """
+    (number, layer), = read_fields(data)
+    assert number == 3
+    name, extent, keys, values, features = None, None, [], [], []
+    for number, value in read_fields(layer):
+        if number == 1:
+            name = value.decode("utf-8")
+        elif number == 2:
+            features.append(value)
+        elif number == 3:
+            keys.append(value.decode("utf-8"))
+        elif number == 4:
+            values.append(decode_value(value))
+        elif number == 5:
+            extent = value
+    decoded = []
+    for feature in features:
+        fields = dict(read_fields(feature))
+        tags = read_packed(fields.get(2, b""))
+        decoded.append({
+            "id": fields.get(1),
+            "type": fields[3],
+            "properties": {keys[k]: values[v] for k, v in zip(tags[::2], tags[1::2])},
+            "parts": decode_commands(read_packed(fields[4])),
+        })
+    return name, extent, decoded
+
+
+def signed_area(points):
+    points = np.array(points, dtype=float)
+    x, y = points[:, 0], points[:, 1]
+    return np.sum(x * np.roll(y, -1) - np.roll(x, -1) * y) / 2
+
+
+# --- Tests --------------------------------------------------------------------
+
+def test_point_commands():
+    geom_type, commands = encode_geometry(shapely.MultiPoint([(5, 7), (3, 2)]))
+    assert geom_type == GEOM_POINT
+    # One MoveTo repeated twice, with zigzag deltas from the cursor
+    assert commands == [(2 << 3) | CMD_MOVE_TO, 10, 14, 3, 9]
+
+
+def test_line_commands_skip_repeated_points():
+    geom_type, commands = encode_geometry(shapely.LineString([(2, 2), (2, 2), (2, 10), (10, 10)]))
+    assert geom_type == GEOM_LINESTRING
+    assert commands == [9, 4, 4, 18, 0, 16, 16, 0]
+    (points, closed), = decode_commands(commands)
+    assert points == [(2, 2), (2, 10), (10, 10)] and not closed
+
+
+def test_polygon_ring_winding():
+    # Counter-clockwise exterior and clockwise hole in tile coordinates: both must be flipped
+    exterior = [(0, 0), (100, 0), (100, 100), (0, 100), (0, 0)]
+    hole = [(20, 20), (20, 80), (80, 80), (80, 20), (20, 20)]
+    polygon = shapely.Polygon(exterior, [hole])
+    assert signed_area(exterior[:-1]) > 0
+
+    geom_type, commands = encode_geometry(polygon)
+    assert geom_type == GEOM_POLYGON
+    assert commands[0] == (1 << 3) | CMD_MOVE_TO
+    (outer, outer_closed), (inner, inner_closed) = decode_commands(commands)
+    assert outer_closed and inner_closed
+    # Exterior rings have a positive area in the y-down tile grid, holes a negative one
+    assert signed_area(outer) > 0
+    assert signed_area(inner) < 0
+    assert sorted(outer) == sorted(exterior[:-1])
+    assert sorted(inner) == sorted(hole[:-1])
+
+
+def test_degenerate_ring_is_dropped():
+    geom_type, commands = encode_geometry(shapely.Polygon([(0, 0), (1, 0), (0, 0), (0, 0)]))
+    assert commands == []
+
+
+def test_layer_round_trip():
+    squares = [shapely.box(i * 10, 0, i * 10 + 5, 5) for i in range(3)]
+    properties = [
+        {"commune": "Lyon", "height": 12, "area": 2.5, "flat": True},
+        {"commune": "Lyon", "height": -3, "area": None, "flat": False},
+        {"commune": "Paris", "height": 12, "area": float("nan"), "flat": True},
+    ]
+    layer = encode_layer("roofs", squares, properties, feature_ids=np.array([7, 8, 9]), extent=4096)
+    name, extent, features = decode_tile(layer)
+
+    assert name == "roofs" and extent == 4096
+    assert [feature["id"] for feature in features] == [7, 8, 9]
+    assert all(feature["type"] == GEOM_POLYGON for feature in features)
+    # Missing and NaN values are left out, repeated values share one entry of the value table
+    assert [feature["properties"] for feature in features] == [
+        {"commune": "Lyon", "height": 12, "area": 2.5, "flat": True},
+        {"commune": "Lyon", "height": -3, "flat": False},
+        {"commune": "Paris", "height": 12, "flat": True},
+    ]
+    for square, feature in zip(squares, features):
+        (points, closed), = feature["parts"]
+        assert closed
+        assert shapely.Polygon(points).equals(square)
+
+
+def test_layer_keeps_int_and_bool_values_apart():
+    layer = encode_layer("t", [shapely.Point(1, 1), shapely.Point(2, 2)], [{"v": 1}, {"v": True}])
+    _, _, features = decode_tile(layer)
+    assert [feature["properties"]["v"] for feature in features] == [1, True]
+    assert type(features[1]["properties"]["v"]) is bool
+
+
+def test_empty_layer():
+    assert encode_layer("t", [shapely.Polygon()], [{}]) == b""
+
+
+def test_render_tile_projects_to_tile_grid():
+    z, x, y = 10, 520, 360
+    minx, miny, maxx, maxy = tile_bounds(z, x, y)
+    quarter = (maxx - minx) / 4
+    # The north-west quarter of the tile
+    geometry = shapely.box(minx, maxy - quarter, minx + quarter, maxy)
+    options = {"extent": 4096, "buffer": 64, "simplification": 0.0}
+    data = render_tile(np.array([geometry]), [{"id": 1}], None, "roofs", z, x, y, options)
+
+    _, _, (feature,) = decode_tile(gzip.decompress(data))
+    (points, _), = feature["parts"]
+    assert sorted(points) == [(0, 0), (0, 1024), (1024, 0), (1024, 1024)]
+
+
+def test_render_tile_outside_is_empty():
+    minx, miny, maxx, maxy = tile_bounds(10, 520, 360)
+    far = shapely.box(maxx + 10000, maxy, maxx + 20000, maxy + 10000)
+    options = {"extent": 4096, "buffer": 64, "simplification": 0.0}
+    assert render_tile(np.array([far]), [{}], None, "roofs", 10, 520, 360, options) is None
@@ -0,0 +1,184 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+import shapely
+
+from core.process import tps
+from core.process.tps import DisplacementGrid, ThinPlateSpline, fit_grid, fit_tps, warp_geometries
+
+# Lambert-93 sized coordinates, to exercise the centring and scaling of the fit
+ORIGIN = np.array([650000.0, 6860000.0])
+
+
+def control_points(n=25, seed=0):
+    rng = np.random.default_rng(seed)
+    return ORIGIN + rng.uniform(0, 2000, size=(n, 2))
+
+
+def bend(points):
+    # A smooth non-linear distortion of a few meters
+    x, y = ((points - ORIGIN) / 2000).T
+    return points + np.column_stack((3 * np.sin(3 * y), 2 * x * y))
+
+
+def test_identity():
+    source = control_points()
+    model = ThinPlateSpline(source, source)
+    points = ORIGIN + np.random.default_rng(1).uniform(-500, 2500, size=(200, 2))
+    np.testing.assert_allclose(model(points), points, atol=1e-6)
+
+
+def test_interpolates_control_points():
+    source = control_points()
+    target = bend(source)
+    model = ThinPlateSpline(source, target)
+    np.testing.assert_allclose(model(source), target, atol=1e-6)
+
+
+def test_regularization_smooths():
+    source = control_points()
+    target = bend(source)
+    exact = ThinPlateSpline(source, target)
+    smooth = ThinPlateSpline(source, target, regularization=1.0)
+    exact_error = np.abs(exact(source) - target).max()
+    smooth_error = np.abs(smooth(source) - target).max()
+    assert exact_error < 1e-6 < smooth_error
+
+
+def test_reproduces_affine_transforms():
+    source = control_points()
+    matrix = np.array([[1.001, 0.002], [-0.003, 0.999]])
+    target = (source - ORIGIN) @ matrix.T + ORIGIN + [12.5, -7.0]
+    model = ThinPlateSpline(source, target)
+    points = ORIGIN + np.random.default_rng(2).uniform(-1000, 3000, size=(100, 2))
+    np.testing.assert_allclose(model(points), (points - ORIGIN) @ matrix.T + ORIGIN + [12.5, -7.0], atol=1e-6)
+
+
+def test_batches_and_extra_dimensions(monkeypatch):
+    source = control_points()
+    model = ThinPlateSpline(source, bend(source))
+    points = np.column_stack((ORIGIN + np.random.default_rng(3).uniform(0, 2000, size=(50, 2)), np.arange(50)))
+    expected = model(points)
+    monkeypatch.setattr(tps, "TRANSFORM_BATCH_SIZE", 7 * len(source))
+    np.testing.assert_allclose(model(points), expected)
+    np.testing.assert_array_equal(expected[:, 2], np.arange(50))
+
+
+def test_invalid_control_points():
+    with pytest.raises(ValueError):
+        ThinPlateSpline(control_points(2), control_points(2))
+    with pytest.raises(ValueError):
+        ThinPlateSpline(control_points(5), control_points(4))
+
+
+def test_fit_tps_folds_the_offset_and_caches(tmp_path):
+    source = control_points()
+    target = bend(source)
+    model = fit_tps(source, target, offset=(1.5, -2.0), cache_dir=str(tmp_path))
+    np.testing.assert_allclose(model(source), target + [1.5, -2.0], atol=1e-6)
+    assert fit_tps(source, target, offset=(1.5, -2.0)) is model
+
+    saved, = tmp_path.glob("tps_*.npz")
+    loaded = ThinPlateSpline.load(saved)
+    np.testing.assert_allclose(loaded(source), model(source))
+
+
+def test_warp_geometries_moves_every_vertex():
+    source = control_points()
+    model = ThinPlateSpline(source, source + [10.0, 20.0])
+    polygon = shapely.box(*ORIGIN, *(ORIGIN + 100))
+    warped, = warp_geometries([polygon], model)
+    np.testing.assert_allclose(shapely.bounds(warped), [*(ORIGIN + [10, 20]), *(ORIGIN + [110, 120])], atol=1e-6)
+
+
+def test_read_gcps_requires_columns(tmp_path):
+    path = tmp_path / "gcps.csv"
+    pd.DataFrame({"source_x": [0], "source_y": [0], "target_x": [0]}).to_csv(path, index=False)
+    with pytest.raises(ValueError, match="target_y"):
+        tps.read_gcps(path)
+
+
+# --- Displacement grid ------------------------------------------------------------
+
+def test_grid_nodes_cover_bounds():
+    origin, nodes = DisplacementGrid.nodes((0, 0, 25, 10), 10)
+    assert origin == (0, 0)
+    assert nodes.shape == (2, 4, 2)
+    np.testing.assert_array_equal(nodes[-1, -1], [30, 10])
+
+
+def test_grid_bilinear_interpolation():
+    # 2 x 2 nodes: (0, 0) -> 0, (10, 0) -> 4, (0, 10) -> 8, (10, 10) -> 20 along x
+    displacement = np.zeros((2, 2, 2))
+    displacement[..., 0] = [[0, 4], [8, 20]]
+    grid = DisplacementGrid((0, 0), 10, displacement)
+    points = np.array([[0, 0], [10, 10], [5, 0], [0, 5], [5, 5], [2.5, 7.5]], dtype=float)
+    result = grid(points)
+    # (2.5, 7.5): 0.25 * (0.75 * 0 + 0.25 * 4) + 0.75 * (0.75 * 8 + 0.25 * 20) = 8.5
+    np.testing.assert_allclose(result[:, 0] - points[:, 0], [0, 20, 2, 4, 8, 8.5])
+    np.testing.assert_array_equal(result[:, 1], points[:, 1])
+
+
+def test_grid_is_continuous_across_cells():
+    displacement = np.random.default_rng(4).normal(size=(3, 3, 2))
+    grid = DisplacementGrid((0, 0), 10, displacement)
+    edge = np.column_stack((np.full(5, 10.0), np.linspace(0, 20, 5)))
+    left, right = edge - [1e-9, 0], edge + [1e-9, 0]
+    np.testing.assert_allclose(grid(left) - left, grid(right) - right, atol=1e-7)
+    # On a node the displacement is the node value
+    np.testing.assert_allclose(grid(np.array([[10.0, 10.0]])) - [10, 10], displacement[1:2, 1])
+
+
+def test_grid_clamps_outside_points():
+    displacement = np.zeros((2, 2, 2))
+    displacement[..., 1] = [[1, 2], [3, 4]]
+    grid = DisplacementGrid((0, 0), 10, displacement)
+    result = grid(np.array([[-50.0, -50.0], [60.0, 60.0], [5.0, 100.0]]))
+    np.testing.assert_allclose(result[:, 1] - [-50, 60, 100], [1, 4, 3.5])
+
+
+def test_grid_reproduces_linear_displacements():
+    # Bilinear interpolation is exact for an affine model
+    source = control_points()
+    target = source * 1.0005 + [3.0, -4.0]
+    bounds = (*ORIGIN, *(ORIGIN + 2000))
+    for method in ("tps", "affine"):
+        grid = fit_grid(source, target, bounds, 250, method=method)
+        points = ORIGIN + np.random.default_rng(5).uniform(0, 2000, size=(100, 2))
+        np.testing.assert_allclose(grid(points), points * 1.0005 + [3.0, -4.0], atol=1e-3)
+
+
+def test_grid_follows_the_spline(tmp_path):
+    source = control_points()
+    target = bend(source)
+    bounds = (*ORIGIN, *(ORIGIN + 2000))
+    grid = fit_grid(source, target, bounds, 100, offset=(1.0, 1.0), cache_dir=str(tmp_path))
+    spline = fit_tps(source, target, offset=(1.0, 1.0))
+    points = ORIGIN + np.random.default_rng(6).uniform(0, 2000, size=(200, 2))
+    # The distortion varies over kilometers, so 100 m cells stay within a few centimeters
+    assert np.abs(grid(points) - spline(points)).max() < 0.05
+
+    saved, = tmp_path.glob("grid_*.npz")
+    np.testing.assert_allclose(DisplacementGrid.load(saved)(points), grid(points))
+
+
+def test_grid_rejects_bad_input():
+    with pytest.raises(ValueError):
+        DisplacementGrid((0, 0), 10, np.zeros((1, 3, 2)))
+    with pytest.raises(ValueError):
+        fit_grid(control_points(), control_points(), (0, 0, 1, 1), 1, method="cubic")
+
+
+def test_warp_file_reprojects_the_input(tmp_path):
+    source = control_points()
+    gcps = tmp_path / "gcps.csv"
+    pd.DataFrame({"source_x": source[:, 0], "source_y": source[:, 1],
+                  "target_x": source[:, 0] + 10.0, "target_y": source[:, 1] - 5.0}).to_csv(gcps, index=False)
+    square = gpd.GeoDataFrame({"name": ["a"]}, geometry=[shapely.box(*ORIGIN, *(ORIGIN + 100))], crs="EPSG:2154")
+    square.to_crs("EPSG:4326").to_file(tmp_path / "input.geojson")
+
+    warped = tps.warp_file(str(tmp_path / "input.geojson"), str(tmp_path / "output.gpkg"), str(gcps))
+    assert warped.crs.equals("EPSG:2154")
+    np.testing.assert_allclose(warped.total_bounds, [*(ORIGIN + [10, -5]), *(ORIGIN + [110, 95])], atol=1e-3)
+    np.testing.assert_allclose(gpd.read_file(tmp_path / "output.gpkg").total_bounds, warped.total_bounds)